@@ -0,0 +1,28 @@
+"""add kgs fallback sequence
+
+Revision ID: 5d2e8b4c9a61
+Revises: 3a7c9e1f5b20
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d2e8b4c9a61'
+down_revision: Union[str, Sequence[str], None] = '3a7c9e1f5b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(sa.schema.CreateSequence(sa.Sequence('kgs_short_code_seq')))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute(sa.schema.DropSequence(sa.Sequence('kgs_short_code_seq')))
@@ -0,0 +1,28 @@
+"""add links.is_custom for vanity aliases
+
+Revision ID: 7b1f4a9d2c38
+Revises: 5d2e8b4c9a61
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1f4a9d2c38'
+down_revision: Union[str, Sequence[str], None] = '5d2e8b4c9a61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('links', sa.Column('is_custom', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('links', 'is_custom')
@@ -0,0 +1,27 @@
+"""add (owner_id, created_at) index on links for quota windows
+
+Revision ID: 9c4e2a7f1d53
+Revises: 7b1f4a9d2c38
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e2a7f1d53'
+down_revision: Union[str, Sequence[str], None] = '7b1f4a9d2c38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_links_owner_id_created_at', 'links', ['owner_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_links_owner_id_created_at', table_name='links')
@@ -0,0 +1,49 @@
+"""add user_stats with per-user link and click totals
+
+Revision ID: a7e2c4b9d185
+Revises: f4c9a2e7b318
+Create Date: 2026-10-18 22:00:00.000000
+
+Links and clicks written by app instances still running the previous
+release are not counted; the reconciliation job in services/user_stats.py
+corrects them on its first pass.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7e2c4b9d185'
+down_revision: Union[str, Sequence[str], None] = 'f4c9a2e7b318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'user_stats',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('total_links', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('total_clicks', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+    op.execute(
+        """
+        INSERT INTO user_stats (user_id, total_links, total_clicks)
+        SELECT owner_id, COUNT(*), COALESCE(SUM(clicks), 0)
+        FROM links
+        WHERE owner_id IS NOT NULL
+        GROUP BY owner_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('user_stats')
@@ -0,0 +1,55 @@
+"""add links.url_hash for destination dedup, drop the long_url index
+
+Revision ID: b2d8f6e3a914
+Revises: 9c4e2a7f1d53
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from src.services.url_hash import url_hash
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d8f6e3a914'
+down_revision: Union[str, Sequence[str], None] = '9c4e2a7f1d53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 10000
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('links', sa.Column('url_hash', sa.BigInteger(), nullable=True))
+
+    # The hash uses the app's URL normalization, so it is computed in Python.
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.text("SELECT id, long_url FROM links WHERE id > :last_id ORDER BY id LIMIT :batch"),
+            {"last_id": last_id, "batch": BACKFILL_BATCH}
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            sa.text("UPDATE links SET url_hash = :url_hash WHERE id = :id"),
+            [{"id": row.id, "url_hash": url_hash(row.long_url)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    op.alter_column('links', 'url_hash', nullable=False)
+    op.create_index('ix_links_owner_id_url_hash', 'links', ['owner_id', 'url_hash'], unique=False)
+    # Created by the initial create_all, so it may be absent on newer databases.
+    op.execute('DROP INDEX IF EXISTS ix_links_long_url')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_links_long_url', 'links', ['long_url'], unique=False)
+    op.drop_index('ix_links_owner_id_url_hash', table_name='links')
+    op.drop_column('links', 'url_hash')
@@ -0,0 +1,28 @@
+"""add links.scan_claimed_until so scan workers lease links instead of locking them
+
+Revision ID: c3f7a1d9e526
+Revises: a7e2c4b9d185
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f7a1d9e526'
+down_revision: Union[str, Sequence[str], None] = 'a7e2c4b9d185'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('links', sa.Column('scan_claimed_until', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('links', 'scan_claimed_until')
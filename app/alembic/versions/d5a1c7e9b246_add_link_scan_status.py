@@ -0,0 +1,43 @@
+"""add links.scan_status / scanned_at for asynchronous malware scanning
+
+Revision ID: d5a1c7e9b246
+Revises: b2d8f6e3a914
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a1c7e9b246'
+down_revision: Union[str, Sequence[str], None] = 'b2d8f6e3a914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+scan_status = sa.Enum('PENDING', 'CLEAN', 'FLAGGED', name='scanstatus')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    scan_status.create(op.get_bind(), checkfirst=True)
+    # Existing links were checked inline when they were created.
+    op.add_column('links', sa.Column('scan_status', scan_status, server_default='CLEAN', nullable=False))
+    op.alter_column('links', 'scan_status', server_default='PENDING')
+    op.add_column('links', sa.Column('scanned_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(
+        'ix_links_pending_scan', 'links', ['id'], unique=False,
+        postgresql_where=sa.text("scan_status = 'PENDING'")
+    )
+    op.create_index('ix_links_scanned_at', 'links', ['scanned_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_links_scanned_at', table_name='links')
+    op.drop_index('ix_links_pending_scan', table_name='links')
+    op.drop_column('links', 'scanned_at')
+    op.drop_column('links', 'scan_status')
+    scan_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,34 @@
+"""add an index ordering generated short codes for KGS reseeding
+
+Revision ID: d9e4b6a2c817
+Revises: c3f7a1d9e526
+Create Date: 2026-10-19 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9e4b6a2c817'
+down_revision: Union[str, Sequence[str], None] = 'c3f7a1d9e526'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_links_generated_code_order',
+        'links',
+        [sa.text('length(short_code)'), sa.text('short_code COLLATE "C"')],
+        unique=False,
+        postgresql_where=sa.text('NOT is_custom'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_links_generated_code_order', table_name='links')
@@ -0,0 +1,51 @@
+"""add link_daily_clicks rollup of click_events
+
+Revision ID: e8b3d1f6a472
+Revises: d5a1c7e9b246
+Create Date: 2026-10-18 18:00:00.000000
+
+Clicks written by app instances still running the previous release are not
+counted in the rollup; run `python -m src.services.click_rollup` once the
+deploy has finished to reconcile the last days.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b3d1f6a472'
+down_revision: Union[str, Sequence[str], None] = 'd5a1c7e9b246'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'link_daily_clicks',
+        sa.Column('link_id', sa.BigInteger(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('clicks', sa.BigInteger(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['link_id'], ['links.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('link_id', 'day'),
+    )
+    op.create_index('ix_link_daily_clicks_day', 'link_daily_clicks', ['day'], unique=False)
+    op.create_index('ix_click_events_timestamp', 'click_events', ['timestamp'], unique=False, postgresql_using='brin')
+
+    op.execute(
+        """
+        INSERT INTO link_daily_clicks (link_id, day, clicks)
+        SELECT link_id, (timestamp AT TIME ZONE 'UTC')::date, COUNT(*)
+        FROM click_events
+        GROUP BY 1, 2
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_click_events_timestamp', table_name='click_events')
+    op.drop_index('ix_link_daily_clicks_day', table_name='link_daily_clicks')
+    op.drop_table('link_daily_clicks')
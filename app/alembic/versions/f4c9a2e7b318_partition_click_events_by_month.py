@@ -0,0 +1,115 @@
+"""partition click_events by month on timestamp
+
+Revision ID: f4c9a2e7b318
+Revises: e8b3d1f6a472
+Create Date: 2026-10-18 20:00:00.000000
+
+Rebuilds click_events as a range-partitioned table with one partition per
+month, from the oldest click to PARTITION_MONTHS_AHEAD months ahead, plus a
+default partition for anything outside them. Rows are copied over, so the
+upgrade takes a while on a large table and blocks click inserts until it
+commits; redirects keep working because clicks are buffered. Later months
+are created by services/partitions.py, which uses the same partition names.
+"""
+from datetime import date, datetime, timezone
+from typing import List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c9a2e7b318'
+down_revision: Union[str, Sequence[str], None] = 'e8b3d1f6a472'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITION_MONTHS_AHEAD = 3
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _months(first: date, last: date) -> List[date]:
+    months = []
+    month = first.replace(day=1)
+    while month <= last:
+        months.append(month)
+        month = _add_months(month, 1)
+    return months
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+
+    op.execute('ALTER TABLE click_events RENAME TO click_events_unpartitioned')
+    op.execute('ALTER TABLE click_events_unpartitioned RENAME CONSTRAINT click_events_pkey TO click_events_unpartitioned_pkey')
+    op.execute('ALTER INDEX IF EXISTS ix_click_events_link_id RENAME TO ix_click_events_unpartitioned_link_id')
+    op.execute('DROP INDEX IF EXISTS ix_click_events_timestamp')
+    op.execute('ALTER SEQUENCE click_events_id_seq OWNED BY NONE')
+
+    op.execute(
+        """
+        CREATE TABLE click_events (
+            id BIGINT NOT NULL DEFAULT nextval('click_events_id_seq'),
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            link_id BIGINT NOT NULL REFERENCES links (id) ON DELETE CASCADE,
+            CONSTRAINT click_events_pkey PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """
+    )
+    op.execute('ALTER SEQUENCE click_events_id_seq OWNED BY click_events.id')
+    op.create_index('ix_click_events_link_id', 'click_events', ['link_id'], unique=False)
+    op.create_index('ix_click_events_timestamp', 'click_events', ['timestamp'], unique=False, postgresql_using='brin')
+
+    oldest = bind.execute(sa.text("SELECT MIN(timestamp AT TIME ZONE 'UTC')::date FROM click_events_unpartitioned")).scalar()
+    this_month = datetime.now(timezone.utc).date().replace(day=1)
+    for month in _months(min(oldest or this_month, this_month), _add_months(this_month, PARTITION_MONTHS_AHEAD)):
+        op.execute(
+            f"CREATE TABLE click_events_p{month:%Y_%m} PARTITION OF click_events "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{_add_months(month, 1).isoformat()} 00:00:00+00')"
+        )
+    op.execute('CREATE TABLE click_events_default PARTITION OF click_events DEFAULT')
+
+    op.execute(
+        """
+        INSERT INTO click_events (id, timestamp, link_id)
+        SELECT id, timestamp, link_id FROM click_events_unpartitioned
+        """
+    )
+    op.execute('DROP TABLE click_events_unpartitioned')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('ALTER TABLE click_events RENAME TO click_events_partitioned')
+    op.execute('ALTER TABLE click_events_partitioned RENAME CONSTRAINT click_events_pkey TO click_events_partitioned_pkey')
+    op.execute('ALTER INDEX ix_click_events_link_id RENAME TO ix_click_events_partitioned_link_id')
+    op.execute('DROP INDEX ix_click_events_timestamp')
+    op.execute('ALTER SEQUENCE click_events_id_seq OWNED BY NONE')
+
+    op.execute(
+        """
+        CREATE TABLE click_events (
+            id BIGINT NOT NULL DEFAULT nextval('click_events_id_seq'),
+            link_id BIGINT NOT NULL REFERENCES links (id),
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            CONSTRAINT click_events_pkey PRIMARY KEY (id)
+        )
+        """
+    )
+    op.execute('ALTER SEQUENCE click_events_id_seq OWNED BY click_events.id')
+    op.create_index('ix_click_events_link_id', 'click_events', ['link_id'], unique=False)
+    op.create_index('ix_click_events_timestamp', 'click_events', ['timestamp'], unique=False, postgresql_using='brin')
+
+    op.execute(
+        """
+        INSERT INTO click_events (id, link_id, timestamp)
+        SELECT id, link_id, timestamp FROM click_events_partitioned
+        """
+    )
+    # Drops every partition with it; detached (archived) partitions are left alone.
+    op.execute('DROP TABLE click_events_partitioned')
@@ -16,6 +16,30 @@ class Settings(BaseSettings):
     google_client_secret: str
     google_client_id: str
 
+    # Web Risk client: pooling, verdict caching and circuit breaker
+    web_risk_api_url: str = "https://webrisk.googleapis.com/v1"
+    web_risk_timeout_seconds: float = 2.0
+    web_risk_connect_timeout_seconds: float = 1.0
+    web_risk_max_connections: int = 20
+    web_risk_clean_ttl_seconds: int = 3600
+    web_risk_threat_ttl_seconds: int = 86400
+    web_risk_cache_max_entries: int = 50000
+    web_risk_breaker_failures: int = 5
+    web_risk_breaker_reset_seconds: float = 30.0
+    # "lookup" asks uris:search for every URL; "local" screens against
+    # locally synced threat lists and only confirms prefix matches remotely
+    web_risk_mode: str = "lookup"
+    threat_db_dir: str = "/tmp/threat_db"
+    threat_db_min_refresh_seconds: int = 1800
+
+    # Background malware scanning of links
+    scan_batch_size: int = 100
+    scan_concurrency: int = 10
+    scan_poll_interval_seconds: float = 2.0
+    scan_rescan_after_days: int = 7
+    scan_rescan_batch_size: int = 500
+    scan_claim_timeout_seconds: float = 300.0
+
     # JWT Authentication
     secret_key: str
     algorithm: str = "HS256"
@@ -26,6 +50,12 @@ class Settings(BaseSettings):
     sms_ir_line_number: str
     sms_ir_template_id: int
     sms_ir_verify_template_id: int
+    sms_ir_api_url: str = "https://api.sms.ir/v1"
+    sms_timeout_seconds: float = 5.0
+    sms_max_concurrency: int = 5
+    sms_queue_consumers: int = 2
+    sms_max_attempts: int = 4
+    sms_retry_backoff_seconds: float = 2.0
 
     # Optional: provider toggle (parspack or sendgrid)
     email_provider: str = "parspack"
@@ -37,7 +67,92 @@ class Settings(BaseSettings):
     smtp_starttls: str
     smtp_from_name: str
     smtp_from: str
-    
+    smtp_timeout_seconds: float = 30.0
+    smtp_pool_size: int = 3
+    smtp_idle_timeout_seconds: float = 60.0
+
+    # Rate limiting (see rate_limiter.py)
+    rate_limit_local_tokens: int = 5
+    rate_limit_lease_seconds: float = 1.0
+    # Comma-separated IPs or CIDR ranges of the proxies (nginx) whose
+    # X-Real-IP is honoured, e.g. "172.16.0.0/12"; other peers are keyed by
+    # their own address
+    rate_limit_trusted_proxies: str = ""
+
+    # Outbound email queue (see services/email_service.py)
+    email_queue_consumers: int = 3
+    email_max_attempts: int = 6
+    email_retry_backoff_seconds: float = 10.0
+
+    # In-process redirect cache (per worker)
+    link_cache_max_entries: int = 10000
+    link_cache_max_bytes: int = 16 * 1024 * 1024
+    link_cache_ttl_seconds: int = 60
+
+    # Popularity-aware admission and TTLs for link:{code} keys in Redis
+    link_popularity_sketch_width: int = 65536
+    link_admission_threshold: int = 2
+    link_ttl_cold_seconds: int = 60
+    link_ttl_base_seconds: int = 900
+    link_ttl_max_seconds: int = 86400
+
+    # Redirect caching by browsers and the nginx microcache. Browsers cannot
+    # be purged, so they only get a short max-age; the microcache is refreshed
+    # on every edit, quarantine or delete and holds permanent redirects longer
+    redirect_permanent_max_age: int = 60
+    redirect_temporary_max_age: int = 30
+    redirect_microcache_seconds: int = 600
+    nginx_cache_refresh_url: str = ""  # e.g. http://nginx:8081
+
+    # Key generation service
+    kgs_block_size: int = 1000
+
+    # Bulk shortening
+    bulk_shorten_max_items: int = 1000
+
+    # Password hashing (bcrypt runs in a thread pool off the event loop)
+    bcrypt_rounds: int = 12
+    password_hash_concurrency: int = 2
+    password_hash_queue_timeout_seconds: float = 5.0
+
+    # Authenticated principal cache (per worker + Redis)
+    principal_cache_ttl_seconds: int = 60
+    principal_cache_max_entries: int = 10000
+
+    # Per-user link quota counters (Redis day buckets)
+    quota_window_days: int = 30
+    quota_reconcile_seconds: int = 3600
+
+    # Per-user dashboard totals (user_stats table and its Redis mirror)
+    user_stats_cache_ttl_seconds: int = 600
+    user_stats_reconcile_interval_seconds: int = 6 * 3600
+    user_stats_reconcile_batch_size: int = 1000
+
+    # Buffered click ingestion
+    click_flush_interval_seconds: float = 1.0
+    click_flush_batch_size: int = 1000
+    click_buffer_max_events: int = 100000
+    # Days rebuilt by `python -m src.services.click_rollup` when run without arguments
+    click_rollup_reconcile_days: int = 2
+
+    # Monthly click_events partitions (see services/partitions.py)
+    click_partition_months_ahead: int = 3
+    # Full months of raw clicks kept before the current one; 0 keeps everything
+    click_retention_months: int = 0
+    # "archive" dumps expired partitions to gzipped CSV before dropping them, "drop" just drops them
+    click_retention_action: str = "archive"
+    click_archive_dir: str = "/tmp/click_archive"
+    partition_maintenance_interval_seconds: int = 3600
+
+    # Bloom filter of existing short codes (per worker)
+    short_code_filter_error_rate: float = 0.001
+    short_code_filter_rebuild_seconds: int = 600
+
+    # Startup cache warm-up
+    cache_warm_top_n: int = 1000
+    cache_warm_budget_seconds: float = 5.0
+    cache_warm_lookback_days: int = 7
+
     @property
     def database_url_sync(self) -> str:
         return self.database_url.replace("+asyncpg", "")
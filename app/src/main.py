@@ -4,33 +4,38 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import redis.asyncio as redis
 from sqlalchemy.future import select
-from slowapi.errors import RateLimitExceeded
-from aiosmtplib import SMTP
-import ssl
 
 from .database import engine, Base, async_session_factory
 from .routers import auth, links, admin, payment, stats, plans, redirect
-from .rate_limiter import limiter
+from .rate_limiter import RateLimitExceeded, RateLimitHeadersMiddleware, rate_limit_exceeded_handler
 from .models import Plan
 from .config import settings
+from .services.aliases import alias_index
+from .services.bloom import short_code_filter
+from .services.cache_bus import cache_bus
+from .services.cache_warmer import warm_link_cache
+from .services.kgs import key_allocator, reseed_counter
+from .services.click_buffer import click_buffer
+from .services.email_service import email_queue, smtp_pool
+from .services.link_scanner import link_scanner
+from .services.partitions import partition_maintainer
+from .services.sms_service import sms_client, sms_queue
+from .services.user_stats import user_stats
+from .services.url_checker import threat_db, web_risk
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     app.state.redis = redis.from_url("redis://cache", encoding="utf-8", decode_responses=True)
+    await cache_bus.start(app.state.redis)
+    await click_buffer.start(app.state.redis)
+    await web_risk.start(app.state.redis)
+    await sms_client.start()
+    await sms_queue.start(app.state.redis)
+    await email_queue.start(app.state.redis)
+    if settings.web_risk_mode == "local":
+        await threat_db.start()
 
-    # SMTP
-    app.state.smtp = SMTP(
-        hostname=settings.smtp_host,
-        port=settings.smtp_port,
-        tls_context=ssl.create_default_context()
-    )
-
-
-    await app.state.smtp.connect()
-    if settings.smtp_user:
-        await app.state.smtp.login(settings.smtp_user, settings.smtp_pass)
-        
     async with engine.begin() as conn:
         # await conn.run_sync(Base.metadata.create_all)
         pass
@@ -48,21 +53,43 @@ async def lifespan(app: FastAPI):
 
         await session.commit()
 
+    try:
+        await reseed_counter(app.state.redis)
+    except Exception as e:
+        print(f"⚠️ Could not reseed the KGS counter: {e}")
+
+    await short_code_filter.start()
+    await link_scanner.start(app.state.redis)
+    await partition_maintainer.start()
+    await user_stats.start(app.state.redis)
+
+    warmed = await warm_link_cache(app.state.redis)
+    print(f"🔥 {warmed} hot links loaded into the cache.")
+
     print("✅ Tables created. Redis client connected. Rate limiter is active.")
     yield
 
-    try:
-        await app.state.smtp.quit()
-    except Exception:
-        pass
+    await user_stats.stop()
+    await partition_maintainer.stop()
+    await link_scanner.stop()
+    await short_code_filter.stop()
+    await sms_queue.stop()
+    await email_queue.stop()
+    await smtp_pool.close()
+    await sms_client.stop()
+    await threat_db.stop()
+    await web_risk.stop()
+    await click_buffer.stop()
+    print("🖱️ Buffered clicks flushed.")
+    await cache_bus.stop()
+    await key_allocator.release(app.state.redis)
     await app.state.redis.close()
     print("🔌 Redis connection closed.")
 
 
 app = FastAPI(lifespan=lifespan)
-app.state.limiter = limiter
-from slowapi import _rate_limit_exceeded_handler
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
+app.add_middleware(RateLimitHeadersMiddleware)
 origins = [
     settings.frontend_url,
 ]
@@ -81,9 +108,13 @@ app.include_router(admin.router, prefix="/api")
 app.include_router(payment.router, prefix="/api")
 app.include_router(stats.router, prefix="/api")
 app.include_router(plans.router, prefix="/api")
-app.include_router(redirect.router)
+# Redirects are served by a plain Starlette route (no dependency injection).
+app.router.routes.append(redirect.route)
 
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to the Link Shortener API"}
\ No newline at end of file
+    return {"message": "Welcome to the Link Shortener API"}
+
+
+alias_index.add_route_prefixes(app.routes)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, BigInteger, ForeignKey, Date, Enum as SQLAlchemyEnum, DateTime, func, \
-    Boolean
+    Boolean, Sequence, Index, text
 
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -51,22 +51,57 @@ class User(Base):
     phone_number = Column(String, nullable=True)
 
 
+class ScanStatus(str, enum.Enum):
+    PENDING = "pending"
+    CLEAN = "clean"
+    FLAGGED = "flagged"
+
+
+# Fallback id source for short codes while Redis is unavailable (see services/kgs.py)
+kgs_short_code_seq = Sequence("kgs_short_code_seq", metadata=Base.metadata)
+
+
 class Link(Base):
     __tablename__ = "links"
 
     id = Column(BigInteger, primary_key=True, index=True)
-    long_url = Column(String, index=True, nullable=False)
+    long_url = Column(String, nullable=False)
+    url_hash = Column(BigInteger, nullable=False)  # see services/url_hash.py
     short_code = Column(String, unique=True, index=True, nullable=False)
     clicks = Column(Integer, default=0)
+    redirect_type = Column(Integer, nullable=False, default=307, server_default="307")
+    is_custom = Column(Boolean, nullable=False, default=False, server_default="false")
+    scan_status = Column(SQLAlchemyEnum(ScanStatus), nullable=False, default=ScanStatus.PENDING, server_default="PENDING")
+    scanned_at = Column(DateTime(timezone=True), nullable=True)
+    scan_claimed_until = Column(DateTime(timezone=True), nullable=True)  # lease of the scan worker checking it
 
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="links")
 
-    click_events = relationship("ClickEvent", back_populates="link", cascade="all, delete-orphan")
+    click_events = relationship("ClickEvent", back_populates="link", cascade="all, delete-orphan", passive_deletes=True)
+    # Deleted by the database (ON DELETE CASCADE) without loading them first
+    daily_clicks = relationship("LinkDailyClicks", cascade="all, delete-orphan", passive_deletes=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        # Per-user windows over creation time (quota reconciliation)
+        Index("ix_links_owner_id_created_at", "owner_id", "created_at"),
+        # Finding a user's existing link to the same destination
+        Index("ix_links_owner_id_url_hash", "owner_id", "url_hash"),
+        # Scan worker queues: pending links by id, scanned links by age
+        Index("ix_links_pending_scan", "id", postgresql_where=text("scan_status = 'PENDING'")),
+        Index("ix_links_scanned_at", "scanned_at"),
+        # Highest generated code for reseeding the KGS counter (services/kgs.py): a backward scan, not a sort
+        Index(
+            "ix_links_generated_code_order",
+            func.length(short_code),
+            short_code.collate("C"),
+            postgresql_where=text("NOT is_custom"),
+        ),
+    )
+
 
 class TransactionStatus(str, enum.Enum):
     PENDING = "pending"
@@ -90,10 +125,48 @@ class Transaction(Base):
 
 
 class ClickEvent(Base):
+    """Raw clicks, range partitioned by month on timestamp (see services/partitions.py)."""
     __tablename__ = "click_events"
 
-    id = Column(BigInteger, primary_key=True)
-    link_id = Column(BigInteger, ForeignKey("links.id"), nullable=False, index=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    # Part of the key because a partitioned table's unique keys must include the partition column
+    timestamp = Column(DateTime(timezone=True), primary_key=True, server_default=func.now(), nullable=False)
+    link_id = Column(BigInteger, ForeignKey("links.id", ondelete="CASCADE"), nullable=False, index=True)
 
     link = relationship("Link", back_populates="click_events")
+
+    __table_args__ = (
+        # Day ranges for the rollup rebuild; events arrive in time order, so BRIN stays tiny
+        Index("ix_click_events_timestamp", "timestamp", postgresql_using="brin"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+
+
+class LinkDailyClicks(Base):
+    """
+    Clicks per link per UTC day, kept up to date by the click buffer flush
+    and rebuilt from click_events by services/click_rollup.py.
+    """
+    __tablename__ = "link_daily_clicks"
+
+    link_id = Column(BigInteger, ForeignKey("links.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    clicks = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # Top links over recent days (cache warm-up)
+        Index("ix_link_daily_clicks_day", "day"),
+    )
+
+
+class UserStats(Base):
+    """
+    Per-user totals for the dashboard, updated in the same transaction as
+    the links and clicks they count and reconciled by services/user_stats.py.
+    """
+    __tablename__ = "user_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_links = Column(BigInteger, nullable=False, default=0, server_default="0")
+    total_clicks = Column(BigInteger, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
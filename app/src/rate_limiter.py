@@ -1,4 +1,265 @@
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import functools
+import ipaddress
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
 
-limiter = Limiter(key_func=get_remote_address)
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+from redis.exceptions import RedisError
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Generic cell rate algorithm over one key holding the "theoretical arrival
+# time" (TAT) in ms. Each request is spaced `interval` ms apart and bursts of
+# up to `limit` are tolerated. Grants up to ARGV[3] tokens at once (at least
+# one), so a worker can take a few tokens for a hot key in one round trip.
+# Uses the Redis clock, so workers with skewed clocks agree.
+#   KEYS[1]  the limit key
+#   ARGV[1]  limit (requests per period)
+#   ARGV[2]  period in ms
+#   ARGV[3]  tokens wanted
+# Returns {granted, remaining, retry_after_ms, reset_ms}.
+GCRA_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local interval = period / limit
+
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tat < now then
+    tat = now
+end
+
+local available = math.floor((now + period - tat) / interval)
+if available < 1 then
+    local retry_after = tat - period + interval - now
+    return {0, 0, math.ceil(retry_after), math.ceil(tat - now)}
+end
+
+local granted = math.min(wanted, available)
+local new_tat = tat + granted * interval
+redis.call('SET', KEYS[1], string.format('%.3f', new_tat), 'PX', math.ceil(new_tat - now))
+return {granted, available - granted, 0, math.ceil(new_tat - now)}
+"""
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_limit(spec: str) -> Tuple[int, int]:
+    """Parses "30/minute" (or "30/2 minutes", "30 per minute") into (limit, period seconds)."""
+    count, _, per = spec.replace(" per ", "/").partition("/")
+    per = per.strip().rstrip("s")
+    multiplier, _, unit = per.rpartition(" ")
+    period = PERIODS[unit] * (int(multiplier) if multiplier else 1)
+    return int(count), period
+
+
+@dataclass
+class RateLimitState:
+    limit: int
+    period: int
+    remaining: int
+    reset_after: float
+    retry_after: float = 0.0
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(max(self.remaining, 0)),
+            "RateLimit-Reset": str(math.ceil(self.reset_after)),
+            "RateLimit-Policy": f"{self.limit};w={self.period}",
+        }
+        if self.retry_after:
+            headers["Retry-After"] = str(math.ceil(self.retry_after))
+        return headers
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, state: RateLimitState):
+        self.state = state
+
+
+@dataclass
+class _Lease:
+    """Tokens granted to this worker ahead of use, valid until `expires_at`."""
+    tokens: int
+    remaining: int
+    reset_at: float
+    expires_at: float
+
+
+def parse_networks(spec: str) -> List[ipaddress._BaseNetwork]:
+    """Parses "10.0.0.5, 172.16.0.0/12" into networks; a bare address is a single-host network."""
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+
+trusted_proxies = parse_networks(settings.rate_limit_trusted_proxies)
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+
+def client_ip(request: Request) -> str:
+    """
+    The peer address, or the X-Real-IP set by nginx when the peer is one of
+    the trusted proxies. Anyone else could pick their own bucket with it.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if _is_trusted_proxy(peer):
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip.strip()
+    return peer
+
+
+def rate_limit_key(request: Request) -> str:
+    """The token subject for requests with a valid bearer token, otherwise the client IP."""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            subject = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm]).get("sub")
+        except JWTError:
+            subject = None
+        if subject:
+            return f"user:{subject}"
+    return f"ip:{client_ip(request)}"
+
+
+class Limiter:
+    """
+    Rate limits shared by all workers, enforced by one GCRA script call in Redis.
+
+    Use as `@limiter.limit("30/minute")` on an endpoint that takes a
+    `request: Request` argument. Requests are counted per endpoint and per
+    key_func(request): the user for authenticated calls, the IP otherwise.
+
+    A key used again within `lease_seconds` on the same worker is "hot": the
+    next Redis call takes up to `local_tokens` tokens (never more than a
+    tenth of the limit), and the following requests spend them locally.
+    Unused leased tokens lapse with the lease, so pre-allocation can only
+    make the limit slightly stricter, never looser. Limits under 10 per
+    period are always checked in Redis.
+
+    The outcome is left on request.state for RateLimitHeadersMiddleware.
+    If Redis is unavailable requests are let through.
+    """
+
+    def __init__(self, key_func: Callable[[Request], str], local_tokens: int, lease_seconds: float):
+        self.key_func = key_func
+        self.local_tokens = local_tokens
+        self.lease_seconds = lease_seconds
+        self._leases: Dict[str, _Lease] = {}
+        self._last_seen: Dict[str, float] = {}
+
+    def _prune(self, now: float) -> None:
+        if len(self._last_seen) > 10000:
+            cutoff = now - self.lease_seconds
+            self._last_seen = {key: seen for key, seen in self._last_seen.items() if seen > cutoff}
+            self._leases = {key: lease for key, lease in self._leases.items() if lease.expires_at > now}
+
+    async def hit(self, request: Request, scope: str, limit: int, period: int) -> RateLimitState:
+        key = f"ratelimit:{scope}:{self.key_func(request)}"
+        now = time.monotonic()
+
+        lease = self._leases.get(key)
+        if lease is not None and lease.tokens > 0 and lease.expires_at > now:
+            lease.tokens -= 1
+            return RateLimitState(limit, period, lease.remaining + lease.tokens, lease.reset_at - now)
+
+        hot = now - self._last_seen.get(key, float("-inf")) < self.lease_seconds
+        self._last_seen[key] = now
+        self._prune(now)
+        wanted = max(1, min(self.local_tokens, limit // 10)) if hot else 1
+
+        try:
+            granted, remaining, retry_after_ms, reset_ms = await request.app.state.redis.eval(
+                GCRA_SCRIPT, 1, key, limit, period * 1000, wanted
+            )
+        except RedisError as e:
+            logger.warning("Rate limiter unavailable, letting request through: %s", e)
+            return RateLimitState(limit, period, limit, period)
+
+        state = RateLimitState(limit, period, remaining, reset_ms / 1000)
+        if not granted:
+            state.retry_after = retry_after_ms / 1000
+            raise RateLimitExceeded(state)
+
+        if granted > 1:
+            self._leases[key] = _Lease(granted - 1, remaining, now + state.reset_after, now + self.lease_seconds)
+            state.remaining += granted - 1
+        else:
+            self._leases.pop(key, None)
+        return state
+
+    def limit(self, spec: str):
+        limit, period = parse_limit(spec)
+
+        def decorator(func):
+            scope = f"{func.__module__}.{func.__name__}"
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.get("request")
+                if not isinstance(request, Request):
+                    raise TypeError(f"{scope} must take a `request: Request` argument to be rate limited")
+                request.state.rate_limit = await self.hit(request, scope, limit, period)
+                return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
+    return JSONResponse(
+        {"detail": f"Rate limit exceeded: {exc.state.limit} per {exc.state.period} seconds"},
+        status_code=429,
+        headers=exc.state.headers(),
+    )
+
+
+class RateLimitHeadersMiddleware:
+    """Adds RateLimit-* headers to responses of rate-limited endpoints."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                state: Optional[RateLimitState] = scope.get("state", {}).get("rate_limit")
+                if state is not None:
+                    headers = list(message.get("headers", []))
+                    existing = {name.lower() for name, _ in headers}
+                    for name, value in state.headers().items():
+                        if name.lower().encode() not in existing:
+                            headers.append((name.lower().encode(), value.encode()))
+                    message["headers"] = headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+limiter = Limiter(
+    key_func=rate_limit_key,
+    local_tokens=settings.rate_limit_local_tokens,
+    lease_seconds=settings.rate_limit_lease_seconds,
+)
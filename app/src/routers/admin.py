@@ -1,16 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import delete, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from datetime import date, timedelta, datetime, timezone
 from typing import List
 from pydantic import BaseModel
 from sqlalchemy.orm import selectinload
+import redis.asyncio as redis
 
 from .. import models, schemas
 from ..database import get_db
 from ..schemas import DailyStat, SystemStats
 from ..services import security
+from ..services.bloom import short_code_filter
+from ..services.link_cache import invalidate_link, local_link_cache, redis_admission_stats
+from ..services.link_scanner import link_scanner
+from ..services.principal import invalidate_principal
+from ..services.quota import link_quota
+from ..services.email_service import email_queue
+from ..services.sms_service import sms_queue
+from ..services.user_stats import user_stats
+from ..services.url_checker import threat_db, web_risk
 
 router = APIRouter(
     prefix="/admin",
@@ -19,6 +29,10 @@ router = APIRouter(
 )
 
 
+async def get_redis_client(request: Request) -> redis.Redis:
+    return request.app.state.redis
+
+
 class AssignPlanRequest(schemas.BaseModel):
     plan_name: str
 
@@ -58,7 +72,7 @@ async def create_user_by_admin(user_create: schemas.UserCreate, db: AsyncSession
     """
     یک کاربر جدید توسط ادمین ایجاد می‌کند.
     """
-    hashed_password = security.get_password_hash(user_create.password)
+    hashed_password = await security.get_password_hash(user_create.password)
     new_user = models.User(email=user_create.email, hashed_password=hashed_password)
 
     free_plan_result = await db.execute(select(models.Plan).where(models.Plan.name == "Free"))
@@ -74,7 +88,12 @@ async def create_user_by_admin(user_create: schemas.UserCreate, db: AsyncSession
 
 
 @router.post("/users/{user_id}/assign-plan", response_model=schemas.UserResponse)
-async def assign_plan_to_user(user_id: int, request: AssignPlanRequest, db: AsyncSession = Depends(get_db)):
+async def assign_plan_to_user(
+        user_id: int,
+        request: AssignPlanRequest,
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis_client)
+):
     """
     یک پلن را به کاربر اختصاص داده و اشتراک او را فعال می‌کند.
     """
@@ -100,13 +119,19 @@ async def assign_plan_to_user(user_id: int, request: AssignPlanRequest, db: Asyn
 
     await db.commit()
     await db.refresh(user)
+    await invalidate_principal(redis_client, user.email)
 
     return user
 
 
 
 @router.patch("/users/{user_id}/role", response_model=schemas.UserResponse)
-async def update_user_role(user_id: int, request: UpdateUserRoleRequest, db: AsyncSession = Depends(get_db)):
+async def update_user_role(
+        user_id: int,
+        request: UpdateUserRoleRequest,
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis_client)
+):
     """نقش یک کاربر را (به user یا admin) تغییر می‌دهد."""
     user_result = await db.execute(select(models.User).where(models.User.id == user_id))
     user = user_result.scalar_one_or_none()
@@ -116,36 +141,90 @@ async def update_user_role(user_id: int, request: UpdateUserRoleRequest, db: Asy
     user.role = request.role
     await db.commit()
     await db.refresh(user)
+    await invalidate_principal(redis_client, user.email)
     return user
 
 
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_user_by_admin(user_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_user_by_admin(
+        user_id: int,
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis_client)
+):
     """یک کاربر را به طور کامل از سیستم حذف می‌کند."""
     user = await db.get(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
+    # Links go with the user through the cascade; their cached redirects must go too.
+    short_codes = (await db.execute(
+        select(models.Link.short_code).where(models.Link.owner_id == user_id)
+    )).scalars().all()
     await db.delete(user)
     await db.commit()
+    await invalidate_principal(redis_client, user.email)
+    await user_stats.forget(redis_client, user_id)
+    for short_code in short_codes:
+        await invalidate_link(redis_client, short_code)
     return None
 
 @router.delete("/links/{short_code}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_link_by_admin(
         short_code: str,
         db: AsyncSession = Depends(get_db),
-        current_admin: models.User = Depends(security.get_current_admin_user)
+        redis_client: redis.Redis = Depends(get_redis_client),
+        current_admin: security.Principal = Depends(security.get_current_admin_user)
 ):
-    result = await db.execute(select(models.Link).where(models.Link.short_code == short_code))
-    link = result.scalar_one_or_none()
+    # Clicks are read from the deleted row itself, so concurrent flushes are counted.
+    result = await db.execute(
+        delete(models.Link)
+        .where(models.Link.short_code == short_code)
+        .returning(models.Link.owner_id, models.Link.clicks, models.Link.created_at)
+    )
+    link = result.one_or_none()
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
 
-    await db.delete(link)
+    await user_stats.add(db, link.owner_id, links=-1, clicks=-(link.clicks or 0))
     await db.commit()
+
+    await user_stats.mirror_add(redis_client, {link.owner_id: (-1, -(link.clicks or 0))})
+    await invalidate_link(redis_client, short_code)
+    await link_quota.forget_link(redis_client, link.owner_id, link.created_at)
     return None
 
 
+@router.get("/cache-stats")
+async def get_cache_stats():
+    """آمار کش درون‌پردازه‌ای و فیلتر Bloom همین worker را برای تنظیم اندازه آن‌ها برمی‌گرداند."""
+    return {
+        "link_cache": local_link_cache.stats(),
+        "redis_link_admission": redis_admission_stats,
+        "short_code_filter": short_code_filter.stats(),
+        "web_risk": web_risk.stats(),
+        "threat_db": threat_db.stats(),
+        "link_scanner": link_scanner.stats(),
+    }
+
+
+
+@router.get("/sms-deliveries")
+async def get_sms_deliveries(limit: int = 100, redis_client: redis.Redis = Depends(get_redis_client)):
+    """وضعیت صف پیامک و نتیجه آخرین ارسال‌ها را برمی‌گرداند."""
+    return {
+        "queue": await sms_queue.stats(redis_client),
+        "recent": await sms_queue.outcomes(redis_client, limit),
+    }
+
+
+@router.get("/email-deliveries")
+async def get_email_deliveries(limit: int = 100, redis_client: redis.Redis = Depends(get_redis_client)):
+    """وضعیت صف ایمیل و نتیجه آخرین ارسال‌ها را برمی‌گرداند."""
+    return {
+        "queue": await email_queue.stats(redis_client),
+        "recent": await email_queue.outcomes(redis_client, limit),
+    }
+
 
 @router.get("/stats", response_model=SystemStats)
 async def get_system_stats(db: AsyncSession = Depends(get_db)):
@@ -170,7 +249,11 @@ async def get_system_stats(db: AsyncSession = Depends(get_db)):
 
 
 @router.patch("/users/{user_id}/toggle-active", response_model=schemas.UserResponse)
-async def toggle_user_active_status(user_id: int, db: AsyncSession = Depends(get_db)):
+async def toggle_user_active_status(
+        user_id: int,
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis_client)
+):
     """وضعیت فعال/غیرفعال یک کاربر را تغییر می‌دهد."""
     user = await db.get(models.User, user_id)
     if not user:
@@ -179,4 +262,5 @@ async def toggle_user_active_status(user_id: int, db: AsyncSession = Depends(get
     user.is_active = not user.is_active
     await db.commit()
     await db.refresh(user)
+    await invalidate_principal(redis_client, user.email)
     return user
\ No newline at end of file
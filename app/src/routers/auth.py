@@ -17,15 +17,17 @@ from datetime import date, timedelta
 import random
 import phonenumbers
 import logging
+import redis.asyncio as redis
 
 from ..schemas import RegisterOtpRequest
-from ..services.sms_service import send_otp
+from ..services.sms_service import OTP_TTL_SECONDS, send_otp
 from .. import schemas, models
 from ..config import settings
 from ..database import get_db
 from ..services import security
 from ..rate_limiter import limiter
 from ..services import email_service
+from ..services.principal import invalidate_principal
 from ..schemas import ResetPasswordRequest, ChangePasswordRequest, EmailSchema
 
 
@@ -39,18 +41,24 @@ router = APIRouter(
 )
 
 
+async def get_redis_client(request: Request) -> redis.Redis:
+    return request.app.state.redis
+
+
 async def send_verification_email(
     request: Request,
     user: models.User,
     db: AsyncSession
 ):
+    expires_delta = timedelta(hours=24)
     verification_token = security.create_access_token(
         data={"sub": user.email, "type": "email_verification"},
-        expires_delta=timedelta(hours=24)
+        expires_delta=expires_delta
     )
 
     await email_service.send_account_verification_email(
-        request, user.email, verification_token
+        request.app.state.redis, user.email, verification_token,
+        ttl=expires_delta.total_seconds()
     )
 
 
@@ -82,7 +90,7 @@ async def register_user(
         )
 
     # 3. Create the new user object with all required subscription details
-    hashed_password = security.get_password_hash(user_create.password)
+    hashed_password = await security.get_password_hash(user_create.password)
     new_user = models.User(
         email=user_create.email,
         hashed_password=hashed_password,
@@ -114,12 +122,24 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     result = await db.execute(select(models.User).where(models.User.email == form_data.username))
     user = result.scalar_one_or_none()
 
-    if not user or not security.verify_password(form_data.password, user.hashed_password):
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    verified, new_hash = await security.verify_and_update_password(form_data.password, user.hashed_password)
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if new_hash:
+        # The bcrypt cost changed since this hash was made.
+        user.hashed_password = new_hash
+        await db.commit()
     if not user.is_verified:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -137,7 +157,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 
 @router.get("/users/me", response_model=schemas.UserResponse)
-async def read_users_me(current_user: models.User = Depends(security.get_current_user)):
+async def read_users_me(current_user: security.Principal = Depends(security.get_current_user)):
     """
     اطلاعات کاربر لاگین کرده فعلی را برمی‌گرداند.
     """
@@ -156,13 +176,15 @@ async def forgot_password(
     user = user_result.scalar_one_or_none()
 
     if user:
+        expires_delta = timedelta(minutes=15)
         reset_token = security.create_access_token(
             data={"sub": user.email, "type": "password_reset"},
-            expires_delta=timedelta(minutes=15)
+            expires_delta=expires_delta
         )
 
         await email_service.send_password_reset_email(
-            request, user.email, reset_token
+            request.app.state.redis, user.email, reset_token,
+            ttl=expires_delta.total_seconds()
         )
 
     return {
@@ -176,7 +198,11 @@ class ResetPasswordRequest(schemas.BaseModel):
 
 
 @router.post("/reset-password", status_code=status.HTTP_200_OK)
-async def reset_password(request: ResetPasswordRequest, db: AsyncSession = Depends(get_db)):
+async def reset_password(
+    request: ResetPasswordRequest,
+    db: AsyncSession = Depends(get_db),
+    redis_client: redis.Redis = Depends(get_redis_client)
+):
     try:
         payload = jwt.decode(request.token, settings.secret_key, algorithms=[settings.algorithm])
 
@@ -193,8 +219,9 @@ async def reset_password(request: ResetPasswordRequest, db: AsyncSession = Depen
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
 
-        user.hashed_password = security.get_password_hash(request.new_password)
+        user.hashed_password = await security.get_password_hash(request.new_password)
         await db.commit()
+        await invalidate_principal(redis_client, user.email)
 
         return {"message": "Password has been reset successfully."}
 
@@ -205,8 +232,9 @@ async def reset_password(request: ResetPasswordRequest, db: AsyncSession = Depen
 @router.patch("/users/me", response_model=schemas.UserResponse)
 async def update_user_me(
     user_update: schemas.UserUpdate,
-    current_user: models.User = Depends(security.get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: models.User = Depends(security.get_current_db_user),
+    db: AsyncSession = Depends(get_db),
+    redis_client: redis.Redis = Depends(get_redis_client)
 ):
     """اطلاعات پروفایل کاربر فعلی را بروزرسانی می‌کند."""
     for key, value in user_update.model_dump(exclude_unset=True).items():
@@ -214,6 +242,7 @@ async def update_user_me(
 
     await db.commit()
     await db.refresh(current_user)
+    await invalidate_principal(redis_client, current_user.email)
     return current_user
 
 
@@ -225,20 +254,22 @@ class ChangePasswordRequest(schemas.BaseModel):
 @router.post("/users/me/change-password")
 async def change_current_user_password(
         request_body: ChangePasswordRequest,
-        current_user: models.User = Depends(security.get_current_user),
-        db: AsyncSession = Depends(get_db)
+        current_user: models.User = Depends(security.get_current_db_user),
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis_client)
 ):
     """Allows a logged-in user to change their own password."""
     # Verify the current password is correct
-    if not security.verify_password(request_body.current_password, current_user.hashed_password):
+    if not await security.verify_password(request_body.current_password, current_user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect current password"
         )
 
     # Hash and save the new password
-    current_user.hashed_password = security.get_password_hash(request_body.new_password)
+    current_user.hashed_password = await security.get_password_hash(request_body.new_password)
     await db.commit()
+    await invalidate_principal(redis_client, current_user.email)
 
     return {"message": "Password changed successfully"}
 
@@ -328,7 +359,7 @@ async def google_callback(code: str, db: AsyncSession = Depends(get_db)):
 
         new_user = models.User(
             email=email,
-            hashed_password=security.get_password_hash("a_default_strong_password"),  # یک رمز پیش‌فرض امن
+            hashed_password=await security.get_password_hash("a_default_strong_password"),  # یک رمز پیش‌فرض امن
             is_verified=True,
             plan_id=free_plan.id,
             subscription_start_date=date.today(),
@@ -361,8 +392,8 @@ async def send_otp_code(phone: PhoneRequest, request: Request):
         raise HTTPException(status_code=400, detail="شماره موبایل نامعتبر")
 
     code = str(random.randint(100000, 999999))
-    await request.app.state.redis.setex(f"otp:{phone}", 120, code)
-    send_otp(phone, code)
+    await request.app.state.redis.setex(f"otp:{phone}", OTP_TTL_SECONDS, code)
+    await send_otp(request.app.state.redis, phone, code)
     return {"message": "کد تایید ارسال شد."}
 
 
@@ -438,7 +469,7 @@ async def register_with_otp(
     new_user = models.User(
         email=f"user_{phone}@somedom.ir",  # چون ایمیل اجباری است، یک ایمیل ساختگی می‌گذاریم
         # hashed_password=security.get_password_hash("default_password"),
-        hashed_password=security.get_password_hash(random_password),
+        hashed_password=await security.get_password_hash(random_password),
         phone_number=phone,
         first_name=payload.first_name,
         last_name=payload.last_name,
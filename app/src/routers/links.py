@@ -1,26 +1,31 @@
 import io
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.responses import StreamingResponse
 
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timezone, timedelta, date
-from sqlalchemy import func
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 import redis.asyncio as redis
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import qrcode
-from sqlalchemy import text
-from sqlalchemy import text
 from datetime import date, timedelta
 
 from .. import models, schemas
 from ..config import settings
 from ..database import get_db
 from ..services import security
-from ..services.kgs import generate_unique_short_key
-from ..services import url_checker
+from ..services.aliases import ALIAS_ERRORS, alias_rejection_reason, alias_unavailable_reason
+from ..services.bloom import announce_short_code, announce_short_codes
+from ..services.kgs import generate_unique_short_key, generate_unique_short_keys
+from ..services.link_cache import invalidate_link
+from ..services.quota import link_quota
+from ..services.user_stats import user_stats
+from ..services.url_hash import normalize_url, url_hash
 from ..rate_limiter import limiter
 
 
@@ -32,6 +37,12 @@ router = APIRouter(
     tags=["Links Management"]
 )
 
+# Keeps each multi-row INSERT well under asyncpg's bind parameter limit.
+BULK_INSERT_CHUNK = 1000
+
+url_create_adapter = TypeAdapter(schemas.URLCreate)
+
+
 async def get_redis_client(request: Request) -> redis.Redis:
     """
         کلاینت Redis را که در هنگام startup ایجاد شده، در دسترس قرار می‌دهد.
@@ -39,6 +50,41 @@ async def get_redis_client(request: Request) -> redis.Redis:
     return request.app.state.redis
 
 
+def ensure_active_subscription(current_user: security.Principal):
+    if not current_user.plan:
+        raise HTTPException(status_code=403, detail="No active plan found for user.")
+
+    if current_user.subscription_end_date is None or current_user.subscription_end_date < date.today():
+        raise HTTPException(status_code=403, detail="Your subscription has expired.")
+
+
+async def find_existing_links(
+        db: AsyncSession,
+        user_id: int,
+        destinations: List[Tuple[str, int]]
+) -> Dict[Tuple[str, int], str]:
+    """
+    Finds the user's existing short codes for (long_url, redirect_type) pairs
+    with one lookup on the (owner_id, url_hash) index. The result is keyed by
+    (normalized URL, redirect_type); hash matches are confirmed against the
+    stored URL.
+    """
+    wanted = {(normalize_url(long_url), redirect_type) for long_url, redirect_type in destinations}
+    result = await db.execute(
+        select(models.Link.short_code, models.Link.long_url, models.Link.redirect_type)
+        .where(models.Link.owner_id == user_id)
+        .where(models.Link.url_hash.in_({url_hash(long_url) for long_url, _ in destinations}))
+        .order_by(models.Link.id)
+    )
+
+    found = {}
+    for row in result.all():
+        key = (normalize_url(row.long_url), row.redirect_type)
+        if key in wanted:
+            found.setdefault(key, row.short_code)
+    return found
+
+
 @router.post("/shorten", response_model=schemas.URLResponse)
 @limiter.limit("30/minute")
 async def create_short_url(
@@ -46,37 +92,76 @@ async def create_short_url(
         url_data: schemas.URLCreate,
         db: AsyncSession = Depends(get_db),
         redis_client: redis.Redis = Depends(get_redis_client),
-        current_user: models.User = Depends(security.get_current_user)
+        current_user: security.Principal = Depends(security.get_current_user)
 ):
-    if not current_user.plan:
-        raise HTTPException(status_code=403, detail="No active plan found for user.")
-
-    if current_user.subscription_end_date is None or current_user.subscription_end_date < date.today():
-        raise HTTPException(status_code=403, detail="Your subscription has expired.")
-
-    thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    link_count_result = await db.execute(
-        select(func.count(models.Link.id))
-        .where(models.Link.owner_id == current_user.id)
-        .where(models.Link.created_at >= thirty_days_ago)  # <--- فیلتر دقیق بر اساس تاریخ ساخت
-    )
-    links_in_last_30_days = link_count_result.scalar_one()
+    ensure_active_subscription(current_user)
+
+    if url_data.reuse_existing and not url_data.alias:
+        long_url = str(url_data.long_url)
+        existing = await find_existing_links(db, current_user.id, [(long_url, url_data.redirect_type)])
+        short_code = existing.get((normalize_url(long_url), url_data.redirect_type))
+        if short_code:
+            return schemas.URLResponse(
+                long_url=long_url,
+                short_url=f"{settings.origin_backend_url}/{short_code}",
+                reused=True
+            )
 
-    if links_in_last_30_days >= current_user.plan.link_limit_per_month:
+    if not await link_quota.reserve(redis_client, current_user.id, current_user.plan.link_limit_per_month):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"You have reached your monthly limit of {current_user.plan.link_limit_per_month} links."
         )
 
-    if await url_checker.is_url_malicious(str(url_data.long_url)):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="The provided URL is flagged as malicious and cannot be shortened."
-        )
+    try:
+        return await _create_link(url_data, db, redis_client, current_user)
+    except Exception:
+        # Nothing was created, so the reserved quota goes back.
+        await link_quota.release(redis_client, current_user.id)
+        raise
+
+
+async def _create_link(
+        url_data: schemas.URLCreate,
+        db: AsyncSession,
+        redis_client: redis.Redis,
+        current_user: security.Principal
+) -> schemas.URLResponse:
+    # Malware scanning happens in the background (services/link_scanner.py).
+    if url_data.alias:
+        reason = await alias_unavailable_reason(db, url_data.alias)
+        if reason is not None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT if reason == "taken" else status.HTTP_400_BAD_REQUEST,
+                detail=ALIAS_ERRORS[reason]
+            )
 
-    short_code = await generate_unique_short_key(redis_client)
+        # The unique index settles races: a conflicting insert just returns no row.
+        result = await db.execute(
+            pg_insert(models.Link)
+            .values(
+                long_url=str(url_data.long_url),
+                url_hash=url_hash(str(url_data.long_url)),
+                short_code=url_data.alias,
+                redirect_type=url_data.redirect_type,
+                owner_id=current_user.id,
+                is_custom=True
+            )
+            .on_conflict_do_nothing(index_elements=[models.Link.short_code])
+            .returning(models.Link.short_code)
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=ALIAS_ERRORS["taken"])
+
+        await user_stats.add(db, current_user.id, links=1)
+        await db.commit()
+        await user_stats.mirror_add(redis_client, {current_user.id: (1, 0)})
+        await announce_short_code(redis_client, url_data.alias)
+        return schemas.URLResponse(
+            long_url=str(url_data.long_url),
+            short_url=f"{settings.origin_backend_url}/{url_data.alias}"
+        )
 
-    
     # --- START of the new resilient logic ---
     MAX_RETRIES = 5  # Set a limit to prevent infinite loops
     for _ in range(MAX_RETRIES):
@@ -84,7 +169,9 @@ async def create_short_url(
 
         db_link = models.Link(
             long_url=str(url_data.long_url),
+            url_hash=url_hash(str(url_data.long_url)),
             short_code=short_code,
+            redirect_type=url_data.redirect_type,
             owner_id=current_user.id
         )
         
@@ -92,8 +179,11 @@ async def create_short_url(
 
         try:
             # Try to save the new link to the database
+            await user_stats.add(db, current_user.id, links=1)
             await db.commit()
             await db.refresh(db_link)
+            await user_stats.mirror_add(redis_client, {current_user.id: (1, 0)})
+            await announce_short_code(redis_client, db_link.short_code)
 
             # If successful, create the full URL and exit the loop
             # short_url_full = f"{settings.origin_backend_url}/{short_code}"
@@ -117,9 +207,182 @@ async def create_short_url(
     )
 
 
+@router.post("/shorten/bulk", response_model=schemas.BulkURLResponse)
+@limiter.limit("10/minute")
+async def create_short_urls_bulk(
+        request: Request,
+        bulk_data: schemas.BulkURLCreate,
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis_client),
+        current_user: security.Principal = Depends(security.get_current_user)
+):
+    """
+    چندین لینک را در یک درخواست کوتاه می‌کند.
+    سهمیه یک بار بررسی می‌شود و همه لینک‌ها با یک INSERT چندسطری ذخیره می‌شوند؛
+    بررسی بدافزار در پس‌زمینه انجام می‌شود. نتیجه هر آیتم جداگانه برگردانده می‌شود.
+    """
+    items = bulk_data.items
+    if len(items) > settings.bulk_shorten_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.bulk_shorten_max_items} URLs can be shortened per request."
+        )
+
+    ensure_active_subscription(current_user)
+
+    items, results = _validate_bulk_items(items)
+    accepted = []
+    seen_aliases = set()
+
+    reusable = [i for i, item in enumerate(items) if item and item.reuse_existing and not item.alias]
+    existing = {}
+    if reusable:
+        existing = await find_existing_links(
+            db, current_user.id, [(results[i].long_url, items[i].redirect_type) for i in reusable]
+        )
+    # Repeats of a reusable destination within the batch share the first item's link.
+    leaders = {}
+    followers = {}
+
+    for i, item in enumerate(items):
+        if item is None:
+            continue
+        if item.alias:
+            reason = alias_rejection_reason(item.alias) or ("taken" if item.alias in seen_aliases else None)
+            if reason:
+                results[i].error = ALIAS_ERRORS[reason]
+                continue
+            seen_aliases.add(item.alias)
+        elif item.reuse_existing:
+            destination = (normalize_url(results[i].long_url), item.redirect_type)
+            if destination in existing:
+                results[i].short_url = f"{settings.origin_backend_url}/{existing[destination]}"
+                results[i].reused = True
+                continue
+            if destination in leaders:
+                followers[i] = leaders[destination]
+                continue
+            leaders[destination] = i
+        accepted.append(i)
+
+    granted = await link_quota.reserve(
+        redis_client, current_user.id, current_user.plan.link_limit_per_month, len(accepted)
+    )
+    for i in accepted[granted:]:
+        results[i].error = f"You have reached your monthly limit of {current_user.plan.link_limit_per_month} links."
+    accepted = accepted[:granted]
+
+    try:
+        created = await _insert_bulk_links(items, results, accepted, seen_aliases, db, redis_client, current_user)
+    except Exception:
+        await link_quota.release(redis_client, current_user.id, granted)
+        raise
+    await link_quota.release(redis_client, current_user.id, granted - created)
+
+    for i, leader in followers.items():
+        results[i].short_url = results[leader].short_url
+        results[i].reused = results[leader].short_url is not None
+        results[i].error = results[leader].error
+
+    return schemas.BulkURLResponse(
+        created=created,
+        failed=sum(1 for result in results if result.error is not None),
+        results=results
+    )
+
+
+def _validate_bulk_items(raw_items: list) -> Tuple[List[Optional[schemas.URLCreate]], List[schemas.BulkURLResult]]:
+    """Validates each bulk item on its own; invalid items are None with the reason in their result."""
+    items = []
+    results = []
+    for i, raw in enumerate(raw_items):
+        try:
+            item = url_create_adapter.validate_python(raw)
+        except ValidationError as e:
+            long_url = raw.get("long_url") if isinstance(raw, dict) else None
+            items.append(None)
+            results.append(schemas.BulkURLResult(
+                index=i,
+                long_url=str(long_url) if long_url is not None else "",
+                error="; ".join(
+                    f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}" for error in e.errors()
+                ),
+            ))
+            continue
+        items.append(item)
+        results.append(schemas.BulkURLResult(index=i, long_url=str(item.long_url)))
+    return items, results
+
+
+async def _insert_bulk_links(
+        items: List[Optional[schemas.URLCreate]],
+        results: List[schemas.BulkURLResult],
+        accepted: List[int],
+        seen_aliases: set,
+        db: AsyncSession,
+        redis_client: redis.Redis,
+        current_user: security.Principal
+) -> int:
+    """Inserts and announces the accepted bulk items; returns how many were created."""
+    created = {}
+    pending = accepted
+    for _ in range(2):
+        generated = iter(await generate_unique_short_keys(redis_client, sum(1 for i in pending if not items[i].alias)))
+        codes = {i: items[i].alias or next(generated) for i in pending}
+        # A generated code equal to an alias in this batch must not share its row.
+        to_insert = [i for i in pending if items[i].alias or codes[i] not in seen_aliases]
+
+        inserted_codes = set()
+        for start in range(0, len(to_insert), BULK_INSERT_CHUNK):
+            chunk = to_insert[start:start + BULK_INSERT_CHUNK]
+            result = await db.execute(
+                pg_insert(models.Link)
+                .values([
+                    {
+                        "long_url": results[i].long_url,
+                        "url_hash": url_hash(results[i].long_url),
+                        "short_code": codes[i],
+                        "redirect_type": items[i].redirect_type,
+                        "owner_id": current_user.id,
+                        "is_custom": bool(items[i].alias),
+                    }
+                    for i in chunk
+                ])
+                .on_conflict_do_nothing(index_elements=[models.Link.short_code])
+                .returning(models.Link.short_code)
+            )
+            inserted_codes.update(result.scalars())
+
+        # Generated codes that collided (e.g. with an existing alias) get one more try.
+        retry = []
+        for i in pending:
+            if codes[i] in inserted_codes:
+                created[i] = codes[i]
+                results[i].short_url = f"{settings.origin_backend_url}/{codes[i]}"
+            elif items[i].alias:
+                results[i].error = ALIAS_ERRORS["taken"]
+            else:
+                retry.append(i)
+        pending = retry
+        if not pending:
+            break
+
+    for i in pending:
+        results[i].error = "Could not generate a unique short link. Please try again later."
+
+    await user_stats.add(db, current_user.id, links=len(created))
+    await db.commit()
+
+    if created:
+        await user_stats.mirror_add(redis_client, {current_user.id: (len(created), 0)})
+        await announce_short_codes(redis_client, list(created.values()))
+
+    return len(created)
+
+
 @router.get("/my-links", response_model=List[schemas.LinkDetails])
 async def get_user_links(
-        current_user: models.User = Depends(security.get_current_user),
+        current_user: security.Principal = Depends(security.get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
     """
@@ -136,33 +399,56 @@ async def get_user_links(
     return links
 
 
+@router.get("/alias-available", response_model=schemas.AliasAvailability)
+@limiter.limit("120/minute")
+async def check_alias_availability(
+        request: Request,
+        alias: str = Query(..., max_length=64),
+        db: AsyncSession = Depends(get_db)
+):
+    """
+    در دسترس بودن یک نام مستعار دلخواه را بررسی می‌کند.
+    برای موارد واضح (نامعتبر، رزرو شده یا قطعاً آزاد) به دیتابیس مراجعه نمی‌شود.
+    """
+    reason = await alias_unavailable_reason(db, alias)
+    return schemas.AliasAvailability(alias=alias, available=reason is None, reason=reason)
+
+
 @router.delete("/{short_code}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_link(
         short_code: str,
-        current_user: models.User = Depends(security.get_current_user),
-        db: AsyncSession = Depends(get_db)
+        current_user: security.Principal = Depends(security.get_current_user),
+        db: AsyncSession = Depends(get_db),
+        redis_client: redis.Redis = Depends(get_redis_client)
 ):
     """
     یک لینک را بر اساس کد کوتاه آن حذف می‌کند.
     فقط صاحب لینک می‌تواند آن را حذف کند.
     """
-    # ابتدا لینک را پیدا کن
+    # حذف لینک از دیتابیس؛ تعداد کلیک از همان سطر حذف‌شده خوانده می‌شود
+    # تا کلیک‌هایی که همزمان flush شده‌اند هم از مجموع کاربر کم شوند.
     result = await db.execute(
-        select(models.Link).where(models.Link.short_code == short_code)
+        delete(models.Link)
+        .where(models.Link.short_code == short_code, models.Link.owner_id == current_user.id)
+        .returning(models.Link.owner_id, models.Link.clicks, models.Link.created_at)
     )
-    db_link = result.scalar_one_or_none()
+    deleted = result.one_or_none()
 
     # بررسی اینکه لینک وجود دارد و متعلق به کاربر فعلی است
-    if db_link is None:
-        raise HTTPException(status_code=404, detail="Link not found")
-
-    if db_link.owner_id != current_user.id:
+    if deleted is None:
+        exists = await db.scalar(select(models.Link.id).where(models.Link.short_code == short_code))
+        if exists is None:
+            raise HTTPException(status_code=404, detail="Link not found")
         raise HTTPException(status_code=403, detail="Not authorized to delete this link")
 
-    # حذف لینک از دیتابیس
-    await db.delete(db_link)
+    # The link row is locked by the DELETE before the owner's totals, in the same order as click flushes.
+    await user_stats.add(db, deleted.owner_id, links=-1, clicks=-(deleted.clicks or 0))
     await db.commit()
 
+    await user_stats.mirror_add(redis_client, {deleted.owner_id: (-1, -(deleted.clicks or 0))})
+    await invalidate_link(redis_client, short_code)
+    await link_quota.forget_link(redis_client, deleted.owner_id, deleted.created_at)
+
     # نیازی به برگرداندن محتوا نیست، چون حذف شده
     return None
 
@@ -171,12 +457,12 @@ async def delete_link(
 async def update_link(
     short_code: str,
     link_update: schemas.LinkUpdate,
-    current_user: models.User = Depends(security.get_current_user),
+    current_user: security.Principal = Depends(security.get_current_user),
     db: AsyncSession = Depends(get_db),
     redis_client: redis.Redis = Depends(get_redis_client)
 ):
     """
-    URL مقصد یک لینک را بروزرسانی می‌کند.
+    URL مقصد و/یا نوع ریدایرکت یک لینک را بروزرسانی می‌کند.
     فقط صاحب لینک می‌تواند آن را ویرایش کند.
     """
     result = await db.execute(
@@ -190,13 +476,20 @@ async def update_link(
     if db_link.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to edit this link")
 
-    # بروزرسانی URL
-    db_link.long_url = str(link_update.long_url)
+    # بروزرسانی URL و نوع ریدایرکت
+    if link_update.long_url is not None:
+        db_link.long_url = str(link_update.long_url)
+        db_link.url_hash = url_hash(db_link.long_url)
+        db_link.scan_status = models.ScanStatus.PENDING
+        db_link.scanned_at = None
+        db_link.scan_claimed_until = None
+    if link_update.redirect_type is not None:
+        db_link.redirect_type = link_update.redirect_type
     await db.commit()
     await db.refresh(db_link)
 
     # **مهم**: کش را پاک کن تا در درخواست بعدی، مقدار جدید خوانده شود
-    await redis_client.delete(f"link:{short_code}")
+    await invalidate_link(redis_client, short_code)
 
     return db_link
 
@@ -209,7 +502,7 @@ async def get_link_stats(
     request: Request,
     short_code: str,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_user)
+    current_user: security.Principal = Depends(security.get_current_user)
 ):
     """
     آمار کلیک‌های یک لینک در ۷ روز گذشته را به صورت دقیق و آگاه از منطقه زمانی محاسبه می‌کند.
@@ -225,19 +518,14 @@ async def get_link_stats(
     end_date_utc = datetime.now(timezone.utc)
     start_date_utc = (end_date_utc - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
 
-    stmt = text(
-        """
-        SELECT
-            (timestamp AT TIME ZONE 'UTC')::date AS date,
-            COUNT(id) AS clicks
-        FROM click_events
-        WHERE link_id = :link_id AND timestamp >= :start_date
-        GROUP BY date
-        ORDER BY date;
-        """
+    query_result = await db.execute(
+        select(models.LinkDailyClicks.day, models.LinkDailyClicks.clicks)
+        .where(
+            models.LinkDailyClicks.link_id == link_id,
+            models.LinkDailyClicks.day >= start_date_utc.date(),
+        )
     )
-    query_result = await db.execute(stmt, {"link_id": link_id, "start_date": start_date_utc})
-    clicks_by_date = {row.date: row.clicks for row in query_result.all()}
+    clicks_by_date = {row.day: row.clicks for row in query_result.all()}
 
     stats_last_7_days = []
     for i in range(7):
@@ -257,7 +545,7 @@ async def get_link_details(
     request: Request,
     short_code: str,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_user)
+    current_user: security.Principal = Depends(security.get_current_user)
 ):
     result = await db.execute(
         select(models.Link)
@@ -1,6 +1,6 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
 from fastapi.responses import RedirectResponse
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -13,6 +13,7 @@ from .. import models, schemas
 from ..database import get_db
 from ..schemas import PlanResponse
 from ..services import security
+from ..services.principal import invalidate_principal
 from ..services.zarinpal_gateway import ZarinpalGateway
 from ..config import settings
 
@@ -30,7 +31,7 @@ class CreatePaymentRequest(schemas.BaseModel):
 @router.post("/create-zarinpal-link")
 async def create_payment(
         request: CreatePaymentRequest,
-        current_user: models.User = Depends(security.get_current_user),
+        current_user: security.Principal = Depends(security.get_current_user),
         db: AsyncSession = Depends(get_db)
 ):
     plan_result = await db.execute(select(models.Plan).where(models.Plan.name == request.plan_name))
@@ -70,6 +71,7 @@ async def create_payment(
 
 @router.get("/verify-zarinpal")
 async def verify_zarinpal_payment(
+        request: Request,
         Authority: str = Query(...),
         Status: str = Query(...),
         db: AsyncSession = Depends(get_db)
@@ -115,6 +117,7 @@ async def verify_zarinpal_payment(
         # user.subscription_end_date = date.today() + timedelta(days=plan.duration_days)
 
         await db.commit()
+        await invalidate_principal(request.app.state.redis, user.email)
         return RedirectResponse(success_url)
     else:
         transaction.status = models.TransactionStatus.FAILED
@@ -137,7 +140,7 @@ class TransactionResponse(BaseModel):
 @router.get("/transactions", response_model=List[TransactionResponse])
 async def get_my_transactions(
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_user)
+    current_user: security.Principal = Depends(security.get_current_user)
 ):
     result = await db.execute(
         select(models.Transaction)
@@ -1,81 +1,93 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request
-from fastapi.responses import RedirectResponse
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from sqlalchemy import update
-import redis.asyncio as redis
+from pathlib import Path
 
-from .. import models
-# async_session_factory را برای ایجاد session جدید ایمپورت می‌کنیم
-from ..database import async_session_factory, get_db
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, RedirectResponse
+from starlette.routing import Route
+
+from ..config import settings
+from ..services.bloom import short_code_filter
+from ..services.click_buffer import click_buffer
+from ..services.edge_cache import REFRESH_HEADER
+from ..services.link_cache import CachedLink, fetch_link, local_link_cache
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(
-    tags=["Redirection"]
-)
+PERMANENT_REDIRECTS = {301, 308}
+
+BLOCKED_PAGE = (Path(__file__).resolve().parent.parent / "templates" / "pages" / "link_blocked.html").read_text(encoding="utf-8")
 
 
-async def get_redis_client(request: Request) -> redis.Redis:
+def increment_click_counter(short_code: str):
     """
-    کلاینت Redis را از استیت اپلیکیشن دریافت می‌کند.
+    کلیک را در بافر ثبت می‌کند تا به صورت دسته‌ای و تجمیع‌شده در دیتابیس نوشته شود.
     """
-    return request.app.state.redis
+    click_buffer.record(short_code)
 
 
-async def increment_click_counter(short_code: str):
+def build_redirect_response(link: CachedLink, refresh: bool) -> RedirectResponse:
     """
-    این تابع شمارنده کلی را افزایش داده و یک رویداد کلیک جدید ثبت می‌کند.
+    پاسخ ریدایرکت را بر اساس نوع آن همراه با هدرهای کش مرورگر و nginx می‌سازد.
+    ریدایرکت‌های دائمی در microcache ذخیره می‌شوند؛ ریدایرکت‌های موقت نه،
+    تا شمارش کلیک آن‌ها دقیق بماند. مرورگر را نمی‌توان purge کرد، پس
+    max-age آن حتی برای ریدایرکت دائمی کوتاه است.
     """
-    async with async_session_factory() as session:
-        async with session.begin():
-            result = await session.execute(select(models.Link.id).where(models.Link.short_code == short_code))
-            link_id = result.scalar_one_or_none()
-
-            if link_id:
-                await session.execute(
-                    update(models.Link)
-                    .where(models.Link.id == link_id)
-                    .values(clicks=models.Link.clicks + 1)
-                )
-
-                new_click = models.ClickEvent(link_id=link_id)
-                session.add(new_click)
-
-@router.get("/{short_code}")
-async def redirect_to_long_url(
-        short_code: str,
-        background_tasks: BackgroundTasks,
-        request: Request,
-        db: AsyncSession = Depends(get_db),
-        redis_client: redis.Redis = Depends(get_redis_client)
-):
+    response = RedirectResponse(url=link.long_url, status_code=link.redirect_type)
+
+    if link.redirect_type in PERMANENT_REDIRECTS:
+        response.headers["Cache-Control"] = f"public, max-age={settings.redirect_permanent_max_age}"
+        microcache_seconds = settings.redirect_microcache_seconds
+    else:
+        response.headers["Cache-Control"] = f"private, max-age={settings.redirect_temporary_max_age}"
+        microcache_seconds = 0
+
+    # A refresh must always overwrite the entry nginx currently holds.
+    if refresh:
+        microcache_seconds = max(microcache_seconds, 1)
+    response.headers["X-Accel-Expires"] = str(microcache_seconds)
+    return response
+
+
+def build_blocked_response(refresh: bool) -> HTMLResponse:
     """
-    کاربر را به URL اصلی هدایت کرده و شمارنده کلیک را در پس‌زمینه افزایش می‌دهد.
+    صفحه هشدار را برای لینکی که مقصد آن به عنوان بدافزار شناسایی شده برمی‌گرداند.
     """
-    cache_key = f"link:{short_code}"
-    long_url = None
+    response = HTMLResponse(BLOCKED_PAGE, status_code=403)
+    response.headers["Cache-Control"] = "no-store"
+    response.headers["X-Accel-Expires"] = "1" if refresh else "0"
+    return response
+
+
+async def redirect_to_long_url(request: Request):
+    """
+    کاربر را به URL اصلی هدایت کرده و کلیک را برای ثبت دسته‌ای در بافر قرار می‌دهد.
+
+    این endpoint عمداً بدون سیستم dependency injection در FastAPI نوشته شده تا
+    درخواست‌هایی که از کش پاسخ داده می‌شوند هیچ هزینه اضافه‌ای نداشته باشند.
+    """
+    short_code = request.path_params["short_code"]
+    refresh = REFRESH_HEADER in request.headers
+    not_found_headers = {"X-Accel-Expires": "1"} if refresh else None
+
+    if short_code not in local_link_cache and not short_code_filter.might_exist(short_code):
+        return JSONResponse({"detail": "URL not found"}, status_code=404, headers=not_found_headers)
 
     try:
-        long_url_from_cache = await redis_client.get(cache_key)
-        if long_url_from_cache:
-            long_url = long_url_from_cache
-        else:
-            result = await db.execute(select(models.Link).where(models.Link.short_code == short_code))
-            db_link = result.scalar_one_or_none()
+        link = await fetch_link(request.app.state.redis, short_code)
+    except Exception:
+        logger.exception("Failed to resolve short code %s", short_code)
+        return JSONResponse({"detail": "Internal server error"}, status_code=500)
+
+    if link is None:
+        return JSONResponse({"detail": "URL not found"}, status_code=404, headers=not_found_headers)
 
-            if db_link is None:
-                raise HTTPException(status_code=404, detail="URL not found")
+    if link.flagged:
+        return build_blocked_response(refresh)
 
-            long_url = db_link.long_url
-            await redis_client.set(cache_key, long_url, ex=3600)
+    if not refresh:
+        increment_click_counter(short_code)
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Internal server error")
+    return build_redirect_response(link, refresh)
 
-    background_tasks.add_task(increment_click_counter, short_code)
 
-    return RedirectResponse(url=long_url, status_code=307)
\ No newline at end of file
+route = Route("/{short_code}", redirect_to_long_url, methods=["GET"], name="redirect_to_long_url")
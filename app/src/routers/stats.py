@@ -1,25 +1,33 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, select
-from .. import models, schemas
-from ..database import get_db
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Request
+from .. import schemas
 from ..services import security
+from ..services.user_stats import user_stats
 
 router = APIRouter(prefix="/stats", tags=["Statistics"])
 
 class DashboardStats(schemas.BaseModel):
     total_links: int
     total_clicks: int
+    links_this_period: int
+    link_limit: Optional[int] = None
+    remaining_quota: Optional[int] = None
 
 @router.get("/dashboard", response_model=DashboardStats)
 async def get_dashboard_stats(
-    current_user: models.User = Depends(security.get_current_user),
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    current_user: security.Principal = Depends(security.get_current_user)
 ):
-    total_links_result = await db.execute(select(func.count(models.Link.id)).where(models.Link.owner_id == current_user.id))
-    total_clicks_result = await db.execute(select(func.sum(models.Link.clicks)).where(models.Link.owner_id == current_user.id))
-
-    total_links = total_links_result.scalar_one()
-    total_clicks = total_clicks_result.scalar_one() or 0
+    totals = await user_stats.dashboard(request.app.state.redis, current_user.id)
+    links_this_period = totals["links_this_period"]
+    link_limit = current_user.plan.link_limit_per_month if current_user.plan else None
+    remaining_quota = max(link_limit - links_this_period, 0) if link_limit is not None else None
 
-    return DashboardStats(total_links=total_links, total_clicks=total_clicks)
\ No newline at end of file
+    return DashboardStats(
+        total_links=totals["total_links"],
+        total_clicks=totals["total_clicks"],
+        links_this_period=links_this_period,
+        link_limit=link_limit,
+        remaining_quota=remaining_quota
+    )
\ No newline at end of file
@@ -1,11 +1,15 @@
 from pydantic import BaseModel, HttpUrl, EmailStr
-from typing import Optional, List
+from typing import Any, Optional, List, Literal
 from datetime import date, datetime
 
 from . import models
 from datetime import date
 
 
+# 301/308 are permanent and cacheable by browsers; 302/307 are temporary.
+RedirectType = Literal[301, 302, 307, 308]
+
+
 class UserSummary(BaseModel):
     id: int
     email: EmailStr
@@ -79,11 +83,41 @@ class UserResponse(BaseModel):
         from_attributes = True
 class URLCreate(BaseModel):
     long_url: HttpUrl
+    redirect_type: RedirectType = 307
+    alias: Optional[str] = None
+    reuse_existing: bool = False
+
+
+class BulkURLCreate(BaseModel):
+    # Each item is validated as a URLCreate by the endpoint, so one bad URL
+    # fails only its own result instead of the whole request.
+    items: List[Any]
+
+
+class BulkURLResult(BaseModel):
+    index: int
+    long_url: str
+    short_url: Optional[str] = None
+    reused: bool = False
+    error: Optional[str] = None
+
+
+class BulkURLResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkURLResult]
+
+
+class AliasAvailability(BaseModel):
+    alias: str
+    available: bool
+    reason: Optional[str] = None
 
 
 class URLResponse(BaseModel):
     long_url: HttpUrl
     short_url: str
+    reused: bool = False
 
     class Config:
         from_attributes = True
@@ -103,6 +137,8 @@ class LinkDetails(BaseModel):
     long_url: HttpUrl
     short_code: str
     clicks: int
+    redirect_type: int
+    scan_status: models.ScanStatus
     created_at: datetime
 
     class Config:
@@ -110,7 +146,8 @@ class LinkDetails(BaseModel):
 
 
 class LinkUpdate(BaseModel):
-    long_url: HttpUrl
+    long_url: Optional[HttpUrl] = None
+    redirect_type: Optional[RedirectType] = None
 
 
 class DailyStat(BaseModel):
@@ -0,0 +1,57 @@
+from typing import Hashable
+
+_MASK64 = (1 << 64) - 1
+_ROW_SEEDS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93)
+_HALVE = bytes(value >> 1 for value in range(256))
+
+
+class FrequencySketch:
+    """
+    A TinyLFU-style count-min sketch of recent access frequencies.
+
+    Counters saturate at 255 and are all halved once `sample_size` increments
+    have been recorded, so estimates track recent popularity rather than
+    lifetime totals. Hashing relies on the builtin hash(), so estimates are only
+    meaningful within one process.
+    """
+
+    def __init__(self, width: int, sample_factor: int = 10):
+        self.width = 1 << max(width - 1, 1).bit_length()
+        self.sample_size = self.width * sample_factor
+        self._mask = self.width - 1
+        self._rows = [bytearray(self.width) for _ in _ROW_SEEDS]
+        self._additions = 0
+
+    def _indexes(self, key: Hashable):
+        h = hash(key) & _MASK64
+        for seed in _ROW_SEEDS:
+            yield (((h * seed) & _MASK64) >> 40) & self._mask
+
+    def increment(self, key: Hashable) -> None:
+        for row, index in zip(self._rows, self._indexes(key)):
+            if row[index] < 255:
+                row[index] += 1
+
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            self._reset()
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+
+    def _reset(self) -> None:
+        for row in self._rows:
+            row[:] = row.translate(_HALVE)
+        self._additions //= 2
+
+
+def adaptive_ttl(frequency: int, threshold: int, cold_ttl: int, base_ttl: int, max_ttl: int) -> int:
+    """
+    TTL for a key seen `frequency` times: `cold_ttl` below `threshold`, then
+    `base_ttl` doubled with every doubling of the frequency, up to `max_ttl`.
+    """
+    if frequency < threshold:
+        return cold_ttl
+
+    doublings = (frequency // threshold).bit_length() - 1
+    return min(base_ttl << doublings, max_ttl)
@@ -0,0 +1,80 @@
+import re
+from typing import Iterable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .. import models
+from .bloom import short_code_filter
+from .link_cache import local_link_cache
+
+# Must stay within the short-code location nginx proxies to the app.
+ALIAS_PATTERN = re.compile(r"^[A-Za-z0-9_-]{3,10}$")
+
+# Paths served by nginx or reserved for future use that are not app routes.
+RESERVED_WORDS = {
+    "api", "admin", "auth", "pages", "fonts", "locales", "static", "assets",
+    "docs", "redoc", "openapi", "login", "logout", "register", "signup",
+    "health", "status", "favicon", "robots", "sitemap", "www", "mail",
+}
+
+ALIAS_ERRORS = {
+    "invalid": "Alias must be 3-10 characters made of letters, digits, '-' or '_'.",
+    "reserved": "This alias is reserved.",
+    "taken": "This alias is already taken.",
+}
+
+
+class AliasIndex:
+    """
+    In-memory index of words a custom alias may not use.
+
+    Holds the static reserved words plus the first path segment of every route
+    mounted on the app, so an alias can never shadow a router. Comparison is
+    case-insensitive.
+    """
+
+    def __init__(self, words: Iterable[str]):
+        self._reserved = {word.lower() for word in words}
+
+    def add_route_prefixes(self, routes) -> None:
+        for route in routes:
+            path = getattr(route, "path", "")
+            segment = path.lstrip("/").split("/", 1)[0]
+            if segment and "{" not in segment:
+                self._reserved.add(segment.split(".", 1)[0].lower())
+
+    def is_reserved(self, alias: str) -> bool:
+        return alias.lower() in self._reserved
+
+
+alias_index = AliasIndex(RESERVED_WORDS)
+
+
+def alias_rejection_reason(alias: str) -> Optional[str]:
+    """Checks an alias without any I/O; returns "invalid", "reserved" or None."""
+    if not ALIAS_PATTERN.match(alias):
+        return "invalid"
+    if alias_index.is_reserved(alias):
+        return "reserved"
+    return None
+
+
+async def alias_unavailable_reason(db: AsyncSession, alias: str) -> Optional[str]:
+    """
+    Returns why an alias cannot be used ("invalid", "reserved" or "taken"),
+    or None if it is free. Only reaches Postgres when neither the local link
+    cache nor the short code filter can answer; the final word on a race is
+    still the unique index on short_code at insert time.
+    """
+    reason = alias_rejection_reason(alias)
+    if reason:
+        return reason
+
+    if alias in local_link_cache:
+        return "taken"
+    if not short_code_filter.might_exist(alias):
+        return None
+
+    result = await db.execute(select(models.Link.id).where(models.Link.short_code == alias))
+    return "taken" if result.scalar_one_or_none() is not None else None
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import logging
+import math
+from typing import List, Optional, Set
+
+import redis.asyncio as redis
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+from .cache_bus import CHANNEL, cache_bus, publish
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter over strings using double hashing on a BLAKE2b digest.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._bits)
+
+    def estimated_false_positive_rate(self) -> float:
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class ShortCodeFilter:
+    """
+    Per-worker Bloom filter of every existing short code.
+
+    A negative answer means the code certainly does not exist, so the redirect
+    path can return 404 without touching Redis or Postgres. New codes are added
+    on every worker via the cache bus; deletes are absorbed by periodic rebuilds.
+    Until the first build completes every code is treated as possibly existing.
+    """
+
+    def __init__(self, error_rate: float, rebuild_interval: float, min_capacity: int = 10000):
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.min_capacity = min_capacity
+
+        self._filter: Optional[BloomFilter] = None
+        self._added_during_rebuild: Optional[Set[str]] = None
+        self._rebuild_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.rejected = 0
+
+    def might_exist(self, short_code: str) -> bool:
+        if self._filter is None or short_code in self._filter:
+            return True
+        self.rejected += 1
+        return False
+
+    def add(self, short_code: str) -> None:
+        if self._filter is not None:
+            self._filter.add(short_code)
+        if self._added_during_rebuild is not None:
+            self._added_during_rebuild.add(short_code)
+
+    async def rebuild(self) -> None:
+        async with self._rebuild_lock:
+            self._added_during_rebuild = set()
+            try:
+                async with async_session_factory() as session:
+                    total = await session.scalar(select(func.count(models.Link.id)))
+                    new_filter = BloomFilter(max(total * 2, self.min_capacity), self.error_rate)
+
+                    codes = await session.stream_scalars(
+                        select(models.Link.short_code).execution_options(yield_per=10000)
+                    )
+                    async for short_code in codes:
+                        new_filter.add(short_code)
+
+                for short_code in self._added_during_rebuild:
+                    new_filter.add(short_code)
+                self._filter = new_filter
+            finally:
+                self._added_during_rebuild = None
+
+        logger.info(
+            "Short code filter rebuilt: %d codes, %d KiB, estimated false-positive rate %.5f",
+            new_filter.count, new_filter.memory_bytes // 1024, new_filter.estimated_false_positive_rate()
+        )
+
+    def schedule_rebuild(self) -> None:
+        """Rebuilds in the background, e.g. after missing bus messages."""
+        if self._filter is not None:
+            asyncio.create_task(self._safe_rebuild())
+
+    async def start(self) -> None:
+        await self._safe_rebuild()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            await self._safe_rebuild()
+
+    async def _safe_rebuild(self) -> None:
+        try:
+            await self.rebuild()
+        except Exception:
+            logger.exception("Failed to rebuild the short code filter")
+
+    def stats(self) -> dict:
+        if self._filter is None:
+            return {"ready": False, "rejected": self.rejected}
+        return {
+            "ready": True,
+            "codes": self._filter.count,
+            "capacity": self._filter.capacity,
+            "bits": self._filter.num_bits,
+            "hashes": self._filter.num_hashes,
+            "memory_bytes": self._filter.memory_bytes,
+            "target_false_positive_rate": self.error_rate,
+            "estimated_false_positive_rate": round(self._filter.estimated_false_positive_rate(), 6),
+            "rejected": self.rejected,
+        }
+
+
+short_code_filter = ShortCodeFilter(
+    error_rate=settings.short_code_filter_error_rate,
+    rebuild_interval=settings.short_code_filter_rebuild_seconds,
+)
+
+cache_bus.subscribe("bloom", short_code_filter.add)
+cache_bus.on_reset(short_code_filter.schedule_rebuild)
+
+
+async def announce_short_code(redis_client: redis.Redis, short_code: str) -> None:
+    """
+    Adds a newly created short code to the filter of every worker.
+    """
+    short_code_filter.add(short_code)
+    await publish(redis_client, "bloom", short_code)
+
+
+async def announce_short_codes(redis_client: redis.Redis, short_codes: List[str]) -> None:
+    """
+    Bulk variant of announce_short_code that publishes in one pipeline.
+    """
+    async with redis_client.pipeline(transaction=False) as pipe:
+        for short_code in short_codes:
+            short_code_filter.add(short_code)
+            pipe.publish(CHANNEL, f"bloom:{short_code}")
+        await pipe.execute()
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache:invalidate"
+
+
+class CacheBus:
+    """
+    Broadcasts cache invalidations to every worker over Redis pub/sub.
+
+    Messages have the form "<kind>:<key>" and are dispatched to the handlers
+    registered for that kind. Since pub/sub is fire-and-forget, the reset
+    callbacks run whenever the subscription is (re)established so that no
+    worker keeps entries whose invalidation it may have missed.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._reset_callbacks: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, kind: str, handler: Callable[[str], None]) -> None:
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def on_reset(self, callback: Callable[[], None]) -> None:
+        self._reset_callbacks.append(callback)
+
+    async def start(self, redis_client: redis.Redis) -> None:
+        self._task = asyncio.create_task(self._listen(redis_client))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def dispatch(self, message: str) -> None:
+        kind, _, key = message.partition(":")
+        for handler in self._handlers.get(kind, []):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception("Cache bus handler for %r failed", kind)
+
+    async def _listen(self, redis_client: redis.Redis) -> None:
+        backoff = 1
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CHANNEL)
+                for callback in self._reset_callbacks:
+                    callback()
+                backoff = 1
+
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Cache bus subscription lost (%s), retrying in %ss", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+
+
+async def publish(redis_client: redis.Redis, kind: str, key: str) -> None:
+    await redis_client.publish(CHANNEL, f"{kind}:{key}")
+
+
+cache_bus = CacheBus()
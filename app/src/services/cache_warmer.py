@@ -0,0 +1,107 @@
+"""
+Preloads the most clicked links into Redis and the worker's local cache.
+
+Runs from the lifespan hook before the app starts serving, and can be run on
+its own after a deploy or a Redis restart:
+
+    python -m src.services.cache_warmer [top_n]
+"""
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+import redis.asyncio as redis
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+from .link_cache import CachedLink, link_cache_key, local_link_cache
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_CHUNK = 500
+
+
+async def _select_hot_links(limit: int, lookback_days: int) -> List[Tuple[str, CachedLink]]:
+    since = datetime.now(timezone.utc).date() - timedelta(days=lookback_days)
+
+    async with async_session_factory() as session:
+        result = await session.execute(
+            select(models.Link.short_code, models.Link.long_url, models.Link.redirect_type, models.Link.scan_status)
+            .join(models.LinkDailyClicks, models.LinkDailyClicks.link_id == models.Link.id)
+            .where(models.LinkDailyClicks.day >= since)
+            .group_by(models.Link.id)
+            .order_by(func.sum(models.LinkDailyClicks.clicks).desc())
+            .limit(limit)
+        )
+        rows = result.all()
+
+        if not rows:
+            result = await session.execute(
+                select(models.Link.short_code, models.Link.long_url, models.Link.redirect_type, models.Link.scan_status)
+                .order_by(models.Link.clicks.desc())
+                .limit(limit)
+            )
+            rows = result.all()
+
+    return [(row.short_code, CachedLink.from_row(row)) for row in rows]
+
+
+async def _warm(redis_client: redis.Redis, limit: int, lookback_days: int, loaded: List[int]) -> None:
+    hot_links = await _select_hot_links(limit, lookback_days)
+
+    cached_at = time.time()
+    for start in range(0, len(hot_links), PIPELINE_CHUNK):
+        chunk = hot_links[start:start + PIPELINE_CHUNK]
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for short_code, link in chunk:
+                # The base TTL: links that stay hot are extended by their own traffic.
+                pipe.set(link_cache_key(short_code), link.dumps(cached_at=cached_at), ex=settings.link_ttl_base_seconds)
+            await pipe.execute()
+
+        for short_code, link in chunk:
+            local_link_cache.set(short_code, link)
+        loaded[0] += len(chunk)
+
+
+async def warm_link_cache(
+    redis_client: redis.Redis,
+    limit: int = settings.cache_warm_top_n,
+    budget_seconds: float = settings.cache_warm_budget_seconds,
+    lookback_days: int = settings.cache_warm_lookback_days,
+) -> int:
+    """
+    Loads the top `limit` links by recent clicks (falling back to lifetime
+    clicks) within `budget_seconds`. Returns how many links were loaded;
+    running out of time or failing only leaves the cache partially warm.
+    """
+    if limit <= 0:
+        return 0
+
+    loaded = [0]
+    try:
+        await asyncio.wait_for(_warm(redis_client, limit, lookback_days, loaded), timeout=budget_seconds)
+    except asyncio.TimeoutError:
+        logger.warning("Cache warm-up hit its %.1fs budget after %d links", budget_seconds, loaded[0])
+    except Exception:
+        logger.exception("Cache warm-up failed after %d links", loaded[0])
+    return loaded[0]
+
+
+async def main(limit: int) -> None:
+    redis_client = redis.from_url(settings.redis_url, encoding="utf-8", decode_responses=True)
+    try:
+        loaded = await warm_link_cache(redis_client, limit=limit)
+        print(f"🔥 Warmed {loaded} links into Redis.")
+    finally:
+        await redis_client.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else settings.cache_warm_top_n))
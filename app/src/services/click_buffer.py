@@ -0,0 +1,157 @@
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+import redis.asyncio as redis
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+from .click_rollup import add_daily_clicks
+from .user_stats import user_stats
+
+logger = logging.getLogger(__name__)
+
+links_table = models.Link.__table__
+click_events_table = models.ClickEvent.__table__
+
+
+class ClickBuffer:
+    """
+    Collects redirect clicks in memory and writes them to Postgres in batches.
+
+    Each flush resolves the buffered short codes to link ids in one query,
+    applies one aggregated `clicks = clicks + delta` per link, bulk-inserts
+    the raw click events and upserts the per-day rollup and the owners'
+    click totals, all inside a single transaction; the owners' Redis stats
+    mirrors are updated once it has committed.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int, max_events: int):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_events = max_events
+
+        self._events: List[Tuple[str, datetime]] = []
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._early_flush: Optional[asyncio.Task] = None
+        self._redis: Optional[redis.Redis] = None
+        self._stopping = asyncio.Event()
+        self.dropped = 0
+
+    def record(self, short_code: str) -> None:
+        if len(self._events) >= self.max_events:
+            self.dropped += 1
+            return
+
+        self._events.append((short_code, datetime.now(timezone.utc)))
+
+        if (
+            len(self._events) >= self.batch_size
+            and self._task is not None
+            and not self._flush_lock.locked()
+            and (self._early_flush is None or self._early_flush.done())
+        ):
+            self._early_flush = asyncio.create_task(self.flush())
+
+    async def start(self, redis_client: Optional[redis.Redis] = None) -> None:
+        self._redis = redis_client
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the periodic flusher and drains whatever is still buffered."""
+        if self._task:
+            # Not cancelled: a flush cancelled mid-write would lose its batch.
+            self._stopping.set()
+            await self._task
+            self._task = None
+
+        if self._early_flush:
+            await asyncio.gather(self._early_flush, return_exceptions=True)
+
+        await self.flush()
+        if self._events:
+            logger.error("Dropping %d buffered clicks that could not be written on shutdown", len(self._events))
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            while self._events:
+                batch = self._events[:self.batch_size]
+                del self._events[:self.batch_size]
+
+                try:
+                    await self._write(batch)
+                except Exception:
+                    logger.exception("Failed to flush %d clicks, will retry", len(batch))
+                    self._events[:0] = batch[:max(self.max_events - len(self._events), 0)]
+                    return
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def _write(self, batch: List[Tuple[str, datetime]]) -> None:
+        deltas = Counter(short_code for short_code, _ in batch)
+
+        async with async_session_factory() as session:
+            async with session.begin():
+                # Locked (in id order) so a link deleted concurrently is either
+                # counted before its DELETE reads clicks or skipped entirely.
+                result = await session.execute(
+                    select(models.Link.id, models.Link.short_code, models.Link.owner_id)
+                    .where(models.Link.short_code.in_(list(deltas)))
+                    .order_by(models.Link.id)
+                    .with_for_update()
+                )
+                rows = result.all()
+                link_ids = {row.short_code: row.id for row in rows}
+                if not link_ids:
+                    return
+
+                owner_clicks = Counter()
+                for row in rows:
+                    if row.owner_id is not None:
+                        owner_clicks[row.owner_id] += deltas[row.short_code]
+
+                # Updating in id order keeps row locks ordered across workers.
+                await session.execute(
+                    update(links_table)
+                    .where(links_table.c.id == bindparam("link_id"))
+                    .values(clicks=links_table.c.clicks + bindparam("delta")),
+                    [
+                        {"link_id": link_id, "delta": deltas[short_code]}
+                        for short_code, link_id in sorted(link_ids.items(), key=lambda item: item[1])
+                    ]
+                )
+
+                clicks = [
+                    (link_ids[short_code], clicked_at)
+                    for short_code, clicked_at in batch
+                    if short_code in link_ids
+                ]
+                await session.execute(
+                    insert(click_events_table),
+                    [{"link_id": link_id, "timestamp": clicked_at} for link_id, clicked_at in clicks]
+                )
+                await add_daily_clicks(session, clicks)
+                await user_stats.add_clicks(session, owner_clicks)
+
+        if self._redis is not None:
+            await user_stats.mirror_add(self._redis, {user_id: (0, delta) for user_id, delta in owner_clicks.items()})
+
+
+click_buffer = ClickBuffer(
+    flush_interval=settings.click_flush_interval_seconds,
+    batch_size=settings.click_flush_batch_size,
+    max_events=settings.click_buffer_max_events,
+)
@@ -0,0 +1,127 @@
+"""
+Maintains link_daily_clicks, the per-day click counts read by the stats
+endpoints.
+
+The click buffer adds each flush to the rollup in the same transaction as
+the raw click_events (add_daily_clicks). reconcile_daily_clicks rebuilds
+days from click_events, as a backfill or to repair drift:
+
+    python -m src.services.click_rollup [days|all]
+"""
+import asyncio
+import logging
+import sys
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+
+logger = logging.getLogger(__name__)
+
+daily_clicks_table = models.LinkDailyClicks.__table__
+
+# pg advisory lock between flushes (shared) and a day being rebuilt (exclusive),
+# so a rebuild never overwrites clicks committed while it was counting.
+ROLLUP_LOCK_ID = 0x726F6C6C
+
+RECONCILE_DAY_SQL = text(
+    """
+    WITH counts AS (
+        SELECT link_id, COUNT(*) AS clicks
+        FROM click_events
+        WHERE timestamp >= :start AND timestamp < :end
+        GROUP BY link_id
+    ),
+    removed AS (
+        DELETE FROM link_daily_clicks d
+        WHERE d.day = :day AND NOT EXISTS (SELECT 1 FROM counts c WHERE c.link_id = d.link_id)
+        RETURNING 1
+    ),
+    upserted AS (
+        INSERT INTO link_daily_clicks (link_id, day, clicks)
+        SELECT link_id, :day, clicks
+        FROM counts
+        ORDER BY link_id
+        ON CONFLICT (link_id, day) DO UPDATE SET clicks = EXCLUDED.clicks
+        WHERE link_daily_clicks.clicks IS DISTINCT FROM EXCLUDED.clicks
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM upserted) AS upserted, (SELECT COUNT(*) FROM removed) AS removed
+    """
+)
+
+
+async def add_daily_clicks(session: AsyncSession, clicks: Iterable[Tuple[int, datetime]]) -> None:
+    """Adds (link_id, clicked_at) pairs to the rollup, one upserted row per link and UTC day."""
+    counts = Counter((link_id, clicked_at.astimezone(timezone.utc).date()) for link_id, clicked_at in clicks)
+    if not counts:
+        return
+
+    await session.execute(text("SELECT pg_advisory_xact_lock_shared(:lock_id)"), {"lock_id": ROLLUP_LOCK_ID})
+    stmt = pg_insert(daily_clicks_table).values([
+        {"link_id": link_id, "day": day, "clicks": delta}
+        # Sorted so concurrent flushes lock rows in the same order.
+        for (link_id, day), delta in sorted(counts.items())
+    ])
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[daily_clicks_table.c.link_id, daily_clicks_table.c.day],
+            set_={"clicks": daily_clicks_table.c.clicks + stmt.excluded.clicks},
+        )
+    )
+
+
+async def reconcile_day(day: date) -> Tuple[int, int]:
+    """Rebuilds one UTC day from click_events; returns (rows written, rows removed)."""
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    async with async_session_factory() as session:
+        async with session.begin():
+            # Flushes wait while the day is counted; a day is one BRIN range scan.
+            await session.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": ROLLUP_LOCK_ID})
+            result = await session.execute(
+                RECONCILE_DAY_SQL, {"start": start, "end": start + timedelta(days=1), "day": day}
+            )
+            row = result.one()
+    return row.upserted, row.removed
+
+
+async def reconcile_daily_clicks(days: Optional[int] = settings.click_rollup_reconcile_days) -> int:
+    """
+    Rebuilds the last `days` UTC days (including today), or every day since
+    the first click event if `days` is None. Returns how many rollup rows
+    were corrected.
+    """
+    today = datetime.now(timezone.utc).date()
+    if days is None:
+        async with async_session_factory() as session:
+            first_click = await session.scalar(select(func.min(models.ClickEvent.timestamp)))
+        if first_click is None:
+            return 0
+        first_day = first_click.astimezone(timezone.utc).date()
+    else:
+        first_day = today - timedelta(days=days - 1)
+
+    corrected = 0
+    day = first_day
+    while day <= today:
+        upserted, removed = await reconcile_day(day)
+        if upserted or removed:
+            logger.info("Rollup for %s: %d rows written, %d removed", day, upserted, removed)
+        corrected += upserted + removed
+        day += timedelta(days=1)
+    return corrected
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    arg = sys.argv[1] if len(sys.argv) > 1 else str(settings.click_rollup_reconcile_days)
+    corrected = asyncio.run(reconcile_daily_clicks(None if arg == "all" else int(arg)))
+    print(f"📊 Click rollup reconciled, {corrected} rows corrected.")
@@ -0,0 +1,45 @@
+import asyncio
+import logging
+from typing import Set
+
+import httpx
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+REFRESH_HEADER = "X-Cache-Refresh"
+
+# Gives the cache bus time to evict the link from every worker before nginx refetches it.
+REFRESH_DELAY_SECONDS = 0.5
+
+_pending: Set[asyncio.Task] = set()
+
+
+async def _refresh(short_code: str) -> None:
+    await asyncio.sleep(REFRESH_DELAY_SECONDS)
+    try:
+        async with httpx.AsyncClient(timeout=2.0) as client:
+            await client.get(
+                f"{settings.nginx_cache_refresh_url}/{short_code}",
+                headers={REFRESH_HEADER: "1"},
+            )
+    except httpx.HTTPError as e:
+        logger.warning("Failed to refresh nginx cache for %s: %s", short_code, e)
+
+
+def refresh_edge_cache(short_code: str) -> None:
+    """
+    Makes nginx re-fetch a redirect so its microcache drops the old destination.
+
+    nginx's internal refresh listener bypasses the cache for every request and
+    stores the fresh response under the same key; the app answers refresh
+    requests with a cacheable response even for 404s or temporary redirects,
+    which effectively purges the entry. Does nothing unless
+    NGINX_CACHE_REFRESH_URL is configured.
+    """
+    if not settings.nginx_cache_refresh_url:
+        return
+    task = asyncio.create_task(_refresh(short_code))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
@@ -1,24 +1,125 @@
-import os
-from fastapi import APIRouter, Request
-
-from loguru import logger
+import asyncio
+import logging
+import ssl
+import time
+from contextlib import asynccontextmanager
 from email.message import EmailMessage
+from pathlib import Path
+from typing import AsyncIterator, List, Optional, Tuple
+
 import aiosmtplib
+import redis.asyncio as redis
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 
 from ..config import settings
+from .job_queue import PermanentJobError, RedisJobQueue
 
+logger = logging.getLogger(__name__)
 
-# email_service.py
-async def send_email(
-    request: Request,
-    to_email: str,
-    subject: str,
-    html_content: str,
-    plain_text: str = None
-):
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent / "templates" / "emails"
+
+# Templates are compiled once per worker; the files are part of the image.
+template_env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+)
+TEMPLATES = {
+    name: template_env.get_template(f"{name}.html")
+    for name in ("verify_email", "reset_password")
+}
+
+PLAIN_TEXT_FALLBACK = "Please view this message in an HTML-capable client."
+
+
+class SmtpPool:
+    """
+    A small pool of logged-in SMTP connections.
+
+    At most `size` connections exist per worker. Idle connections are reused
+    in LIFO order and replaced once they have been idle longer than
+    `idle_timeout`, since servers drop quiet clients. A connection that
+    fails mid-send is closed rather than returned; a send on a reused
+    connection that turns out to be dead is retried once on a new one.
+    """
+
+    def __init__(self, size: int, idle_timeout: float):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._slots = asyncio.Semaphore(size)
+        self._idle: List[Tuple[aiosmtplib.SMTP, float]] = []
+        self._tls_context = ssl.create_default_context()
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.smtp_host,
+            port=int(settings.smtp_port),
+            tls_context=self._tls_context,
+            timeout=settings.smtp_timeout_seconds,
+        )
+        await smtp.connect()
+        if settings.smtp_user:
+            await smtp.login(settings.smtp_user, settings.smtp_pass)
+        return smtp
+
+    @staticmethod
+    async def _close(smtp: aiosmtplib.SMTP) -> None:
+        try:
+            await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def _take(self) -> Optional[aiosmtplib.SMTP]:
+        while self._idle:
+            smtp, idle_since = self._idle.pop()
+            if smtp.is_connected and time.monotonic() - idle_since < self.idle_timeout:
+                return smtp
+            await self._close(smtp)
+        return None
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[Tuple[aiosmtplib.SMTP, bool]]:
+        """Yields (connection, reused) and returns it to the pool if it is still healthy."""
+        async with self._slots:
+            smtp = await self._take()
+            reused = smtp is not None
+            if smtp is None:
+                smtp = await self._connect()
+            try:
+                yield smtp, reused
+            except BaseException:
+                await self._close(smtp)
+                raise
+            self._idle.append((smtp, time.monotonic()))
+
+    async def send_message(self, msg: EmailMessage) -> None:
+        reused = False
+        try:
+            async with self.connection() as (smtp, reused):
+                await smtp.send_message(msg)
+                return
+        except aiosmtplib.SMTPServerDisconnected:
+            if not reused:
+                raise
+        async with self.connection() as (smtp, _):
+            await smtp.send_message(msg)
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        for smtp, _ in idle:
+            await self._close(smtp)
+
+
+smtp_pool = SmtpPool(
+    size=settings.smtp_pool_size,
+    idle_timeout=settings.smtp_idle_timeout_seconds,
+)
+
+
+def build_message(to_email: str, subject: str, html_content: str, plain_text: str = None) -> EmailMessage:
     msg = EmailMessage()
-    from_name = getattr(request.app.state, "smtp_from_name", getattr(settings, "smtp_from_name", ""))
     from_addr = getattr(settings, "smtp_from", settings.smtp_user)
+    from_name = getattr(settings, "smtp_from_name", "")
 
     if from_name:
         msg["From"] = f"{from_name} <{from_addr}>"
@@ -28,51 +129,73 @@ async def send_email(
     msg["To"] = to_email
     msg["Subject"] = subject
 
-    if plain_text is None:
-        plain_text = "Please view this message in an HTML-capable client."
-
-    msg.set_content(plain_text)
+    msg.set_content(plain_text or PLAIN_TEXT_FALLBACK)
     msg.add_alternative(html_content, subtype="html")
+    return msg
 
 
+async def _deliver(payload: dict) -> None:
+    html_content = TEMPLATES[payload["template"]].render(**payload["context"])
+    msg = build_message(payload["to"], payload["subject"], html_content)
     try:
-        await request.app.state.smtp.send_message(msg)
-    except aiosmtplib.errors.SMTPServerDisconnected:
-        await request.app.state.smtp.connect()
-        await request.app.state.smtp.login(settings.smtp_user, settings.smtp_pass)
-        await request.app.state.smtp.send_message(msg)
+        await smtp_pool.send_message(msg)
+    except aiosmtplib.SMTPRecipientsRefused as e:
+        raise PermanentJobError(f"Recipient refused: {e.recipients}")
+    except aiosmtplib.SMTPResponseException as e:
+        # 5xx replies are final; 4xx ones are worth another attempt.
+        if e.code >= 500 and not isinstance(e, aiosmtplib.SMTPAuthenticationError):
+            raise PermanentJobError(f"SMTP error {e.code}: {e.message}")
+        raise
+    logger.info("Email '%s' sent to %s", payload["template"], _mask(payload["to"]))
 
-    # try:
-    #     request.app.state.smtp.send_message(msg)
-    #     logger.info("✅ Email sent to %s", to_email)
-    # except Exception as e:
-    #     logger.exception("❌ Failed to send email: %s", e)
-    #     raise
 
+def _mask(email: str) -> str:
+    name, _, domain = email.partition("@")
+    return f"{name[:2]}***@{domain}"
 
 
-async def send_password_reset_email(request: Request, to_email: str, reset_token: str):
-    subject = "بازیابی رمز عبور برای کوتاه کننده لینک"
-    # reset_url = f"{settings.frontend_url}/api/auth/reset-password?token={reset_token}"
-    reset_url = f"{settings.frontend_url}/pages/reset-password?token={reset_token}"
+def _summarize(payload: dict) -> dict:
+    # The context carries verification and reset tokens; keep them out of the outcome log.
+    return {"to": _mask(payload["to"]), "template": payload["template"]}
+
+
+email_queue = RedisJobQueue(
+    "email",
+    handler=_deliver,
+    concurrency=settings.email_queue_consumers,
+    max_attempts=settings.email_max_attempts,
+    base_backoff=settings.email_retry_backoff_seconds,
+    max_backoff=300,
+    summarize=_summarize,
+)
+
 
-    content = f"""
-    <p>سلام،</p>
-    <p>برای تنظیم مجدد رمز عبور خود روی لینک زیر کلیک کنید:</p>
-    <p><a href="{reset_url}">{reset_url}</a></p>
-    <p>اگر شما این درخواست را نداده‌اید، این ایمیل را نادیده بگیرید.</p>
+async def send_email(
+    redis_client: redis.Redis,
+    to_email: str,
+    subject: str,
+    template: str,
+    context: dict,
+    ttl: Optional[float] = None,
+) -> str:
     """
-    await send_email(request, to_email, subject, content)
+    Queues a templated email and returns the job id; it is rendered and sent
+    by the email workers. Mail not sent within `ttl` seconds is dropped.
+    """
+    return await email_queue.enqueue(
+        redis_client,
+        {"to": to_email, "subject": subject, "template": template, "context": context},
+        ttl=ttl,
+    )
+
 
+async def send_password_reset_email(redis_client: redis.Redis, to_email: str, reset_token: str, ttl: float):
+    subject = "بازیابی رمز عبور برای کوتاه کننده لینک"
+    reset_url = f"{settings.frontend_url}/pages/reset-password?token={reset_token}"
+    await send_email(redis_client, to_email, subject, "reset_password", {"reset_link": reset_url}, ttl=ttl)
 
-async def send_account_verification_email(request: Request, to_email: str, verification_token: str):
+
+async def send_account_verification_email(redis_client: redis.Redis, to_email: str, verification_token: str, ttl: float):
     subject = "فعال‌سازی حساب کاربری در کوتاه کننده لینک"
     verification_url = f"{settings.frontend_url}/pages/verify-email?token={verification_token}"
-
-    content = f"""
-    <p>سلام،</p>
-    <p>از ثبت‌نام شما در سرویس ما متشکریم! برای فعال‌سازی حساب خود روی لینک زیر کلیک کنید:</p>
-    <p><a href="{verification_url}">{verification_url}</a></p>
-    <p>این لینک تا ۲۴ ساعت آینده معتبر است.</p>
-    """
-    await send_email(request, to_email, subject, content)
\ No newline at end of file
+    await send_email(redis_client, to_email, subject, "verify_email", {"verify_url": verification_url}, ttl=ttl)
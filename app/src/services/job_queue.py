@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, List, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Moves jobs whose retry time has come from the delayed set back to the queue.
+PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying the job cannot succeed."""
+
+
+class RedisJobQueue:
+    """
+    A small reliable job queue on Redis lists, shared by all workers.
+
+    enqueue() pushes a JSON job and returns immediately. Each worker process
+    runs `concurrency` consumers that BLMOVE jobs into a per-process
+    processing list, so a job taken by a worker that dies is not lost. Live
+    processes heartbeat into a consumers sorted set; the list of one that
+    has not been seen for `heartbeat_timeout` seconds is pushed back onto
+    the queue. A job interrupted by shutdown stays in the list and is handed
+    back by stop().
+
+    A failing job is retried with exponential backoff through a delayed
+    sorted set, up to `max_attempts`; PermanentJobError and jobs past their
+    `expires_at` are not retried. Every final outcome is recorded in a
+    capped list and in per-queue counters (see outcomes() and stats());
+    `summarize` can strip secrets from the payload before it is recorded.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[dict], Awaitable[None]],
+        concurrency: int,
+        max_attempts: int,
+        base_backoff: float,
+        max_backoff: float,
+        outcome_history: int = 1000,
+        summarize: Optional[Callable[[dict], dict]] = None,
+        heartbeat_timeout: float = 30,
+    ):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.outcome_history = outcome_history
+        self.summarize = summarize
+        self.heartbeat_timeout = heartbeat_timeout
+
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self._redis: Optional[redis.Redis] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def queue_key(self) -> str:
+        return f"jobs:{self.name}"
+
+    @property
+    def delayed_key(self) -> str:
+        return f"jobs:{self.name}:delayed"
+
+    @property
+    def outcomes_key(self) -> str:
+        return f"jobs:{self.name}:outcomes"
+
+    @property
+    def stats_key(self) -> str:
+        return f"jobs:{self.name}:stats"
+
+    @property
+    def consumers_key(self) -> str:
+        return f"jobs:{self.name}:consumers"
+
+    def _processing_key(self, consumer: str) -> str:
+        return f"jobs:{self.name}:processing:{consumer}"
+
+    async def enqueue(self, redis_client: redis.Redis, payload: dict, ttl: Optional[float] = None) -> str:
+        """Queues a job; jobs with a `ttl` are dropped if not done within it."""
+        job = {
+            "id": uuid.uuid4().hex,
+            "payload": payload,
+            "attempts": 0,
+            "enqueued_at": time.time(),
+            "expires_at": time.time() + ttl if ttl else None,
+        }
+        await redis_client.lpush(self.queue_key, json.dumps(job))
+        return job["id"]
+
+    async def start(self, redis_client: redis.Redis) -> None:
+        self._redis = redis_client
+        try:
+            # Registered before taking jobs, so they can be recovered if this process dies.
+            await redis_client.zadd(self.consumers_key, {self.consumer: time.time()})
+        except RedisError as e:
+            logger.warning("Could not register %s consumer: %s", self.name, e)
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._redis is not None:
+            # Hand unfinished jobs back for other workers.
+            try:
+                while await self._redis.lmove(self._processing_key(self.consumer), self.queue_key, "RIGHT", "RIGHT"):
+                    pass
+                await self._redis.zrem(self.consumers_key, self.consumer)
+            except RedisError as e:
+                logger.warning("Could not requeue in-flight %s jobs: %s", self.name, e)
+
+    async def _consume(self) -> None:
+        processing_key = self._processing_key(self.consumer)
+        while True:
+            try:
+                raw = await self._redis.blmove(self.queue_key, processing_key, 5, "RIGHT", "LEFT")
+            except RedisError as e:
+                logger.warning("Job queue %s unavailable: %s", self.name, e)
+                await asyncio.sleep(1)
+                continue
+            if raw is None:
+                continue
+            # Cancellation (shutdown) propagates before the acknowledgement,
+            # leaving the job in the processing list for stop() to hand back.
+            try:
+                await self._run(raw)
+            except Exception:
+                logger.exception("Could not process %s job", self.name)
+            try:
+                await self._redis.lrem(processing_key, 1, raw)
+            except RedisError as e:
+                logger.warning("Could not acknowledge %s job: %s", self.name, e)
+
+    async def _run(self, raw: str) -> None:
+        job = json.loads(raw)
+        job["attempts"] += 1
+
+        if job.get("expires_at") and time.time() > job["expires_at"]:
+            await self._record(job, "expired")
+            return
+
+        try:
+            await self.handler(job["payload"])
+        except PermanentJobError as e:
+            await self._record(job, "failed", str(e))
+        except Exception as e:
+            if job["attempts"] >= self.max_attempts:
+                logger.warning("%s job %s failed after %d attempts: %s", self.name, job["id"], job["attempts"], e)
+                await self._record(job, "failed", str(e))
+                return
+            delay = min(self.base_backoff * 2 ** (job["attempts"] - 1), self.max_backoff)
+            job["last_error"] = str(e)
+            await self._redis.zadd(self.delayed_key, {json.dumps(job): time.time() + delay})
+            await self._redis.hincrby(self.stats_key, "retried", 1)
+        else:
+            await self._record(job, "sent")
+
+    async def _record(self, job: dict, outcome: str, error: Optional[str] = None) -> None:
+        entry = {
+            "id": job["id"],
+            "outcome": outcome,
+            "attempts": job["attempts"],
+            "error": error,
+            "at": time.time(),
+            "payload": self.summarize(job["payload"]) if self.summarize else job["payload"],
+        }
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.lpush(self.outcomes_key, json.dumps(entry))
+            pipe.ltrim(self.outcomes_key, 0, self.outcome_history - 1)
+            pipe.hincrby(self.stats_key, outcome, 1)
+            await pipe.execute()
+
+    async def _maintain(self) -> None:
+        """Heartbeat, promotion of due retries and recovery of dead workers' jobs."""
+        while True:
+            try:
+                await self._redis.zadd(self.consumers_key, {self.consumer: time.time()})
+                await self._redis.eval(PROMOTE_SCRIPT, 2, self.delayed_key, self.queue_key, time.time())
+                await self._recover_orphans()
+            except RedisError as e:
+                logger.warning("Job queue %s maintenance failed: %s", self.name, e)
+            await asyncio.sleep(1)
+
+    async def _recover_orphans(self) -> None:
+        dead = await self._redis.zrangebyscore(self.consumers_key, "-inf", time.time() - self.heartbeat_timeout)
+        for consumer in dead:
+            if consumer == self.consumer:
+                continue
+            recovered = 0
+            while await self._redis.lmove(self._processing_key(consumer), self.queue_key, "RIGHT", "RIGHT"):
+                recovered += 1
+            # A worker that was only paused registers itself again on its next heartbeat.
+            await self._redis.zrem(self.consumers_key, consumer)
+            if recovered:
+                logger.warning("Requeued %d %s jobs from stopped worker %s", recovered, self.name, consumer)
+
+    async def outcomes(self, redis_client: redis.Redis, limit: int = 100) -> List[dict]:
+        return [json.loads(raw) for raw in await redis_client.lrange(self.outcomes_key, 0, limit - 1)]
+
+    async def stats(self, redis_client: redis.Redis) -> dict:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.llen(self.queue_key)
+            pipe.zcard(self.delayed_key)
+            pipe.hgetall(self.stats_key)
+            queued, delayed, counters = await pipe.execute()
+        return {"queued": queued, "delayed": delayed, **{key: int(value) for key, value in counters.items()}}
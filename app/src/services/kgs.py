@@ -1,7 +1,52 @@
+import asyncio
+import logging
+import time
+from typing import List, Tuple
+
 import redis.asyncio as redis
+from redis.exceptions import RedisError
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+
+logger = logging.getLogger(__name__)
 
 BASE62_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE62_INDEX = {char: index for index, char in enumerate(BASE62_CHARS)}
 COUNTER_KEY = "kgs:unique_counter"
+FREE_RANGES_KEY = "kgs:free_ranges"
+SEQUENCE_NAME = "kgs_short_code_seq"
+SEQUENCE_LOCK_ID = 0x6B6773  # pg advisory lock guarding setval on the fallback sequence
+
+# Ids from here up (8-character codes) belong to the Postgres fallback; the
+# Redis counter stays below it, so the two sources never issue the same id.
+FALLBACK_ID_BASE = 62 ** 7
+FALLBACK_CODE_LENGTH = 8
+
+# Raises the counter to at least ARGV[1]; when it was missing or had fallen
+# behind, the free list may hold already issued ids, so it is dropped.
+RAISE_COUNTER_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+local floor = tonumber(ARGV[1])
+if not current or tonumber(current) < floor then
+    redis.call('SET', KEYS[1], floor)
+    redis.call('DEL', KEYS[2])
+    return floor
+end
+return tonumber(current)
+"""
+
+# Leases a block, refusing (-1) when the counter vanished, e.g. after a Redis restart.
+LEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+return redis.call('INCRBY', KEYS[1], ARGV[1])
+"""
 
 
 def to_base62(num: int) -> str:
@@ -15,9 +60,193 @@ def to_base62(num: int) -> str:
     return encoded
 
 
+def from_base62(code: str) -> int:
+    num = 0
+    for char in code:
+        num = num * 62 + BASE62_INDEX[char]
+    return num
+
+
+def highest_issued_code_query(fallback: bool = False):
+    """
+    The largest generated short code in `links` (custom aliases are skipped),
+    among codes from the Redis counter or, with `fallback`, among codes from
+    the Postgres sequence.
+
+    Base62 digits are in ASCII order, so for codes made only of them a longer
+    code is always larger and equal-length codes compare bytewise (COLLATE "C").
+    That is the order of ix_links_generated_code_order, so this reads the end
+    of the index instead of sorting the table.
+    """
+    code_length = func.length(models.Link.short_code)
+    return (
+        select(models.Link.short_code)
+        .where(~models.Link.is_custom)
+        .where(models.Link.short_code.regexp_match("^[0-9A-Za-z]+$"))
+        .where(code_length >= FALLBACK_CODE_LENGTH if fallback else code_length < FALLBACK_CODE_LENGTH)
+        .order_by(code_length.desc(), models.Link.short_code.collate("C").desc())
+        .limit(1)
+    )
+
+
+async def highest_issued_id(session: AsyncSession, fallback: bool = False) -> int:
+    """Decodes the code found by highest_issued_code_query, or 0 if there is none."""
+    result = await session.execute(highest_issued_code_query(fallback))
+    short_code = result.scalar_one_or_none()
+    return from_base62(short_code) if short_code else 0
+
+
+async def reseed_counter(redis_client: redis.Redis, margin: int = 0) -> int:
+    """
+    Makes sure the Redis counter is ahead of every short code already stored,
+    e.g. after Redis restarted without persistence. `margin` leaves room for
+    blocks that running workers leased before the counter was lost.
+    Returns the counter value.
+    """
+    async with async_session_factory() as session:
+        floor = await highest_issued_id(session) + margin
+    counter = await redis_client.eval(RAISE_COUNTER_SCRIPT, 2, COUNTER_KEY, FREE_RANGES_KEY, floor)
+    counter = int(counter)
+    if counter == floor and floor:
+        logger.info("KGS counter reseeded to %d from the links table", floor)
+    return counter
+
+
+class KeyRangeAllocator:
+    """
+    Hands out unique ids from blocks leased from the global Redis counter.
+
+    A block of `block_size` ids costs one INCRBY; ids inside it are handed out
+    locally with no network hop. On shutdown the unused tail of the current
+    block is pushed onto a shared free list, which is drained before the
+    counter is advanced again.
+
+    When Redis is unreachable, ids come from a Postgres sequence instead, and
+    Redis is retried after `retry_after` seconds. The sequence issues ids from
+    FALLBACK_ID_BASE up, a range the Redis counter never reaches, so workers
+    still leasing from Redis during the outage cannot hand out the same ids.
+    Once Redis is back the counter is reseeded before leasing again.
+    """
+
+    def __init__(self, block_size: int, retry_after: float = 10.0):
+        self.block_size = block_size
+        self.retry_after = retry_after
+        self._next = 1
+        self._end = 0
+        self._lock = asyncio.Lock()
+        self._redis_down_until = 0.0
+        self._degraded = False
+        self._sequence_synced = False
+
+    @property
+    def outstanding_margin(self) -> int:
+        return self.block_size * 16
+
+    @property
+    def remaining(self) -> int:
+        return self._end - self._next + 1
+
+    async def _lease_from_counter(self, redis_client: redis.Redis, size: int) -> Tuple[int, int]:
+        if self._degraded:
+            await reseed_counter(redis_client, margin=self.outstanding_margin)
+            self._degraded = False
+            self._sequence_synced = False
+
+        end = int(await redis_client.eval(LEASE_SCRIPT, 1, COUNTER_KEY, size))
+        if end < 0:
+            logger.warning("KGS counter missing from Redis, reseeding it from the links table")
+            await reseed_counter(redis_client, margin=self.outstanding_margin)
+            end = await redis_client.incrby(COUNTER_KEY, size)
+        return end - size + 1, end
+
+    async def _lease(self, redis_client: redis.Redis) -> Tuple[int, int]:
+        if not self._degraded:
+            returned = await redis_client.lpop(FREE_RANGES_KEY)
+            if returned:
+                start, end = returned.split(":")
+                return int(start), int(end)
+
+        return await self._lease_from_counter(redis_client, self.block_size)
+
+    def _redis_failed(self, error: Exception) -> None:
+        logger.warning("KGS falling back to the Postgres sequence: %s", error)
+        self._redis_down_until = time.monotonic() + self.retry_after
+        self._degraded = True
+
+    async def next_id(self, redis_client: redis.Redis) -> int:
+        if self.remaining <= 0:
+            async with self._lock:
+                if self.remaining <= 0:
+                    if time.monotonic() < self._redis_down_until:
+                        return (await self._ids_from_sequence(1))[0]
+                    try:
+                        self._next, self._end = await self._lease(redis_client)
+                    except (RedisError, OSError) as e:
+                        self._redis_failed(e)
+                        return (await self._ids_from_sequence(1))[0]
+
+        unique_id = self._next
+        self._next += 1
+        return unique_id
+
+    async def lease_ids(self, redis_client: redis.Redis, count: int) -> List[int]:
+        """
+        Leases `count` consecutive ids with a single INCRBY, bypassing the
+        worker's block. Meant for bulk creation.
+        """
+        if time.monotonic() >= self._redis_down_until:
+            try:
+                async with self._lock:
+                    start, end = await self._lease_from_counter(redis_client, count)
+                return list(range(start, end + 1))
+            except (RedisError, OSError) as e:
+                self._redis_failed(e)
+        return await self._ids_from_sequence(count)
+
+    async def _ids_from_sequence(self, count: int) -> List[int]:
+        async with async_session_factory() as session:
+            async with session.begin():
+                if not self._sequence_synced:
+                    await session.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": SEQUENCE_LOCK_ID})
+                    # Above codes issued by earlier outages, e.g. if the sequence was restored from a backup.
+                    floor = max(await highest_issued_id(session, fallback=True), FALLBACK_ID_BASE)
+                    await session.execute(
+                        text(f"SELECT setval('{SEQUENCE_NAME}', GREATEST(:floor, (SELECT last_value FROM {SEQUENCE_NAME})))"),
+                        {"floor": floor}
+                    )
+                    self._sequence_synced = True
+                result = await session.execute(
+                    text(f"SELECT nextval('{SEQUENCE_NAME}') FROM generate_series(1, :count)"),
+                    {"count": count}
+                )
+                return list(result.scalars())
+
+    async def release(self, redis_client: redis.Redis) -> None:
+        """Returns the unused part of the current block to the shared free list."""
+        if self.remaining <= 0:
+            return
+        try:
+            await redis_client.rpush(FREE_RANGES_KEY, f"{self._next}:{self._end}")
+        except Exception:
+            logger.exception("Could not return id range %d-%d", self._next, self._end)
+        self._next, self._end = 1, 0
+
+
+key_allocator = KeyRangeAllocator(block_size=settings.kgs_block_size)
+
+
 async def generate_unique_short_key(redis_client: redis.Redis) -> str:
     """
-    Increments a global counter and encodes it to a Base62 string.
+    Takes the next id from this worker's leased block and encodes it to a Base62 string.
+    """
+    unique_id = await key_allocator.next_id(redis_client)
+    return to_base62(unique_id)
+
+
+async def generate_unique_short_keys(redis_client: redis.Redis, count: int) -> List[str]:
+    """
+    Allocates `count` Base62 short codes from one freshly leased range.
     """
-    unique_id = await redis_client.incr(COUNTER_KEY)
-    return to_base62(unique_id)
\ No newline at end of file
+    if count <= 0:
+        return []
+    return [to_base62(unique_id) for unique_id in await key_allocator.lease_ids(redis_client, count)]
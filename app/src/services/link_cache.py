@@ -0,0 +1,172 @@
+import json
+import sys
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import redis.asyncio as redis
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+from .admission import FrequencySketch, adaptive_ttl
+from .cache_bus import cache_bus, publish
+from .edge_cache import refresh_edge_cache
+from .local_cache import LocalTTLCache
+from .singleflight import SingleFlight
+
+
+class CachedLink(NamedTuple):
+    long_url: str
+    redirect_type: int = 307
+    flagged: bool = False  # scan_status == FLAGGED; pending and clean links redirect alike
+
+    @classmethod
+    def from_row(cls, row) -> "CachedLink":
+        return cls(row.long_url, row.redirect_type, row.scan_status == models.ScanStatus.FLAGGED)
+
+    def dumps(self, cached_at: Optional[float] = None) -> str:
+        data = {"url": self.long_url, "status": self.redirect_type}
+        if self.flagged:
+            data["flagged"] = True
+        if cached_at is not None:
+            data["at"] = int(cached_at)
+        return json.dumps(data, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, raw: str) -> "CachedLink":
+        return cls.loads_entry(raw)[0]
+
+    @classmethod
+    def loads_entry(cls, raw: str) -> Tuple["CachedLink", Optional[int]]:
+        """Decodes a Redis entry into the link and when it was first cached, if recorded."""
+        # Entries written before redirect modes existed hold the bare URL.
+        if not raw.startswith("{"):
+            return cls(raw), None
+        data = json.loads(raw)
+        return cls(data["url"], data["status"], data.get("flagged", False)), data.get("at")
+
+
+def link_cache_key(short_code: str) -> str:
+    return f"link:{short_code}"
+
+
+def _entry_size(obj) -> int:
+    if isinstance(obj, CachedLink):
+        return sys.getsizeof(obj) + sys.getsizeof(obj.long_url)
+    return sys.getsizeof(obj)
+
+
+popularity = FrequencySketch(width=settings.link_popularity_sketch_width)
+
+
+def link_cache_ttl(short_code: str) -> int:
+    """
+    Redis TTL for a link based on its recent popularity in this worker.
+
+    Links below the admission threshold get the short cold TTL (0 means they
+    are not written to Redis at all); above it the TTL doubles with every
+    doubling of the observed frequency, up to the configured maximum.
+    """
+    return adaptive_ttl(
+        popularity.estimate(short_code),
+        threshold=settings.link_admission_threshold,
+        cold_ttl=settings.link_ttl_cold_seconds,
+        base_ttl=settings.link_ttl_base_seconds,
+        max_ttl=settings.link_ttl_max_seconds,
+    )
+
+
+def remaining_lifetime(cached_at: Optional[int], now: Optional[float] = None) -> int:
+    """
+    Seconds a Redis entry may still live. Extensions never take an entry past
+    `link_ttl_max_seconds` from when it was first cached, so a value that
+    missed an invalidation is still replaced from Postgres eventually.
+    Entries without a recorded time are not extended.
+    """
+    if cached_at is None:
+        return 0
+    now = time.time() if now is None else now
+    return max(0, int(cached_at + settings.link_ttl_max_seconds - now))
+
+
+def _admit_locally(candidate: str, victim: str) -> bool:
+    return popularity.estimate(candidate) > popularity.estimate(victim)
+
+
+local_link_cache = LocalTTLCache(
+    max_entries=settings.link_cache_max_entries,
+    max_bytes=settings.link_cache_max_bytes,
+    default_ttl=settings.link_cache_ttl_seconds,
+    sizeof=_entry_size,
+    admit=_admit_locally,
+)
+
+cache_bus.subscribe("link", local_link_cache.delete)
+cache_bus.on_reset(local_link_cache.clear)
+
+_miss_flights = SingleFlight()
+redis_admission_stats = {"cached": 0, "skipped": 0, "extended": 0}
+
+
+async def _load_link(redis_client: redis.Redis, short_code: str) -> Optional[CachedLink]:
+    cache_key = link_cache_key(short_code)
+    ttl = link_cache_ttl(short_code)
+
+    raw = await redis_client.get(cache_key)
+    if raw:
+        link, cached_at = CachedLink.loads_entry(raw)
+        if ttl > settings.link_ttl_cold_seconds:
+            # Hot links get their expiry pushed out, within the entry's total lifetime.
+            extension = min(ttl, remaining_lifetime(cached_at))
+            if extension > 0 and await redis_client.expire(cache_key, extension, gt=True):
+                redis_admission_stats["extended"] += 1
+        return link
+
+    async with async_session_factory() as session:
+        result = await session.execute(
+            select(models.Link.long_url, models.Link.redirect_type, models.Link.scan_status)
+            .where(models.Link.short_code == short_code)
+        )
+        row = result.one_or_none()
+
+    if row is None:
+        return None
+
+    link = CachedLink.from_row(row)
+    if ttl > 0:
+        await redis_client.set(cache_key, link.dumps(cached_at=time.time()), ex=ttl)
+        redis_admission_stats["cached"] += 1
+    else:
+        redis_admission_stats["skipped"] += 1
+    return link
+
+
+async def fetch_link(redis_client: redis.Redis, short_code: str) -> Optional[CachedLink]:
+    """
+    Resolves a short code through the local cache, Redis and finally Postgres.
+
+    Concurrent misses for the same code within a worker share one Redis read,
+    one database query and one cache write. Returns None for unknown codes.
+    """
+    popularity.increment(short_code)
+
+    link = local_link_cache.get(short_code)
+    if link is not None:
+        return link
+
+    link = await _miss_flights.do(short_code, lambda: _load_link(redis_client, short_code))
+    if link is not None:
+        local_link_cache.set(short_code, link)
+    return link
+
+
+async def invalidate_link(redis_client: redis.Redis, short_code: str) -> None:
+    """
+    Drops a link from Redis, from the local cache of every worker and from
+    the nginx microcache.
+    """
+    local_link_cache.delete(short_code)
+    await redis_client.delete(link_cache_key(short_code))
+    await publish(redis_client, "link", short_code)
+    refresh_edge_cache(short_code)
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import redis.asyncio as redis
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+from .link_cache import invalidate_link
+from .url_checker import scan_url
+
+logger = logging.getLogger(__name__)
+
+links_table = models.Link.__table__
+
+
+class LinkScanner:
+    """
+    Background malware scanning of links, so shortening never waits on Web Risk.
+
+    New links are stored as PENDING and redirect normally until scanned. Each
+    pass claims a batch by setting scan_claimed_until (FOR UPDATE SKIP LOCKED,
+    committed straight away), checks it with no transaction open, and writes
+    the verdicts only where the claim still holds. Every worker can run a
+    scanner without two of them checking the same link, and a worker that
+    dies mid-batch only delays it by `claim_timeout`. Links whose last scan
+    is older than `rescan_after` are re-checked in bulk when there is nothing
+    pending. A URL whose verdict is unknown (API down, circuit open) keeps
+    its current status and is retried on a later pass.
+
+    When a link becomes or stops being FLAGGED its cache entries are
+    invalidated, so the redirect path reads the new status with the link.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        concurrency: int,
+        poll_interval: float,
+        rescan_after: timedelta,
+        rescan_batch_size: int,
+        claim_timeout: timedelta,
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.rescan_after = rescan_after
+        self.rescan_batch_size = rescan_batch_size
+        self.claim_timeout = claim_timeout
+        self._redis: Optional[redis.Redis] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.scanned = 0
+        self.flagged = 0
+        self.unknown = 0
+
+    async def _verdicts(self, urls: List[str]) -> Dict[str, Optional[bool]]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(url: str) -> Optional[bool]:
+            async with semaphore:
+                try:
+                    return await scan_url(url)
+                except Exception:
+                    logger.exception("Failed to scan %s", url)
+                    return None
+
+        unique_urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(check(url) for url in unique_urls))
+        return dict(zip(unique_urls, results))
+
+    async def _claim(self, rescan: bool) -> list:
+        """Leases a batch to this worker in its own short transaction."""
+        unclaimed = (models.Link.scan_claimed_until.is_(None)) | (models.Link.scan_claimed_until < func.now())
+        query = select(models.Link.id).where(unclaimed)
+        if rescan:
+            stale_before = datetime.now(timezone.utc) - self.rescan_after
+            query = (
+                query.where(models.Link.scan_status != models.ScanStatus.PENDING)
+                .where((models.Link.scanned_at.is_(None)) | (models.Link.scanned_at < stale_before))
+                .order_by(models.Link.scanned_at.asc().nulls_first())
+                .limit(self.rescan_batch_size)
+            )
+        else:
+            query = (
+                query.where(models.Link.scan_status == models.ScanStatus.PENDING)
+                .order_by(models.Link.id)
+                .limit(self.batch_size)
+            )
+
+        async with async_session_factory() as session:
+            async with session.begin():
+                result = await session.execute(
+                    update(links_table)
+                    .where(links_table.c.id.in_(query.with_for_update(skip_locked=True).scalar_subquery()))
+                    # Bookkeeping only: leave updated_at as the owner last set it.
+                    .values(scan_claimed_until=func.now() + self.claim_timeout, updated_at=links_table.c.updated_at)
+                    .returning(
+                        links_table.c.id,
+                        links_table.c.short_code,
+                        links_table.c.long_url,
+                        links_table.c.scan_status,
+                        links_table.c.scan_claimed_until,
+                    )
+                )
+                return result.all()
+
+    async def scan_batch(self, rescan: bool = False) -> int:
+        """Scans one batch of pending (or stale) links; returns how many were claimed."""
+        rows = await self._claim(rescan)
+        if not rows:
+            return 0
+
+        # No transaction is open while Web Risk is called.
+        verdicts = await self._verdicts([row.long_url for row in rows])
+        now = datetime.now(timezone.utc)
+        updates = []
+        released = []
+        changed = []
+        for row in rows:
+            # Only written while this worker still holds the lease and the link
+            # still points at the URL that was checked.
+            claim = {"link_id": row.id, "claimed_until": row.scan_claimed_until, "checked_url": row.long_url}
+            verdict = verdicts[row.long_url]
+            if verdict is None:
+                self.unknown += 1
+                released.append(claim)
+                continue
+            status = models.ScanStatus.FLAGGED if verdict else models.ScanStatus.CLEAN
+            updates.append({**claim, "scan_status": status, "scanned_at": now})
+            if (status == models.ScanStatus.FLAGGED) != (row.scan_status == models.ScanStatus.FLAGGED):
+                changed.append(row.short_code)
+            if verdict:
+                self.flagged += 1
+
+        claimed = (
+            update(links_table)
+            .where(links_table.c.id == bindparam("link_id"))
+            .where(links_table.c.scan_claimed_until == bindparam("claimed_until"))
+            .where(links_table.c.long_url == bindparam("checked_url"))
+        )
+        async with async_session_factory() as session:
+            async with session.begin():
+                if updates:
+                    await session.execute(
+                        claimed.values(
+                            scan_status=bindparam("scan_status"),
+                            scanned_at=bindparam("scanned_at"),
+                            scan_claimed_until=None,
+                            updated_at=links_table.c.updated_at,
+                        ),
+                        updates,
+                    )
+                if released:
+                    # Retried on a later pass rather than when the lease runs out.
+                    await session.execute(
+                        claimed.values(scan_claimed_until=None, updated_at=links_table.c.updated_at), released
+                    )
+        self.scanned += len(updates)
+
+        for short_code in changed:
+            await invalidate_link(self._redis, short_code)
+        if changed:
+            logger.info("Scan status changed for %d links: %s", len(changed), ", ".join(changed[:20]))
+
+        # Nothing could be decided (API down): report an empty pass so the loop backs off.
+        return len(rows) if updates else 0
+
+    async def start(self, redis_client: redis.Redis) -> None:
+        self._redis = redis_client
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                claimed = await self.scan_batch()
+                if not claimed:
+                    claimed = await self.scan_batch(rescan=True)
+            except Exception:
+                logger.exception("Link scan pass failed")
+                claimed = 0
+            if not claimed:
+                await asyncio.sleep(self.poll_interval)
+
+    def stats(self) -> dict:
+        return {"scanned": self.scanned, "flagged": self.flagged, "unknown": self.unknown}
+
+
+link_scanner = LinkScanner(
+    batch_size=settings.scan_batch_size,
+    concurrency=settings.scan_concurrency,
+    poll_interval=settings.scan_poll_interval_seconds,
+    rescan_after=timedelta(days=settings.scan_rescan_after_days),
+    rescan_batch_size=settings.scan_rescan_batch_size,
+    claim_timeout=timedelta(seconds=settings.scan_claim_timeout_seconds),
+)
@@ -0,0 +1,117 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LocalTTLCache:
+    """
+    A bounded, in-process LRU cache with a per-entry TTL and an approximate memory cap.
+
+    Every gunicorn worker keeps its own instance, so entries must be cheap to rebuild
+    and invalidated explicitly (see cache_bus) when the source of truth changes.
+    An optional `admit(candidate, victim)` callback can refuse new keys once the
+    cache is full, protecting popular entries from one-off lookups.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        default_ttl: float,
+        sizeof: Callable[[Any], int] = sys.getsizeof,
+        admit: Optional[Callable[[Hashable, Hashable], bool]] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._sizeof = sizeof
+        self._admit = admit
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            self.delete(key)
+            return
+
+        size = self._sizeof(key) + self._sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+        elif self._admit is not None and self._is_full(size):
+            # TinyLFU-style admission: only displace the LRU victim for a more popular key.
+            victim = next(iter(self._entries))
+            if not self._admit(key, victim):
+                self.rejections += 1
+                return
+
+        self._entries[key] = (value, time.monotonic() + ttl, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "rejections": self.rejections,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _is_full(self, incoming_size: int) -> bool:
+        return bool(self._entries) and (
+            len(self._entries) >= self.max_entries or self._bytes + incoming_size > self.max_bytes
+        )
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
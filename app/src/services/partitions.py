@@ -0,0 +1,264 @@
+"""
+Monthly partitions of click_events: creation ahead of time and retention.
+
+Runs periodically in every worker; a session advisory lock makes sure only
+one of them does the work. It can also be run on its own:
+
+    python -m src.services.partitions
+"""
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date, datetime, time, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from ..config import settings
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "click_events"
+DEFAULT_PARTITION = "click_events_default"
+PARTITION_NAME = re.compile(r"^click_events_p(\d{4})_(\d{2})$")
+
+# pg advisory lock held for a whole maintenance run
+MAINTENANCE_LOCK_ID = 0x70617274
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"click_events_p{month:%Y_%m}"
+
+
+def partition_month(name: str) -> Optional[date]:
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def month_start(month: date) -> datetime:
+    return datetime.combine(month, time.min, tzinfo=timezone.utc)
+
+
+def _bound(month: date) -> str:
+    # Partition bounds are DDL, so they cannot be bind parameters.
+    return month_start(month).isoformat(sep=" ")
+
+
+class PartitionMaintainer:
+    """
+    Keeps click_events partitioned by month.
+
+    Each run creates the partitions for the current month and the next
+    `months_ahead`, so inserts never land in the default partition unless
+    maintenance has been stopped for months. If they did, the rows are
+    moved out when their month's partition is finally created.
+
+    With `retention_months` > 0, partitions whose month ended more than that
+    many months ago are detached, then dumped to `archive_dir` as gzipped
+    CSV ("archive") or dropped outright ("drop"). Old clicks are never
+    DELETEd. A partition that was detached but not yet archived (the run
+    was interrupted) is picked up again by the next run. Daily counts in
+    link_daily_clicks are kept, so link stats are not affected.
+    """
+
+    def __init__(
+        self,
+        months_ahead: int,
+        retention_months: int,
+        retention_action: str,
+        archive_dir: str,
+        interval: float,
+    ):
+        if retention_action not in ("archive", "drop"):
+            raise ValueError(f"Unknown click retention action: {retention_action}")
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.retention_action = retention_action
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _partitions(self, conn: AsyncConnection, attached: bool) -> List[str]:
+        if attached:
+            query = text(
+                """
+                SELECT c.relname FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = CAST(:parent AS regclass)
+                """
+            )
+        else:
+            query = text(
+                """
+                SELECT c.relname FROM pg_class c
+                WHERE c.relkind = 'r' AND c.relname LIKE 'click\\_events\\_p%'
+                AND c.relnamespace = (SELECT relnamespace FROM pg_class WHERE oid = CAST(:parent AS regclass))
+                AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)
+                """
+            )
+        result = await conn.execute(query, {"parent": PARENT_TABLE})
+        return [name for name in result.scalars() if partition_month(name)]
+
+    async def _create_partition(self, conn: AsyncConnection, month: date) -> None:
+        name, start, end = partition_name(month), _bound(month), _bound(add_months(month, 1))
+        bounds = {"start": month_start(month), "end": month_start(add_months(month, 1))}
+        stray = await conn.scalar(
+            text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end)"),
+            bounds,
+        )
+        if not stray:
+            await conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+            return
+
+        # Rows for this month already sit in the default partition: a partition
+        # covering them cannot be created while they are there, so move them.
+        await conn.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN ACCESS EXCLUSIVE MODE"))
+        await conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        await conn.execute(text(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end
+                RETURNING id, timestamp, link_id
+            )
+            INSERT INTO {name} (id, timestamp, link_id) SELECT id, timestamp, link_id FROM moved
+            """
+        ), bounds)
+        await conn.execute(text(
+            f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"
+        ))
+        logger.warning("Moved clicks for %s out of the default partition into %s", month, name)
+
+    async def ensure_partitions(self, conn: AsyncConnection) -> List[str]:
+        """Creates missing partitions up to `months_ahead`; returns their names."""
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        async with conn.begin():
+            existing = set(await self._partitions(conn, attached=True))
+        created = []
+        for offset in range(self.months_ahead + 1):
+            month = add_months(this_month, offset)
+            if partition_name(month) in existing:
+                continue
+            async with conn.begin():
+                await self._create_partition(conn, month)
+            created.append(partition_name(month))
+        return created
+
+    async def detach_expired(self, conn: AsyncConnection) -> List[str]:
+        """Detaches partitions past retention; returns their names."""
+        if self.retention_months <= 0:
+            return []
+        oldest_kept = add_months(datetime.now(timezone.utc).date().replace(day=1), -self.retention_months)
+        async with conn.begin():
+            attached = await self._partitions(conn, attached=True)
+        detached = []
+        for name in sorted(attached):
+            if partition_month(name) >= oldest_kept:
+                continue
+            async with conn.begin():
+                # DETACH needs a brief exclusive lock on click_events; give up
+                # rather than queue inserts behind a long-running query.
+                await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+                await conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            detached.append(name)
+        return detached
+
+    async def _archive(self, conn: AsyncConnection, name: str) -> str:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.csv.gz")
+        partial = f"{path}.partial"
+
+        raw = await conn.get_raw_connection()
+        archive = await asyncio.to_thread(gzip.open, partial, "wb")
+        try:
+            async def write(chunk: bytes) -> None:
+                await asyncio.to_thread(archive.write, chunk)
+
+            await raw.driver_connection.copy_from_table(
+                name, columns=["id", "timestamp", "link_id"], output=write, format="csv", header=True
+            )
+        finally:
+            await asyncio.to_thread(archive.close)
+        os.replace(partial, path)
+        return path
+
+    async def dispose_detached(self, conn: AsyncConnection) -> List[str]:
+        """Archives (if configured) and drops detached partitions; returns their names."""
+        async with conn.begin():
+            leftovers = await self._partitions(conn, attached=False)
+        disposed = []
+        for name in sorted(leftovers):
+            if self.retention_action == "archive":
+                async with conn.begin():
+                    path = await self._archive(conn, name)
+                logger.info("Archived click partition %s to %s", name, path)
+            async with conn.begin():
+                await conn.execute(text(f"DROP TABLE {name}"))
+            disposed.append(name)
+        return disposed
+
+    async def run_once(self) -> bool:
+        """One maintenance pass; returns False if another worker holds the lock."""
+        async with engine.connect() as conn:
+            locked = await conn.scalar(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": MAINTENANCE_LOCK_ID})
+            await conn.commit()
+            if not locked:
+                return False
+            try:
+                created = await self.ensure_partitions(conn)
+                detached = await self.detach_expired(conn)
+                disposed = await self.dispose_detached(conn)
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": MAINTENANCE_LOCK_ID})
+                await conn.commit()
+
+        if created or detached or disposed:
+            logger.info(
+                "Click partitions: created %s, detached %s, %s %s",
+                created, detached, "archived" if self.retention_action == "archive" else "dropped", disposed,
+            )
+        return True
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Click partition maintenance failed")
+            await asyncio.sleep(self.interval)
+
+
+partition_maintainer = PartitionMaintainer(
+    months_ahead=settings.click_partition_months_ahead,
+    retention_months=settings.click_retention_months,
+    retention_action=settings.click_retention_action,
+    archive_dir=settings.click_archive_dir,
+    interval=settings.partition_maintenance_interval_seconds,
+)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(partition_maintainer.run_once())
@@ -0,0 +1,156 @@
+import json
+import logging
+from dataclasses import asdict, dataclass
+from datetime import date
+from typing import Optional
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+from .cache_bus import cache_bus, publish
+from .local_cache import LocalTTLCache
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PlanSnapshot:
+    id: int
+    name: str
+    price: int
+    link_limit_per_month: int
+    duration_days: int
+
+
+@dataclass(frozen=True)
+class Principal:
+    """
+    Immutable snapshot of the authenticated user, as seen by get_current_user.
+
+    Carries what request handlers read (id, role, status, plan limits and
+    subscription) plus the profile fields of /auth/users/me, so it can be
+    returned wherever a UserResponse is expected. It is not an ORM object:
+    handlers that modify the user load it with get_current_db_user instead.
+    """
+
+    id: int
+    email: str
+    role: models.UserRole
+    is_active: bool
+    plan_id: Optional[int]
+    plan: Optional[PlanSnapshot]
+    subscription_end_date: Optional[date]
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    phone_number: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        plan = user.plan
+        return cls(
+            id=user.id,
+            email=user.email,
+            role=user.role,
+            is_active=user.is_active,
+            plan_id=user.plan_id,
+            plan=PlanSnapshot(plan.id, plan.name, plan.price, plan.link_limit_per_month, plan.duration_days) if plan else None,
+            subscription_end_date=user.subscription_end_date,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            phone_number=user.phone_number,
+        )
+
+    def dumps(self) -> str:
+        data = asdict(self)
+        data["role"] = self.role.value
+        if self.subscription_end_date:
+            data["subscription_end_date"] = self.subscription_end_date.isoformat()
+        return json.dumps(data, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, raw: str) -> "Principal":
+        data = json.loads(raw)
+        data["role"] = models.UserRole(data["role"])
+        if data["plan"]:
+            data["plan"] = PlanSnapshot(**data["plan"])
+        if data["subscription_end_date"]:
+            data["subscription_end_date"] = date.fromisoformat(data["subscription_end_date"])
+        return cls(**data)
+
+
+def principal_cache_key(subject: str) -> str:
+    return f"principal:{subject}"
+
+
+local_principal_cache = LocalTTLCache(
+    max_entries=settings.principal_cache_max_entries,
+    max_bytes=settings.principal_cache_max_entries * 1024,
+    default_ttl=settings.principal_cache_ttl_seconds,
+)
+
+cache_bus.subscribe("principal", local_principal_cache.delete)
+cache_bus.on_reset(local_principal_cache.clear)
+
+_principal_flights = SingleFlight()
+
+
+async def _load_principal(redis_client: redis.Redis, subject: str) -> Optional[Principal]:
+    cache_key = principal_cache_key(subject)
+    try:
+        raw = await redis_client.get(cache_key)
+    except RedisError as e:
+        logger.warning("Principal cache unavailable: %s", e)
+        raw = None
+    if raw:
+        return Principal.loads(raw)
+
+    async with async_session_factory() as session:
+        result = await session.execute(
+            select(models.User)
+            .options(selectinload(models.User.plan))
+            .where(models.User.email == subject)
+        )
+        user = result.scalar_one_or_none()
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+
+    try:
+        await redis_client.set(cache_key, principal.dumps(), ex=settings.principal_cache_ttl_seconds)
+    except RedisError as e:
+        logger.warning("Could not cache principal: %s", e)
+    return principal
+
+
+async def fetch_principal(redis_client: redis.Redis, subject: str) -> Optional[Principal]:
+    """
+    Resolves a token subject (the user's email) through the local cache,
+    Redis and finally Postgres. Returns None for unknown users.
+    """
+    principal = local_principal_cache.get(subject)
+    if principal is not None:
+        return principal
+
+    principal = await _principal_flights.do(subject, lambda: _load_principal(redis_client, subject))
+    if principal is not None:
+        local_principal_cache.set(subject, principal)
+    return principal
+
+
+async def invalidate_principal(redis_client: redis.Redis, subject: str) -> None:
+    """
+    Drops a user's cached principal in Redis and in every worker. Must be
+    called after any committed change to the fields a Principal carries.
+    """
+    local_principal_cache.delete(subject)
+    try:
+        await redis_client.delete(principal_cache_key(subject))
+        await publish(redis_client, "principal", subject)
+    except RedisError as e:
+        logger.warning("Could not invalidate principal of %s: %s", subject, e)
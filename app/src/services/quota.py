@@ -0,0 +1,143 @@
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory
+
+logger = logging.getLogger(__name__)
+
+# Sums the window's day buckets (KEYS, today first) and takes up to ARGV[2]
+# links from what is left of the limit ARGV[1] in today's bucket.
+# Returns {granted, used after granting}.
+RESERVE_SCRIPT = """
+local used = 0
+for _, value in ipairs(redis.call('MGET', unpack(KEYS))) do
+    if value then
+        used = used + tonumber(value)
+    end
+end
+local granted = math.min(tonumber(ARGV[2]), math.max(tonumber(ARGV[1]) - used, 0))
+if granted > 0 then
+    redis.call('INCRBY', KEYS[1], granted)
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {granted, used + granted}
+"""
+
+
+class LinkQuota:
+    """
+    Rolling per-user count of links created in the last `window_days` days.
+
+    Each user has one Redis counter per UTC day; checking and taking quota is
+    a single script call over the window's buckets instead of a COUNT(*) over
+    the user's links. The buckets are rebuilt from Postgres the first time a
+    user is seen and again every `reconcile_interval` seconds, which also
+    corrects drift from crashed requests. The window is counted in whole days.
+
+    If Redis is unreachable, usage is counted in Postgres as before.
+    """
+
+    def __init__(self, window_days: int, reconcile_interval: int):
+        self.window_days = window_days
+        self.reconcile_interval = reconcile_interval
+        self.bucket_ttl = (window_days + 1) * 86400
+
+    def _window_start(self) -> date:
+        return datetime.now(timezone.utc).date() - timedelta(days=self.window_days - 1)
+
+    def _bucket_key(self, user_id: int, day: date) -> str:
+        return f"quota:{user_id}:{day:%Y%m%d}"
+
+    def synced_key(self, user_id: int) -> str:
+        return f"quota:{user_id}:synced"
+
+    def bucket_keys(self, user_id: int) -> List[str]:
+        today = datetime.now(timezone.utc).date()
+        return [self._bucket_key(user_id, today - timedelta(days=i)) for i in range(self.window_days)]
+
+    async def _count_in_postgres(self, user_id: int) -> dict:
+        window_start = datetime.combine(self._window_start(), datetime.min.time(), tzinfo=timezone.utc)
+        day = func.date(func.timezone("UTC", models.Link.created_at))
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(day.label("day"), func.count(models.Link.id).label("links"))
+                .where(models.Link.owner_id == user_id)
+                .where(models.Link.created_at >= window_start)
+                .group_by(day)
+            )
+            return {row.day: row.links for row in result.all()}
+
+    async def _ensure_reconciled(self, redis_client: redis.Redis, user_id: int) -> None:
+        # Whoever sets the marker rebuilds the buckets; the marker's expiry schedules the next run.
+        if not await redis_client.set(self.synced_key(user_id), 1, nx=True, ex=self.reconcile_interval):
+            return
+
+        counts = await self._count_in_postgres(user_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(*self.bucket_keys(user_id))
+            for day, links in counts.items():
+                pipe.set(self._bucket_key(user_id, day), links, ex=self.bucket_ttl)
+            await pipe.execute()
+
+    async def reserve(self, redis_client: redis.Redis, user_id: int, limit: int, count: int = 1) -> int:
+        """
+        Takes up to `count` links from the user's remaining quota and returns
+        how many were granted. Unused grants must be handed back with release().
+        """
+        try:
+            await self._ensure_reconciled(redis_client, user_id)
+            granted, _ = await redis_client.eval(
+                RESERVE_SCRIPT, self.window_days, *self.bucket_keys(user_id), limit, count, self.bucket_ttl
+            )
+            return int(granted)
+        except (RedisError, OSError) as e:
+            logger.warning("Quota counters unavailable, counting links in Postgres: %s", e)
+            used = sum((await self._count_in_postgres(user_id)).values())
+            return min(count, max(limit - used, 0))
+
+    async def release(self, redis_client: redis.Redis, user_id: int, count: int = 1) -> None:
+        """Returns quota taken by reserve() for links that were not created."""
+        if count <= 0:
+            return
+        try:
+            await redis_client.decrby(self._bucket_key(user_id, datetime.now(timezone.utc).date()), count)
+        except (RedisError, OSError) as e:
+            logger.warning("Could not release %d quota for user %d: %s", count, user_id, e)
+
+    async def forget_link(self, redis_client: redis.Redis, user_id: Optional[int], created_at: Optional[datetime]) -> None:
+        """Frees the quota of a deleted link if it still counts towards the window."""
+        if user_id is None or created_at is None:
+            return
+        day = created_at.astimezone(timezone.utc).date()
+        if day < self._window_start():
+            return
+        try:
+            key = self._bucket_key(user_id, day)
+            if await redis_client.exists(key):
+                await redis_client.decrby(key, 1)
+        except (RedisError, OSError) as e:
+            logger.warning("Could not update quota for user %d: %s", user_id, e)
+
+    async def used(self, redis_client: redis.Redis, user_id: int) -> int:
+        """Number of links the user created within the window."""
+        try:
+            await self._ensure_reconciled(redis_client, user_id)
+            values = await redis_client.mget(self.bucket_keys(user_id))
+            return sum(int(value) for value in values if value)
+        except (RedisError, OSError) as e:
+            logger.warning("Quota counters unavailable, counting links in Postgres: %s", e)
+            return sum((await self._count_in_postgres(user_id)).values())
+
+
+link_quota = LinkQuota(
+    window_days=settings.quota_window_days,
+    reconcile_interval=settings.quota_reconcile_seconds,
+)
@@ -1,10 +1,12 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from pydantic import BaseModel
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -13,17 +15,56 @@ from sqlalchemy.orm import selectinload
 from .. import models
 from ..database import get_db
 from ..config import settings
+from .principal import Principal, fetch_principal
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes made with a different cost than BCRYPT_ROUNDS are flagged for rehashing.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds,
+)
 
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event
+# loop; the semaphore caps hashes in flight and bounds how long callers queue.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.password_hash_concurrency, thread_name_prefix="bcrypt")
+_hash_slots = asyncio.Semaphore(settings.password_hash_concurrency)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
 
+async def _run_hashing(fn, *args):
+    try:
+        # Cancels the acquire itself, not a wrapper task, so a permit granted just as
+        # the deadline passes is handed back by the semaphore instead of leaking.
+        async with asyncio.timeout(settings.password_hash_queue_timeout_seconds):
+            await _hash_slots.acquire()
+    except TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy. Please try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_slots.release()
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_hashing(pwd_context.verify, plain_password, hashed_password)
+
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifies a password and, if its hash uses outdated cost parameters,
+    returns a fresh hash to store in its place (None otherwise).
+    """
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+
+async def get_password_hash(password: str) -> str:
+    return await _run_hashing(pwd_context.hash, password)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -44,20 +85,43 @@ class TokenData(BaseModel):
     email: Optional[str] = None
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> models.User:
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _token_data(token: str) -> TokenData:
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
+            raise _credentials_exception()
+        return TokenData(email=email)
     except JWTError:
-        raise credentials_exception
+        raise _credentials_exception()
+
+
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)) -> Principal:
+    """
+    The authenticated user as a cached, read-only Principal; no database
+    query on a cache hit.
+    """
+    token_data = _token_data(token)
+    principal = await fetch_principal(request.app.state.redis, token_data.email)
+    if principal is None:
+        raise _credentials_exception()
+    return principal
+
+
+async def get_current_db_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> models.User:
+    """
+    The authenticated user loaded as an ORM object, for endpoints that modify
+    it. Such endpoints must call invalidate_principal after committing.
+    """
+    token_data = _token_data(token)
 
     query = (
         select(models.User)
@@ -68,11 +132,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     user = result.scalar_one_or_none()
 
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     return user
 
 
-def get_current_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     if current_user.role != models.UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -1,29 +1,119 @@
-import requests
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+import redis.asyncio as redis
 
 from ..config import settings
+from .job_queue import PermanentJobError, RedisJobQueue
+
+logger = logging.getLogger(__name__)
+
+# OTP codes live in Redis for this long; an SMS that cannot be sent in time is dropped.
+OTP_TTL_SECONDS = 120
+
+
+class SmsIrClient:
+    """
+    SMS.ir API client over one pooled HTTP connection pool.
+
+    The semaphore caps requests in flight to the provider from this worker,
+    whatever the number of queue consumers.
+    """
+
+    def __init__(self, api_url: str, api_key: str, max_concurrency: int):
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=self.api_url,
+            timeout=httpx.Timeout(settings.sms_timeout_seconds),
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "X-API-KEY": self.api_key,
+            },
+        )
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def send_verify(self, mobile: str, template_id: int, parameters: dict) -> dict:
+        """
+        Sends a template message. Raises PermanentJobError for requests the
+        provider rejects (4xx other than 429), and other errors for failures
+        worth retrying.
+        """
+        if self._client is None:
+            await self.start()
+
+        payload = {
+            "mobile": mobile,
+            "templateId": template_id,
+            "parameters": [{"name": name, "value": value} for name, value in parameters.items()],
+        }
+        async with self._slots:
+            response = await self._client.post("/send/verify", json=payload)
+
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise PermanentJobError(f"SMS.ir rejected the message ({response.status_code}): {response.text[:200]}")
+        response.raise_for_status()
+
+        data = response.json()
+        if data.get("status") != 1:
+            raise PermanentJobError(f"SMS.ir error {data.get('status')}: {data.get('message')}")
+        return data
+
+
+sms_client = SmsIrClient(
+    api_url=settings.sms_ir_api_url,
+    api_key=settings.sms_ir_api_key,
+    max_concurrency=settings.sms_max_concurrency,
+)
+
+
+async def _deliver(payload: dict) -> None:
+    data = await sms_client.send_verify(payload["mobile"], payload["template_id"], payload["parameters"])
+    logger.info("SMS to %s sent, message id %s", _mask(payload["mobile"]), data.get("data", {}).get("messageId"))
+
+
+def _mask(mobile: str) -> str:
+    return mobile[:4] + "*" * max(len(mobile) - 6, 0) + mobile[-2:]
+
+
+def _summarize(payload: dict) -> dict:
+    # Never store OTP codes in the outcome log.
+    return {"mobile": _mask(payload["mobile"]), "template_id": payload["template_id"]}
+
+
+sms_queue = RedisJobQueue(
+    "sms",
+    handler=_deliver,
+    concurrency=settings.sms_queue_consumers,
+    max_attempts=settings.sms_max_attempts,
+    base_backoff=settings.sms_retry_backoff_seconds,
+    max_backoff=30,
+    summarize=_summarize,
+)
 
 
-def send_otp(mobile: str, code: str):
-
-    API_KEY = settings.sms_ir_api_key
-    TEMPLATE_ID = 996765  # شناسه قالب تأیید شده
-    # MOBILE = '09033135876'  # شماره گیرنده
-    OTP_CODE = code
-
-    url = 'https://api.sms.ir/v1/send/verify'
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-        'X-API-KEY': API_KEY
-    }
-    payload = {
-        'mobile': mobile,
-        'templateId': settings.sms_ir_verify_template_id,
-        'parameters': [
-            {'name': 'code', 'value': OTP_CODE}
-        ]
-    }
-
-    response = requests.post(url, json=payload, headers=headers)
-    print(response.status_code)
-    print(response.json())
+async def send_otp(redis_client: redis.Redis, mobile: str, code: str) -> str:
+    """
+    Queues an OTP SMS and returns the job id; delivery happens in the
+    background and is given up once the code itself has expired.
+    """
+    return await sms_queue.enqueue(
+        redis_client,
+        {
+            "mobile": mobile,
+            "template_id": settings.sms_ir_verify_template_id,
+            "parameters": {"code": code},
+        },
+        ttl=OTP_TTL_SECONDS,
+    )
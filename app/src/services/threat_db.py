@@ -0,0 +1,460 @@
+import asyncio
+import base64
+import bisect
+import hashlib
+import heapq
+import ipaddress
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime, timezone
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Dict, FrozenSet, List, Optional
+from urllib.parse import unquote_to_bytes
+
+from .local_cache import LocalTTLCache
+
+if TYPE_CHECKING:
+    from .url_checker import WebRiskChecker
+
+logger = logging.getLogger(__name__)
+
+# Full-hash answers without an expiry from the API are kept this long.
+DEFAULT_FULL_HASH_TTL = 300
+
+
+class ThreatListError(Exception):
+    pass
+
+
+# --- URL canonicalization and expressions (Safe Browsing / Web Risk rules) ---
+
+def _unescape(value: str) -> bytes:
+    raw = value.encode("utf-8", "surrogateescape")
+    while True:
+        unescaped = unquote_to_bytes(raw)
+        if unescaped == raw:
+            return raw
+        raw = unescaped
+
+
+def _escape(raw: bytes) -> str:
+    return "".join(
+        chr(byte) if 0x20 < byte < 0x7F and byte not in (0x23, 0x25) else f"%{byte:02X}"
+        for byte in raw
+    )
+
+
+def _parse_ipv4(host: str) -> Optional[str]:
+    """Normalizes decimal, octal, hex and shortened IPv4 forms to a dotted quad."""
+    parts = host.split(".")
+    if not 1 <= len(parts) <= 4:
+        return None
+    numbers = []
+    for part in parts:
+        try:
+            if part.lower().startswith("0x"):
+                numbers.append(int(part[2:] or "0", 16))
+            elif len(part) > 1 and part.startswith("0"):
+                numbers.append(int(part, 8))
+            else:
+                numbers.append(int(part, 10))
+        except ValueError:
+            return None
+
+    *leading, last = numbers
+    if any(number > 255 for number in leading) or last >= 256 ** (5 - len(numbers)):
+        return None
+    value = last
+    for index, number in enumerate(leading):
+        value += number << (24 - 8 * index)
+    return str(ipaddress.IPv4Address(value))
+
+
+def _canonical_host(host: str) -> str:
+    # Lowercase ASCII only; other bytes are percent-escaped later.
+    host = re.sub(r"\.+", ".", host.strip(".")).encode("latin-1").lower().decode("latin-1")
+    if host.startswith("[") and host.endswith("]"):
+        return host
+    return _parse_ipv4(host) or host
+
+
+def _canonical_path(path: str) -> str:
+    segments = []
+    for segment in re.sub(r"/+", "/", path).split("/")[1:]:
+        if segment == "..":
+            if segments:
+                segments.pop()
+        elif segment != ".":
+            segments.append(segment)
+    canonical = "/" + "/".join(segments)
+    # "/a/." and "/a/.." still name directories
+    if path.endswith(("/", "/.", "/..")) and not canonical.endswith("/"):
+        canonical += "/"
+    return canonical
+
+
+def canonicalize(url: str) -> Optional[tuple]:
+    """
+    Returns the canonical (host, path, query) of a URL, or None if it has no
+    host. query is None when the URL has no "?".
+    """
+    url = re.sub(r"[\t\r\n]", "", url.strip()).split("#", 1)[0]
+    url = _unescape(url).decode("latin-1")
+
+    if "://" not in url:
+        url = "http://" + url
+    rest = url.split("://", 1)[1]
+
+    authority_end = len(rest)
+    for separator in "/?":
+        position = rest.find(separator)
+        if position != -1:
+            authority_end = min(authority_end, position)
+    authority, rest = rest[:authority_end], rest[authority_end:]
+
+    host = authority.rsplit("@", 1)[-1]
+    if re.search(r":\d*$", host):
+        host = host.rsplit(":", 1)[0]
+    host = _canonical_host(host)
+    if not host:
+        return None
+
+    path, query = rest, None
+    if "?" in rest:
+        path, query = rest.split("?", 1)
+    path = _canonical_path(path or "/")
+
+    to_bytes = lambda value: value.encode("latin-1")
+    return (
+        _escape(to_bytes(host)),
+        _escape(to_bytes(path)),
+        None if query is None else _escape(to_bytes(query)),
+    )
+
+
+def url_expressions(url: str) -> List[str]:
+    """
+    The host-suffix / path-prefix expressions whose hashes are looked up for
+    a URL: at most 5 hosts times 6 paths.
+    """
+    canonical = canonicalize(url)
+    if canonical is None:
+        return []
+    host, path, query = canonical
+
+    hosts = [host]
+    is_ip = _parse_ipv4(host) == host or host.startswith("[")
+    if not is_ip:
+        components = host.split(".")
+        hosts += [".".join(components[i:]) for i in range(max(1, len(components) - 5), len(components) - 1)]
+
+    paths = []
+    if query is not None:
+        paths.append(f"{path}?{query}")
+    paths.append(path)
+    directories = path.split("/")[1:-1]
+    paths.append("/")
+    for depth in range(1, min(len(directories), 3) + 1):
+        paths.append("/" + "/".join(directories[:depth]) + "/")
+
+    expressions = []
+    for candidate_host in hosts:
+        for candidate_path in paths:
+            expression = candidate_host + candidate_path
+            if expression not in expressions:
+                expressions.append(expression)
+    return expressions
+
+
+# --- Local prefix lists ---
+
+class PrefixTable(Sequence):
+    """A sorted run of fixed-width hash prefixes packed into one bytes object."""
+
+    def __init__(self, width: int, blob: bytes = b""):
+        self.width = width
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.blob) // self.width
+
+    def __getitem__(self, index: int) -> bytes:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start = index * self.width
+        return self.blob[start:start + self.width]
+
+    def __contains__(self, prefix: bytes) -> bool:
+        index = bisect.bisect_left(self, prefix)
+        return index < len(self) and self[index] == prefix
+
+
+class ThreatList:
+    """
+    The local copy of one threat list: its version token and the hash
+    prefixes, grouped by width into sorted packed tables.
+    """
+
+    def __init__(self, threat_type: str):
+        self.threat_type = threat_type
+        self.version_token = ""
+        self.tables: Dict[int, PrefixTable] = {}
+        self.next_diff_at = 0.0
+
+    def __len__(self) -> int:
+        return sum(len(table) for table in self.tables.values())
+
+    def match(self, full_hash: bytes) -> Optional[bytes]:
+        for width, table in self.tables.items():
+            prefix = full_hash[:width]
+            if prefix in table:
+                return prefix
+        return None
+
+    def sorted_prefixes(self) -> List[bytes]:
+        return list(heapq.merge(*self.tables.values()))
+
+    def _set_prefixes(self, prefixes: List[bytes]) -> None:
+        by_width: Dict[int, List[bytes]] = {}
+        for prefix in prefixes:
+            by_width.setdefault(len(prefix), []).append(prefix)
+        self.tables = {width: PrefixTable(width, b"".join(group)) for width, group in sorted(by_width.items())}
+
+    def apply_diff(self, diff: dict) -> None:
+        """
+        Applies a computeDiff response. Removal indices refer to the old list
+        in lexicographic order; the result must match the response checksum.
+        """
+        prefixes = [] if diff.get("responseType") == "RESET" else self.sorted_prefixes()
+
+        removals = set(diff.get("removals", {}).get("rawIndices", {}).get("indices", []))
+        if removals:
+            prefixes = [prefix for index, prefix in enumerate(prefixes) if index not in removals]
+
+        for entry in diff.get("additions", {}).get("rawHashes", []):
+            width = entry["prefixSize"]
+            raw = base64.b64decode(entry.get("rawHashes", ""))
+            prefixes.extend(raw[i:i + width] for i in range(0, len(raw), width))
+        prefixes.sort()
+
+        expected = base64.b64decode(diff.get("checksum", {}).get("sha256", ""))
+        if hashlib.sha256(b"".join(prefixes)).digest() != expected:
+            raise ThreatListError(f"checksum mismatch for {self.threat_type}")
+
+        self._set_prefixes(prefixes)
+        self.version_token = diff.get("newVersionToken", "")
+
+    def save(self, path: str) -> None:
+        header = {
+            "version_token": self.version_token,
+            "widths": {str(width): len(table) for width, table in self.tables.items()},
+        }
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            for table in self.tables.values():
+                f.write(table.blob)
+        os.replace(temporary, path)
+
+    def load(self, path: str) -> bool:
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                tables = {}
+                for width, count in header["widths"].items():
+                    width = int(width)
+                    blob = f.read(width * count)
+                    if len(blob) != width * count:
+                        raise ThreatListError(f"truncated threat list file {path}")
+                    tables[width] = PrefixTable(width, blob)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError, ThreatListError) as e:
+            logger.warning("Ignoring unreadable threat list file %s: %s", path, e)
+            return False
+
+        self.tables = tables
+        self.version_token = header["version_token"]
+        return True
+
+
+def _seconds_until(timestamp: Optional[str]) -> float:
+    if not timestamp:
+        return DEFAULT_FULL_HASH_TTL
+    # RFC 3339 with up to nanosecond precision, e.g. 2026-10-18T12:00:00.123456789Z
+    match = re.match(r"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?", timestamp)
+    if not match:
+        return DEFAULT_FULL_HASH_TTL
+    expires = datetime.fromisoformat(match.group(1)).replace(tzinfo=timezone.utc)
+    return max((expires - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class ThreatDatabase:
+    """
+    Offline URL screening against local copies of the Web Risk threat lists
+    (the Update API model).
+
+    Each list is a sorted set of SHA-256 hash prefixes refreshed from
+    computeDiff by a background task and persisted under `directory`, so
+    workers start from disk and only fetch a diff. A URL's expressions are
+    hashed locally; only when one matches a prefix is hashes:search asked for
+    the full hashes behind it, and those answers are cached until the expiry
+    the API gives. Most URLs are screened with no network call at all.
+
+    is_malicious() returns None until every list has been loaded, or when a
+    prefix match could not be confirmed, so callers can fall back to the
+    lookup API.
+    """
+
+    def __init__(
+        self,
+        checker: "WebRiskChecker",
+        threat_types: List[str],
+        directory: str,
+        min_refresh_interval: float,
+        diff_timeout: float = 30.0,
+    ):
+        self.checker = checker
+        self.lists = {threat_type: ThreatList(threat_type) for threat_type in threat_types}
+        self.directory = directory
+        self.min_refresh_interval = min_refresh_interval
+        self.diff_timeout = diff_timeout
+        self.full_hashes = LocalTTLCache(max_entries=10000, max_bytes=4 * 1024 * 1024, default_ttl=DEFAULT_FULL_HASH_TTL)
+        self._task: Optional[asyncio.Task] = None
+
+        self.local_clean = 0
+        self.prefix_matches = 0
+        self.confirmed = 0
+
+    @property
+    def ready(self) -> bool:
+        return all(threat_list.version_token for threat_list in self.lists.values())
+
+    def _path(self, threat_type: str) -> str:
+        return os.path.join(self.directory, f"{threat_type.lower()}.prefixes")
+
+    async def refresh(self, threat_list: ThreatList) -> None:
+        params = {"threatType": threat_list.threat_type, "constraints.supportedCompressions": "RAW"}
+        if threat_list.version_token:
+            params["versionToken"] = threat_list.version_token
+
+        diff = await self.checker.api_get(
+            "/threatLists:computeDiff", params, timeout=self.diff_timeout, use_breaker=False
+        )
+        if diff is None:
+            threat_list.next_diff_at = time.time() + self.min_refresh_interval
+            return
+
+        try:
+            await asyncio.to_thread(threat_list.apply_diff, diff)
+        except ThreatListError as e:
+            # Start over with a full RESET on the next refresh.
+            logger.warning("Discarding threat list: %s", e)
+            threat_list.version_token = ""
+            threat_list.next_diff_at = time.time()
+            return
+
+        recommended = _seconds_until(diff.get("recommendedNextDiff")) if diff.get("recommendedNextDiff") else 0
+        threat_list.next_diff_at = time.time() + max(recommended, self.min_refresh_interval)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            await asyncio.to_thread(threat_list.save, self._path(threat_list.threat_type))
+        except OSError as e:
+            logger.warning("Could not persist threat list %s: %s", threat_list.threat_type, e)
+
+        logger.info(
+            "Threat list %s updated (%s): %d prefixes",
+            threat_list.threat_type, diff.get("responseType", "DIFF"), len(threat_list)
+        )
+
+    async def start(self) -> None:
+        for threat_type, threat_list in self.lists.items():
+            if await asyncio.to_thread(threat_list.load, self._path(threat_type)):
+                logger.info("Threat list %s loaded from disk: %d prefixes", threat_type, len(threat_list))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            for threat_list in self.lists.values():
+                if time.time() >= threat_list.next_diff_at:
+                    try:
+                        await self.refresh(threat_list)
+                    except Exception:
+                        logger.exception("Failed to refresh threat list %s", threat_list.threat_type)
+                        threat_list.next_diff_at = time.time() + self.min_refresh_interval
+            next_diff_at = min(threat_list.next_diff_at for threat_list in self.lists.values())
+            await asyncio.sleep(min(max(next_diff_at - time.time(), 1), self.min_refresh_interval))
+
+    async def _full_hashes_for(self, prefix: bytes) -> Optional[FrozenSet[bytes]]:
+        cached = self.full_hashes.get(prefix)
+        if cached is not None:
+            return cached
+
+        response = await self.checker.api_get(
+            "/hashes:search",
+            {"hashPrefix": base64.b64encode(prefix).decode(), "threatTypes": list(self.lists)},
+        )
+        if response is None:
+            return None
+
+        threats = response.get("threats", [])
+        full_hashes = frozenset(base64.b64decode(threat["hash"]) for threat in threats)
+        if threats:
+            ttl = min(_seconds_until(threat.get("expireTime")) for threat in threats)
+        else:
+            ttl = _seconds_until(response.get("negativeExpireTime"))
+        if ttl > 0:
+            self.full_hashes.set(prefix, full_hashes, ttl)
+        return full_hashes
+
+    async def is_malicious(self, url: str) -> Optional[bool]:
+        if not self.ready:
+            return None
+
+        candidates: Dict[bytes, List[bytes]] = {}
+        for expression in url_expressions(url):
+            full_hash = hashlib.sha256(expression.encode("latin-1")).digest()
+            for threat_list in self.lists.values():
+                prefix = threat_list.match(full_hash)
+                if prefix is not None:
+                    candidates.setdefault(prefix, []).append(full_hash)
+
+        if not candidates:
+            self.local_clean += 1
+            return False
+
+        self.prefix_matches += 1
+        unconfirmed = False
+        for prefix, full_hashes in candidates.items():
+            threats = await self._full_hashes_for(prefix)
+            if threats is None:
+                unconfirmed = True
+            elif any(full_hash in threats for full_hash in full_hashes):
+                self.confirmed += 1
+                return True
+        # A prefix hit that could not be confirmed is left to the caller.
+        return None if unconfirmed else False
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "lists": {threat_type: len(threat_list) for threat_type, threat_list in self.lists.items()},
+            "local_clean": self.local_clean,
+            "prefix_matches": self.prefix_matches,
+            "confirmed": self.confirmed,
+            "full_hash_cache": self.full_hashes.stats(),
+        }
@@ -1,32 +1,206 @@
+import logging
+from typing import Optional
+from urllib.parse import urlsplit
+
 import httpx
-from ..database import settings
+import redis.asyncio as redis
+from redis.exceptions import RedisError
 
-GOOGLE_API_KEY = settings.google_api_key
-WEB_RISK_API_URL = f"https://webrisk.googleapis.com/v1/uris:search?key={GOOGLE_API_KEY}"
+from ..config import settings
+from .circuit_breaker import CircuitBreaker
+from .local_cache import LocalTTLCache
+from .threat_db import ThreatDatabase
+from .url_hash import normalize_url, url_hash
 
+logger = logging.getLogger(__name__)
 
-async def is_url_malicious(url: str) -> bool:
+THREAT_TYPES = ["MALWARE", "SOCIAL_ENGINEERING", "UNWANTED_SOFTWARE"]
+
+MALICIOUS = "1"
+CLEAN = "0"
+
+
+def host_root(url: str) -> str:
+    parts = urlsplit(normalize_url(url))
+    return f"{parts.scheme}://{parts.netloc}/"
+
+
+class WebRiskChecker:
     """
-    Checks if a URL is flagged as malicious by the Google Web Risk API.
+    Google Web Risk lookups over one pooled HTTP client.
+
+    Verdicts are cached per normalized URL in a local LRU and in Redis, so a
+    popular destination is checked once per TTL across all workers. A clean
+    verdict for one URL says nothing about other paths on its host, but a
+    threat on the host root covers every URL on it: when a URL is flagged its
+    host root is checked too, and flagged hosts are cached so later URLs on
+    them are rejected without a call.
+
+    Timeouts and errors count towards a circuit breaker; while it is open,
+    or on any failure, the verdict is unknown (None).
     """
-    if not GOOGLE_API_KEY:
-        print("WARNING: GOOGLE_API_KEY is not set. Skipping malware check.")
-        return False
 
-    body = {
-        "uri": url,
-        "threatTypes": ["MALWARE", "SOCIAL_ENGINEERING", "UNWANTED_SOFTWARE"]
-    }
+    def __init__(self, api_url: str, api_key: str):
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.web_risk_breaker_failures,
+            reset_timeout=settings.web_risk_breaker_reset_seconds,
+        )
+        self.local_verdicts = LocalTTLCache(
+            max_entries=settings.web_risk_cache_max_entries,
+            max_bytes=settings.web_risk_cache_max_entries * 256,
+            default_ttl=settings.web_risk_clean_ttl_seconds,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._redis: Optional[redis.Redis] = None
+        self.api_calls = 0
+
+    async def start(self, redis_client: Optional[redis.Redis] = None) -> None:
+        if not self.api_key:
+            logger.warning("GOOGLE_API_KEY is not set; URLs will not be checked for malware")
+        self._redis = redis_client
+        self._client = httpx.AsyncClient(
+            base_url=self.api_url,
+            timeout=httpx.Timeout(settings.web_risk_timeout_seconds, connect=settings.web_risk_connect_timeout_seconds),
+            limits=httpx.Limits(
+                max_connections=settings.web_risk_max_connections,
+                max_keepalive_connections=settings.web_risk_max_connections,
+            ),
+        )
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _cached(self, key: str) -> Optional[str]:
+        verdict = self.local_verdicts.get(key)
+        if verdict is not None or self._redis is None:
+            return verdict
+        try:
+            verdict = await self._redis.get(key)
+        except RedisError as e:
+            logger.warning("Could not read Web Risk verdict cache: %s", e)
+            return None
+        if verdict is not None:
+            self.local_verdicts.set(key, verdict)
+        return verdict
+
+    async def _remember(self, key: str, verdict: str) -> None:
+        ttl = settings.web_risk_threat_ttl_seconds if verdict == MALICIOUS else settings.web_risk_clean_ttl_seconds
+        self.local_verdicts.set(key, verdict, ttl)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(key, verdict, ex=ttl)
+        except RedisError as e:
+            logger.warning("Could not write Web Risk verdict cache: %s", e)
+
+    async def api_get(
+            self,
+            path: str,
+            params: dict,
+            timeout: Optional[float] = None,
+            use_breaker: bool = True
+    ) -> Optional[dict]:
+        """GETs a Web Risk endpoint; None if the breaker is open or the call failed."""
+        # Only the half-open trial call holds the breaker's trial slot.
+        trial = use_breaker and self.breaker.state == "half-open"
+        if use_breaker and not self.breaker.allow():
+            return None
 
-    async with httpx.AsyncClient() as client:
         try:
-            response = await client.post(WEB_RISK_API_URL, json=body)
+            if self._client is None:
+                await self.start(self._redis)
+
+            self.api_calls += 1
+            response = await self._client.get(
+                path,
+                params={**params, "key": self.api_key},
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+            )
             response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            # Anything unexpected counts too, or the breaker would never open for it.
+            if use_breaker:
+                self.breaker.record_failure()
+            logger.warning("Error calling Web Risk API %s: %s", path, e)
+            return None
+        finally:
+            # Settled above unless the call was cancelled.
+            if trial:
+                self.breaker.release()
+
+        if use_breaker:
+            self.breaker.record_success()
+        return data
 
-            if response.json().get("threat"):
-                return True
-        except httpx.HTTPStatusError as e:
-            print(f"Error checking URL with Web Risk API: {e}")
-            return False
+    async def _search(self, url: str) -> Optional[bool]:
+        """Asks the API about one URL; None if it could not be asked."""
+        data = await self.api_get("/uris:search", {"uri": url, "threatTypes": THREAT_TYPES})
+        return None if data is None else bool(data.get("threat"))
 
-    return False
\ No newline at end of file
+    async def verdict(self, url: str) -> Optional[bool]:
+        host_key = f"webrisk:host:{url_hash(host_root(url))}"
+        if await self._cached(host_key) == MALICIOUS:
+            return True
+
+        url_key = f"webrisk:url:{url_hash(url)}"
+        verdict = await self._cached(url_key)
+        if verdict is not None:
+            return verdict == MALICIOUS
+
+        threat = await self._search(url)
+        if threat is None:
+            return None
+        await self._remember(url_key, MALICIOUS if threat else CLEAN)
+
+        if threat:
+            root = host_root(url)
+            if normalize_url(url) == root or await self._search(root):
+                await self._remember(host_key, MALICIOUS)
+        return threat
+
+    def stats(self) -> dict:
+        return {
+            "api_calls": self.api_calls,
+            "breaker": self.breaker.stats(),
+            "local_cache": self.local_verdicts.stats(),
+        }
+
+
+web_risk = WebRiskChecker(settings.web_risk_api_url, settings.google_api_key)
+
+threat_db = ThreatDatabase(
+    web_risk,
+    threat_types=THREAT_TYPES,
+    directory=settings.threat_db_dir,
+    min_refresh_interval=settings.threat_db_min_refresh_seconds,
+)
+
+
+async def scan_url(url: str) -> Optional[bool]:
+    """
+    Checks a URL against Google Web Risk. Returns None when no verdict could
+    be obtained (API unavailable or circuit open).
+    """
+    if not web_risk.api_key:
+        # Logged once when the checker starts.
+        return False
+
+    if settings.web_risk_mode == "local":
+        verdict = await threat_db.is_malicious(url)
+        if verdict is not None:
+            return verdict
+
+    return await web_risk.verdict(url)
+
+
+async def is_url_malicious(url: str) -> bool:
+    """
+    Checks if a URL is flagged as malicious by the Google Web Risk API.
+    Fails open: an unknown verdict counts as clean.
+    """
+    return bool(await scan_url(url))
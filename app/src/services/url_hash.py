@@ -0,0 +1,36 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Canonical form used for destination matching: lowercase scheme and host,
+    no default port, "/" for an empty path and no fragment. Path and query
+    are kept as-is since they may be case-sensitive.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if ":" in host:
+        host = f"[{host}]"
+
+    netloc = host
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parts.port}"
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
+def url_hash(url: str) -> int:
+    """
+    First 8 bytes of the SHA-256 of the normalized URL as a signed 64-bit
+    integer, so it fits a Postgres BIGINT. Equal hashes are only a candidate
+    match; callers compare the URLs themselves.
+    """
+    digest = hashlib.sha256(normalize_url(url).encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
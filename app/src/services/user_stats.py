@@ -0,0 +1,259 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from .. import models
+from ..config import settings
+from ..database import async_session_factory, engine
+from .quota import link_quota
+
+logger = logging.getLogger(__name__)
+
+user_stats_table = models.UserStats.__table__
+
+# Applies a delta to a mirrored user's totals; a user without a mirror is
+# loaded from Postgres on the next read instead.
+MIRROR_ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBY', KEYS[1], 'links', ARGV[1])
+    redis.call('HINCRBY', KEYS[1], 'clicks', ARGV[2])
+end
+"""
+
+# Rebuilds the totals of users in [lo, hi) from links, zeroing users who no
+# longer have any; returns the users whose totals were wrong.
+RECONCILE_SQL = text(
+    """
+    WITH actual AS (
+        SELECT owner_id AS user_id, COUNT(*) AS total_links, COALESCE(SUM(clicks), 0) AS total_clicks
+        FROM links
+        WHERE owner_id >= :lo AND owner_id < :hi
+        GROUP BY owner_id
+    ),
+    expected AS (
+        SELECT user_id, total_links, total_clicks FROM actual
+        UNION ALL
+        SELECT s.user_id, 0, 0 FROM user_stats s
+        WHERE s.user_id >= :lo AND s.user_id < :hi
+        AND NOT EXISTS (SELECT 1 FROM actual a WHERE a.user_id = s.user_id)
+    )
+    INSERT INTO user_stats (user_id, total_links, total_clicks)
+    SELECT user_id, total_links, total_clicks FROM expected ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET total_links = EXCLUDED.total_links, total_clicks = EXCLUDED.total_clicks, updated_at = now()
+    WHERE user_stats.total_links IS DISTINCT FROM EXCLUDED.total_links
+    OR user_stats.total_clicks IS DISTINCT FROM EXCLUDED.total_clicks
+    RETURNING user_id
+    """
+)
+
+# pg advisory lock held for a whole reconciliation run
+RECONCILE_LOCK_ID = 0x75737461
+
+
+class UserStatsCounters:
+    """
+    Per-user dashboard totals (links and clicks) kept in user_stats.
+
+    Writers change the counters in the transaction that creates or deletes
+    links (add()) or records clicks (add_clicks()), and adjust the Redis
+    mirror `user_stats:{id}` after committing (mirror_add()). Readers get
+    the totals and the quota window's usage in one Redis round trip; a
+    missing mirror is loaded from Postgres and expires after `cache_ttl`.
+
+    A background job rebuilds the counters from links every
+    `reconcile_interval` seconds, in batches of user ids. It locks a
+    batch's rows before counting, so writers of those users wait for it and
+    then apply their change on top of the corrected value.
+    """
+
+    def __init__(self, cache_ttl: int, reconcile_interval: float, reconcile_batch: int):
+        self.cache_ttl = cache_ttl
+        self.reconcile_interval = reconcile_interval
+        self.reconcile_batch = reconcile_batch
+        self._task: Optional[asyncio.Task] = None
+        self._redis: Optional[redis.Redis] = None
+
+    @staticmethod
+    def cache_key(user_id: int) -> str:
+        return f"user_stats:{user_id}"
+
+    async def add(self, session: AsyncSession, user_id: Optional[int], links: int, clicks: int = 0) -> None:
+        """Adds to a user's totals inside the caller's transaction."""
+        if user_id is None or not (links or clicks):
+            return
+        stmt = pg_insert(user_stats_table).values(user_id=user_id, total_links=links, total_clicks=clicks)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[user_stats_table.c.user_id],
+                set_={
+                    "total_links": user_stats_table.c.total_links + stmt.excluded.total_links,
+                    "total_clicks": user_stats_table.c.total_clicks + stmt.excluded.total_clicks,
+                    "updated_at": func.now(),
+                },
+            )
+        )
+
+    async def add_clicks(self, session: AsyncSession, clicks: Dict[int, int]) -> None:
+        """Adds click deltas for several users inside the caller's transaction."""
+        if not clicks:
+            return
+        stmt = pg_insert(user_stats_table).values([
+            {"user_id": user_id, "total_links": 0, "total_clicks": delta}
+            # Sorted so concurrent flushes lock rows in the same order.
+            for user_id, delta in sorted(clicks.items())
+        ])
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[user_stats_table.c.user_id],
+                set_={
+                    "total_clicks": user_stats_table.c.total_clicks + stmt.excluded.total_clicks,
+                    "updated_at": func.now(),
+                },
+            )
+        )
+
+    async def mirror_add(self, redis_client: redis.Redis, deltas: Dict[int, Tuple[int, int]]) -> None:
+        """Applies committed (links, clicks) deltas per user to the Redis mirror."""
+        deltas = {user_id: delta for user_id, delta in deltas.items() if user_id is not None}
+        if not deltas:
+            return
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for user_id, (links, clicks) in deltas.items():
+                    pipe.eval(MIRROR_ADD_SCRIPT, 1, self.cache_key(user_id), links, clicks)
+                await pipe.execute()
+        except RedisError as e:
+            # The mirror is rebuilt on expiry or by the next reconciliation.
+            logger.warning("Could not update the user stats mirror: %s", e)
+
+    async def forget(self, redis_client: redis.Redis, user_id: int) -> None:
+        try:
+            await redis_client.delete(self.cache_key(user_id))
+        except RedisError as e:
+            logger.warning("Could not drop the user stats mirror of %d: %s", user_id, e)
+
+    async def _load(self, redis_client: Optional[redis.Redis], user_id: int) -> Tuple[int, int]:
+        async with async_session_factory() as session:
+            row = (await session.execute(
+                select(models.UserStats.total_links, models.UserStats.total_clicks)
+                .where(models.UserStats.user_id == user_id)
+            )).one_or_none()
+        totals = (row.total_links, row.total_clicks) if row else (0, 0)
+
+        if redis_client is not None:
+            try:
+                async with redis_client.pipeline(transaction=True) as pipe:
+                    pipe.hset(self.cache_key(user_id), mapping={"links": totals[0], "clicks": totals[1]})
+                    pipe.expire(self.cache_key(user_id), self.cache_ttl)
+                    await pipe.execute()
+            except RedisError as e:
+                logger.warning("Could not cache user stats: %s", e)
+        return totals
+
+    async def dashboard(self, redis_client: redis.Redis, user_id: int) -> Dict[str, int]:
+        """Returns total_links, total_clicks and links_this_period for a user."""
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hgetall(self.cache_key(user_id))
+                pipe.exists(link_quota.synced_key(user_id))
+                pipe.mget(link_quota.bucket_keys(user_id))
+                cached, synced, buckets = await pipe.execute()
+        except RedisError as e:
+            logger.warning("User stats mirror unavailable, reading Postgres: %s", e)
+            total_links, total_clicks = await self._load(None, user_id)
+            return {
+                "total_links": total_links,
+                "total_clicks": total_clicks,
+                "links_this_period": await link_quota.used(redis_client, user_id),
+            }
+
+        if cached:
+            total_links, total_clicks = int(cached["links"]), int(cached["clicks"])
+        else:
+            total_links, total_clicks = await self._load(redis_client, user_id)
+
+        if synced:
+            links_this_period = sum(int(value) for value in buckets if value)
+        else:
+            # Due for its periodic rebuild from Postgres.
+            links_this_period = await link_quota.used(redis_client, user_id)
+
+        return {"total_links": total_links, "total_clicks": total_clicks, "links_this_period": links_this_period}
+
+    async def _reconcile_batch(self, lo: int, hi: int) -> list:
+        async with async_session_factory() as session:
+            async with session.begin():
+                await session.execute(
+                    select(models.UserStats.user_id)
+                    .where(models.UserStats.user_id >= lo, models.UserStats.user_id < hi)
+                    .order_by(models.UserStats.user_id)
+                    .with_for_update()
+                )
+                result = await session.execute(RECONCILE_SQL, {"lo": lo, "hi": hi})
+                return list(result.scalars())
+
+    async def reconcile(self) -> Optional[int]:
+        """
+        Rebuilds every user's totals from links; returns how many users were
+        corrected, or None if another worker is already reconciling.
+        """
+        async with engine.connect() as conn:
+            locked = await conn.scalar(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": RECONCILE_LOCK_ID})
+            await conn.commit()
+            if not locked:
+                return None
+            try:
+                async with async_session_factory() as session:
+                    max_user_id = await session.scalar(select(func.max(models.User.id))) or 0
+
+                corrected = []
+                for lo in range(0, max_user_id + 1, self.reconcile_batch):
+                    corrected.extend(await self._reconcile_batch(lo, lo + self.reconcile_batch))
+            finally:
+                await conn.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": RECONCILE_LOCK_ID})
+                await conn.commit()
+
+        if corrected and self._redis is not None:
+            try:
+                await self._redis.delete(*(self.cache_key(user_id) for user_id in corrected))
+            except RedisError as e:
+                logger.warning("Could not drop corrected user stats mirrors: %s", e)
+        if corrected:
+            logger.info("Corrected dashboard totals of %d users", len(corrected))
+        return len(corrected)
+
+    async def start(self, redis_client: redis.Redis) -> None:
+        self._redis = redis_client
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("User stats reconciliation failed")
+
+
+user_stats = UserStatsCounters(
+    cache_ttl=settings.user_stats_cache_ttl_seconds,
+    reconcile_interval=settings.user_stats_reconcile_interval_seconds,
+    reconcile_batch=settings.user_stats_reconcile_batch_size,
+)
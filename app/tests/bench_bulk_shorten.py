@@ -0,0 +1,66 @@
+"""
+Load benchmark for POST /api/links/shorten/bulk: shortens `--total` URLs (10k by
+default) in batches of `--batch` against a running server and reports the
+latency of each request and the overall throughput.
+
+    python tests/bench_bulk_shorten.py --base-url http://localhost:8000 --token <jwt>
+
+Use an account whose plan allows that many links; every run creates them.
+The endpoint is rate limited to 10 requests a minute per user, so keep
+total / batch at 10 or below.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--total", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=2)
+    args = parser.parse_args()
+
+    run = uuid.uuid4().hex[:8]
+    batches = [
+        [{"long_url": f"https://example.com/bench/{run}/{i}"} for i in range(start, min(start + args.batch, args.total))]
+        for start in range(0, args.total, args.batch)
+    ]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    created = failed = 0
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url, headers={"Authorization": f"Bearer {args.token}"}, timeout=120
+    ) as client:
+        async def send(items: list) -> None:
+            nonlocal created, failed
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/api/links/shorten/bulk", json={"items": items})
+                latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+            body = response.json()
+            created += body["created"]
+            failed += body["failed"]
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(items) for items in batches))
+        elapsed = time.perf_counter() - started
+
+    print(f"{args.total} URLs in {len(batches)} requests: {elapsed:.2f}s, {args.total / elapsed:.0f} URLs/s")
+    print(f"created {created}, failed {failed}")
+    print(
+        f"request latency: median {statistics.median(latencies) * 1000:.0f} ms, "
+        f"max {max(latencies) * 1000:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Load test for redirect caching: replays Zipf-distributed clicks from
+`--browsers` simulated browsers through nginx and reports where each click
+was answered:
+
+- browser: a fresh cached redirect (the browser honours Cache-Control
+  max-age, so the request is never sent);
+- nginx: X-Cache-Status HIT, STALE or UPDATING from the microcache;
+- app: everything else (MISS, EXPIRED, BYPASS, or no header).
+
+    python tests/bench_edge_cache.py --base-url https://l1s.ir --codes-file codes.txt
+
+`--codes-file` lists existing short codes one per line, most popular first;
+give some links each redirect mode to compare them. The test runs for
+`--duration` seconds at about `--rate` clicks a second.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import re
+import time
+from collections import Counter
+
+import httpx
+
+NGINX_HITS = {"HIT", "STALE", "UPDATING"}
+MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class Browser:
+    """Caches redirects for as long as their Cache-Control allows."""
+
+    def __init__(self):
+        self.cache = {}
+
+    def cached(self, short_code: str, now: float) -> bool:
+        return self.cache.get(short_code, 0) > now
+
+    def store(self, short_code: str, response: httpx.Response, now: float) -> None:
+        cache_control = response.headers.get("cache-control", "")
+        match = MAX_AGE.search(cache_control)
+        if response.is_redirect and match and "no-store" not in cache_control:
+            self.cache[short_code] = now + int(match.group(1))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", required=True)
+    parser.add_argument("--codes-file", required=True)
+    parser.add_argument("--browsers", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=200)
+    parser.add_argument("--duration", type=float, default=300)
+    parser.add_argument("--zipf", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with open(args.codes_file) as codes_file:
+        codes = [line.strip() for line in codes_file if line.strip()]
+    rng = random.Random(args.seed)
+    weights = list(itertools.accumulate(1 / rank ** args.zipf for rank in range(1, len(codes) + 1)))
+    browsers = [Browser() for _ in range(args.browsers)]
+    answered = Counter()
+    by_mode = Counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.base_url, follow_redirects=False, timeout=10) as client:
+        async def click(browser: Browser, short_code: str) -> None:
+            async with semaphore:
+                response = await client.get(f"/{short_code}")
+            status = response.headers.get("x-cache-status", "")
+            answered["nginx" if status in NGINX_HITS else "app"] += 1
+            by_mode[(response.status_code, "nginx" if status in NGINX_HITS else "app")] += 1
+            browser.store(short_code, response, time.monotonic())
+
+        tasks = []
+        started = time.monotonic()
+        sent = 0
+        while (now := time.monotonic()) - started < args.duration:
+            browser = rng.choice(browsers)
+            short_code = rng.choices(codes, cum_weights=weights)[0]
+            sent += 1
+            if browser.cached(short_code, now):
+                answered["browser"] += 1
+            else:
+                tasks.append(asyncio.create_task(click(browser, short_code)))
+            await asyncio.sleep(max(0.0, started + sent / args.rate - time.monotonic()))
+        await asyncio.gather(*tasks)
+
+    total = sum(answered.values())
+    print(f"{total} clicks from {args.browsers} browsers over {len(codes)} links")
+    for where in ("browser", "nginx", "app"):
+        print(f"  {where:>7}: {answered[where]:8d}  {answered[where] / max(total, 1):6.1%}")
+    print("requests sent, by status:")
+    for (status_code, where), count in sorted(by_mode.items()):
+        print(f"  {status_code} via {where}: {count}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
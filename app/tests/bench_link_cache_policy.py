@@ -0,0 +1,171 @@
+"""
+Replays a redirect workload against two policies for link:{code} keys in
+Redis and reports the Redis hit ratio, the database queries left over and the
+memory the keys hold:
+
+- fixed: every miss is cached for `--fixed-ttl` seconds (the old 3600s policy);
+- adaptive: the per-worker popularity sketch decides the TTL, hot hits extend
+  it (EXPIRE GT) but never past `--max-ttl` from when the entry was cached.
+
+Both run in simulated time, so no Redis or database is needed:
+
+    python tests/bench_link_cache_policy.py --links 200000 --requests 2000000
+    python tests/bench_link_cache_policy.py --log clicks.txt
+
+`--log` replays a file of "<unix time> <short code>" lines (e.g. cut from the
+nginx access log); otherwise a Zipf-distributed day of traffic is generated.
+Each worker keeps its 60s local cache in front of Redis, as in production.
+Memory is estimated at `--entry-bytes` per key.
+"""
+import argparse
+import heapq
+import itertools
+import random
+import sys
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.services.admission import FrequencySketch, adaptive_ttl  # noqa: E402
+
+
+def generated_workload(links: int, requests: int, duration: float, exponent: float, seed: int) -> List[Tuple[float, str]]:
+    rng = random.Random(seed)
+    weights = itertools.accumulate(1 / rank ** exponent for rank in range(1, links + 1))
+    codes = rng.choices([f"c{rank}" for rank in range(links)], cum_weights=list(weights), k=requests)
+    times = sorted(rng.uniform(0, duration) for _ in range(requests))
+    return list(zip(times, codes))
+
+
+def logged_workload(path: str) -> Iterator[Tuple[float, str]]:
+    with open(path) as log:
+        for line in log:
+            timestamp, short_code = line.split()[:2]
+            yield float(timestamp), short_code
+
+
+class SimulatedRedis:
+    """link:{code} keys with expiry, and the key-seconds they were held for."""
+
+    def __init__(self):
+        self.expires = {}
+        self.cached_at = {}
+        self._expiry_heap = []
+        self.clock = 0.0
+        self.key_seconds = 0.0
+        self.peak_keys = 0
+
+    def advance(self, now: float) -> None:
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, short_code = heapq.heappop(self._expiry_heap)
+            if self.expires.get(short_code) == expires_at:
+                self._account(expires_at)
+                del self.expires[short_code], self.cached_at[short_code]
+        self._account(now)
+
+    def _account(self, now: float) -> None:
+        self.key_seconds += len(self.expires) * (now - self.clock)
+        self.clock = now
+
+    def get(self, short_code: str) -> bool:
+        return short_code in self.expires
+
+    def set(self, short_code: str, ttl: int) -> None:
+        self.cached_at[short_code] = self.clock
+        self._expire_at(short_code, self.clock + ttl)
+        self.peak_keys = max(self.peak_keys, len(self.expires))
+
+    def extend(self, short_code: str, ttl: int) -> None:
+        if self.clock + ttl > self.expires[short_code]:
+            self._expire_at(short_code, self.clock + ttl)
+
+    def _expire_at(self, short_code: str, expires_at: float) -> None:
+        self.expires[short_code] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, short_code))
+
+
+def replay(workload, args, adaptive: bool) -> dict:
+    redis = SimulatedRedis()
+    local_caches = [{} for _ in range(args.workers)]
+    sketches = [FrequencySketch(width=args.sketch_width) for _ in range(args.workers)]
+    rng = random.Random(args.seed)
+    lookups = hits = queries = 0
+    start = None
+
+    for now, short_code in workload:
+        start = now if start is None else start
+        worker = rng.randrange(args.workers)
+        sketches[worker].increment(short_code)
+        local = local_caches[worker]
+        if local.get(short_code, -1) > now:
+            continue
+
+        redis.advance(now)
+        lookups += 1
+        ttl = args.fixed_ttl
+        if adaptive:
+            ttl = adaptive_ttl(
+                sketches[worker].estimate(short_code),
+                threshold=args.threshold, cold_ttl=args.cold_ttl, base_ttl=args.base_ttl, max_ttl=args.max_ttl,
+            )
+
+        if redis.get(short_code):
+            hits += 1
+            if adaptive and ttl > args.cold_ttl:
+                extension = min(ttl, int(redis.cached_at[short_code] + args.max_ttl - now))
+                if extension > 0:
+                    redis.extend(short_code, extension)
+        else:
+            queries += 1
+            if ttl > 0:
+                redis.set(short_code, ttl)
+        local[short_code] = now + args.local_ttl
+
+    elapsed = max(redis.clock - (start or 0), 1)
+    return {
+        "lookups": lookups,
+        "hit_ratio": hits / max(lookups, 1),
+        "db_queries": queries,
+        "avg_keys": redis.key_seconds / elapsed,
+        "peak_keys": redis.peak_keys,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--log")
+    parser.add_argument("--links", type=int, default=200000)
+    parser.add_argument("--requests", type=int, default=2000000)
+    parser.add_argument("--duration", type=float, default=86400)
+    parser.add_argument("--zipf", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--local-ttl", type=int, default=60)
+    parser.add_argument("--fixed-ttl", type=int, default=3600)
+    parser.add_argument("--sketch-width", type=int, default=65536)
+    parser.add_argument("--threshold", type=int, default=2)
+    parser.add_argument("--cold-ttl", type=int, default=60)
+    parser.add_argument("--base-ttl", type=int, default=900)
+    parser.add_argument("--max-ttl", type=int, default=86400)
+    parser.add_argument("--entry-bytes", type=int, default=160)
+    args = parser.parse_args()
+
+    if args.log:
+        workload = list(logged_workload(args.log))
+    else:
+        workload = generated_workload(args.links, args.requests, args.duration, args.zipf, args.seed)
+
+    print(f"{len(workload)} redirects, {len({code for _, code in workload})} distinct links, {args.workers} workers")
+    for name, adaptive in (("fixed", False), ("adaptive", True)):
+        result = replay(workload, args, adaptive)
+        print(
+            f"{name:>8}: Redis hit ratio {result['hit_ratio']:.1%} of {result['lookups']} lookups, "
+            f"{result['db_queries']} DB queries, "
+            f"keys avg {result['avg_keys']:.0f} / peak {result['peak_keys']} "
+            f"(~{result['avg_keys'] * args.entry_bytes / 2 ** 20:.1f} / {result['peak_keys'] * args.entry_bytes / 2 ** 20:.1f} MiB)"
+        )
+
+
+if __name__ == "__main__":
+    main()
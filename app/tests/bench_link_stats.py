@@ -0,0 +1,161 @@
+"""
+Latency of the link stats query on a synthetic click_events table: the old
+GROUP BY over the last 7 days of raw clicks against the link_daily_clicks
+rollup the endpoint reads now.
+
+Run from app/ with the app's environment, DATABASE_URL pointing at a scratch
+database. `--load` drops and recreates its tables, fills click_events with
+`--events` clicks (50M by default) spread over `--days` days, and builds the
+rollup with the backfill in services/click_rollup.py; later runs reuse them:
+
+    python tests/bench_link_stats.py --load
+    python tests/bench_link_stats.py --runs 50
+
+One link gets `--hot-share` of all clicks (the "millions of clicks" case);
+the rest go to `--links` other links at random.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncConnection  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+
+from src import models  # noqa: E402
+from src.database import engine  # noqa: E402
+from src.services.click_rollup import reconcile_daily_clicks  # noqa: E402
+from src.services.partitions import DEFAULT_PARTITION, PartitionMaintainer, add_months  # noqa: E402
+
+HOT_LINK_ID = 1
+LOAD_CHUNK = 5_000_000
+
+# get_link_stats before the rollup
+RAW_STATS_SQL = text(
+    """
+    SELECT
+        (timestamp AT TIME ZONE 'UTC')::date AS date,
+        COUNT(id) AS clicks
+    FROM click_events
+    WHERE link_id = :link_id AND timestamp >= :start_date
+    GROUP BY date
+    ORDER BY date
+    """
+)
+
+
+def rollup_stats_query(link_id: int, start: datetime):
+    return (
+        select(models.LinkDailyClicks.day, models.LinkDailyClicks.clicks)
+        .where(models.LinkDailyClicks.link_id == link_id, models.LinkDailyClicks.day >= start.date())
+    )
+
+
+async def load(events: int, links: int, days: int, hot_share: float) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.drop_all)
+        await conn.run_sync(models.Base.metadata.create_all)
+        await conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF click_events DEFAULT"))
+        await conn.execute(text(
+            """
+            INSERT INTO links (id, long_url, url_hash, short_code, clicks)
+            SELECT i, 'https://example.com/' || i, i, 'b' || i, 0 FROM generate_series(1, :links) AS i
+            """
+        ), {"links": links + 1})
+
+    now = datetime.now(timezone.utc)
+    first_month = (now - timedelta(days=days)).date().replace(day=1)
+    maintainer = PartitionMaintainer(months_ahead=1, retention_months=0, retention_action="drop", archive_dir="", interval=60)
+    async with engine.connect() as conn:
+        month = first_month
+        while month < now.date().replace(day=1):
+            async with conn.begin():
+                await maintainer._create_partition(conn, month)
+            month = add_months(month, 1)
+        await maintainer.ensure_partitions(conn)
+
+    # In time order, as the click buffer writes them.
+    span = timedelta(days=days).total_seconds()
+    started = time.perf_counter()
+    for offset in range(0, events, LOAD_CHUNK):
+        count = min(LOAD_CHUNK, events - offset)
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                """
+                INSERT INTO click_events (link_id, timestamp)
+                SELECT CASE WHEN random() < :hot_share THEN :hot_link ELSE 2 + floor(random() * :links)::bigint END,
+                       CAST(:start AS timestamptz) + make_interval(secs => (:offset + i) * CAST(:step AS float8))
+                FROM generate_series(0, :count - 1) AS i
+                """
+            ), {
+                "hot_share": hot_share, "hot_link": HOT_LINK_ID, "links": links, "count": count, "offset": offset,
+                "start": now - timedelta(days=days), "step": span / events,
+            })
+        print(f"loaded {offset + count} clicks ({time.perf_counter() - started:.0f}s)", flush=True)
+
+    started = time.perf_counter()
+    rows = await reconcile_daily_clicks(None)
+    print(f"rollup backfill: {rows} rows in {time.perf_counter() - started:.0f}s", flush=True)
+
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE click_events"))
+        await conn.execute(text("VACUUM ANALYZE link_daily_clicks"))
+
+
+async def timed(conn: AsyncConnection, statement, params: dict, runs: int) -> List[float]:
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        (await conn.execute(statement, params)).all()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def summary(latencies: List[float]) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[max(int(len(ordered) * 0.95) - 1, 0)]
+    return f"first {latencies[0] * 1000:9.1f} ms  median {statistics.median(ordered) * 1000:9.1f} ms  p95 {p95 * 1000:9.1f} ms"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--load", action="store_true")
+    parser.add_argument("--events", type=int, default=50_000_000)
+    parser.add_argument("--links", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--hot-share", type=float, default=0.1)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    try:
+        if args.load:
+            await load(args.events, args.links, args.days, args.hot_share)
+
+        start = (datetime.now(timezone.utc) - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
+        async with engine.connect() as conn:
+            events = await conn.scalar(text("SELECT COUNT(*) FROM click_events"))
+            print(f"{events} click events, stats for the 7 days from {start:%Y-%m-%d}")
+            for name, link_id in (("hot link", HOT_LINK_ID), ("typical link", 2)):
+                clicks = await conn.scalar(
+                    text("SELECT COALESCE(SUM(clicks), 0) FROM link_daily_clicks WHERE link_id = :link_id AND day >= :day"),
+                    {"link_id": link_id, "day": start.date()},
+                )
+                raw = await timed(conn, RAW_STATS_SQL, {"link_id": link_id, "start_date": start}, args.runs)
+                rollup = await timed(conn, rollup_stats_query(link_id, start), {}, args.runs)
+                print(f"{name} ({clicks} clicks in the window)")
+                print(f"  raw GROUP BY: {summary(raw)}")
+                print(f"  rollup:       {summary(rollup)}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
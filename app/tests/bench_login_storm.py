@@ -0,0 +1,81 @@
+"""
+Redirect latency during a login storm: keeps a steady redirect load on one
+worker, first alone and then alongside `--login-concurrency` clients logging
+in back to back, and reports redirect p50/p99 for both phases:
+
+    python tests/bench_login_storm.py --base-url http://localhost:8000 \\
+        --code abc123 --email bench@example.com --password secret
+
+Point it at a single worker (uvicorn without --workers) so the logins and
+redirects share one event loop. Run it against the code before and after
+hashing moved off the loop to compare. Logins rejected with 503 (hashing
+queue full) are counted separately.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+from typing import List
+
+import httpx
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[max(int(len(ordered) * fraction) - 1, 0)]
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--code", required=True, help="an existing short code")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--phase", type=float, default=20, help="seconds per phase")
+    parser.add_argument("--redirect-concurrency", type=int, default=10)
+    parser.add_argument("--login-concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    latencies = {"quiet": [], "storm": []}
+    logins = Counter()
+    phase = "quiet"
+    running = True
+
+    limits = httpx.Limits(max_connections=args.redirect_concurrency + args.login_concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30, limits=limits) as client:
+        async def redirects() -> None:
+            while running:
+                started = time.perf_counter()
+                response = await client.get(f"/{args.code}")
+                latencies[phase].append(time.perf_counter() - started)
+                if not response.is_redirect:
+                    raise RuntimeError(f"/{args.code} answered {response.status_code}")
+
+        async def login() -> None:
+            while running:
+                response = await client.post(
+                    "/api/auth/token", data={"username": args.email, "password": args.password}
+                )
+                logins[response.status_code] += 1
+
+        redirect_tasks = [asyncio.create_task(redirects()) for _ in range(args.redirect_concurrency)]
+        await asyncio.sleep(args.phase)
+        phase = "storm"
+        login_tasks = [asyncio.create_task(login()) for _ in range(args.login_concurrency)]
+        await asyncio.sleep(args.phase)
+        running = False
+        await asyncio.gather(*redirect_tasks, *login_tasks)
+
+    for name, values in latencies.items():
+        print(
+            f"{name:>5}: {len(values) / args.phase:6.0f} redirects/s  "
+            f"p50 {statistics.median(values) * 1000:7.1f} ms  "
+            f"p99 {percentile(values, 0.99) * 1000:7.1f} ms  "
+            f"max {max(values) * 1000:7.1f} ms"
+        )
+    print(f"logins during the storm: {sum(logins.values()) / args.phase:.1f}/s, by status {dict(logins)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
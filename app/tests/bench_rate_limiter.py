@@ -0,0 +1,125 @@
+"""
+Per-request overhead of the Redis GCRA limiter against the in-memory slowapi
+limiter it replaced. Sends `--requests` requests in-process (no sockets) to a
+rate-limited endpoint with a limit high enough never to trigger, and reports
+latency over an unlimited baseline:
+
+    pip install slowapi
+    python tests/bench_rate_limiter.py --redis-url redis://localhost:6379/15
+
+Run from app/ with the app's environment (.env). "one client" sends every
+request from the same address, so the GCRA limiter's local token leases kick
+in; "many clients" uses a new address per request, so every check is a Redis
+round trip. The keys are written to the given Redis database.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import httpx
+import redis.asyncio as redis
+from fastapi import FastAPI, Request
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src import rate_limiter  # noqa: E402
+
+LIMIT = "1000000/minute"
+
+
+def unlimited_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping(request: Request):
+        return {"ok": True}
+
+    return app
+
+
+def slowapi_app() -> FastAPI:
+    from slowapi import Limiter, _rate_limit_exceeded_handler
+    from slowapi.errors import RateLimitExceeded
+
+    limiter = Limiter(key_func=rate_limiter.client_ip)
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+    @app.get("/ping")
+    @limiter.limit(LIMIT)
+    async def ping(request: Request):
+        return {"ok": True}
+
+    return app
+
+
+def gcra_app(redis_client: redis.Redis) -> FastAPI:
+    limiter = rate_limiter.Limiter(
+        key_func=rate_limiter.rate_limit_key,
+        local_tokens=rate_limiter.settings.rate_limit_local_tokens,
+        lease_seconds=rate_limiter.settings.rate_limit_lease_seconds,
+    )
+    app = FastAPI()
+    app.state.redis = redis_client
+    app.add_exception_handler(rate_limiter.RateLimitExceeded, rate_limiter.rate_limit_exceeded_handler)
+    app.add_middleware(rate_limiter.RateLimitHeadersMiddleware)
+
+    @app.get("/ping")
+    @limiter.limit(LIMIT)
+    async def ping(request: Request):
+        return {"ok": True}
+
+    return app
+
+
+async def measure(app: FastAPI, requests: int, address: Callable[[int], str]) -> List[float]:
+    latencies = []
+    transport = httpx.ASGITransport(app=app, client=("10.0.0.1", 40000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(requests):
+            started = time.perf_counter()
+            response = await client.get("/ping", headers={"X-Real-IP": address(i)})
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+    return latencies
+
+
+def summary(latencies: List[float], baseline: float) -> str:
+    ordered = sorted(latencies)
+    mean = statistics.fmean(ordered)
+    p99 = ordered[int(len(ordered) * 0.99) - 1]
+    return f"mean {mean * 1e6:7.0f} us  p99 {p99 * 1e6:7.0f} us  overhead {(mean - baseline) * 1e6:+6.0f} us"
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    # The requests come "from nginx", so X-Real-IP picks the client.
+    rate_limiter.trusted_proxies = rate_limiter.parse_networks("10.0.0.1")
+    redis_client = redis.from_url(args.redis_url, encoding="utf-8", decode_responses=True)
+    apps = {"slowapi": slowapi_app(), "gcra": gcra_app(redis_client)}
+    scenarios = {"one client": lambda i: "192.0.2.1", "many clients": lambda i: f"198.18.{i // 256 % 256}.{i % 256}"}
+
+    try:
+        await measure(unlimited_app(), 200, scenarios["one client"])
+        baseline = statistics.fmean(await measure(unlimited_app(), args.requests, scenarios["one client"]))
+        print(f"{args.requests} requests each; unlimited endpoint mean {baseline * 1e6:.0f} us")
+        for scenario, address in scenarios.items():
+            for name, app in apps.items():
+                await redis_client.flushdb()
+                latencies = await measure(app, args.requests, address)
+                print(f"{scenario:>12} {name:>8}: {summary(latencies, baseline)}")
+    finally:
+        await redis_client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
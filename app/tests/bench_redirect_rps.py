@@ -0,0 +1,68 @@
+"""
+Redirect throughput of one worker: `--concurrency` clients request existing
+short codes back to back for `--duration` seconds and the script reports
+requests per second and latency:
+
+    python tests/bench_redirect_rps.py --base-url http://localhost:8000 --codes abc123,def456
+
+Start the app as a single worker (uvicorn without --workers) and run this
+against the code before and after a change to compare. Codes are requested
+round-robin; once they are cached locally every request is a cache hit, the
+path the redirect handler is optimised for. Add --unknown to mix in 404s.
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--codes", required=True, help="comma-separated existing short codes")
+    parser.add_argument("--unknown", type=float, default=0.0, help="share of requests for unknown codes")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    args = parser.parse_args()
+
+    codes = itertools.cycle(args.codes.split(","))
+    unknown_every = round(1 / args.unknown) if args.unknown else 0
+    latencies = []
+    statuses = Counter()
+    measuring = False
+    deadline = time.monotonic() + args.warmup + args.duration
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30, limits=limits) as client:
+        async def worker() -> None:
+            sent = 0
+            while time.monotonic() < deadline:
+                sent += 1
+                code = f"unknown{sent}" if unknown_every and sent % unknown_every == 0 else next(codes)
+                started = time.perf_counter()
+                response = await client.get(f"/{code}")
+                if measuring:
+                    latencies.append(time.perf_counter() - started)
+                    statuses[response.status_code] += 1
+
+        tasks = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        await asyncio.sleep(args.warmup)
+        measuring = True
+        await asyncio.gather(*tasks)
+
+    ordered = sorted(latencies)
+    print(f"{len(ordered) / args.duration:.0f} requests/s over {args.duration:.0f}s, {args.concurrency} clients")
+    print(
+        f"latency p50 {statistics.median(ordered) * 1000:.1f} ms, "
+        f"p99 {ordered[int(len(ordered) * 0.99) - 1] * 1000:.1f} ms"
+    )
+    print(f"statuses: {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,209 @@
+import asyncio
+import socket
+import time
+from email import message_from_bytes
+from email.policy import default as default_policy
+
+import aiosmtplib
+import pytest
+from aiosmtpd.controller import Controller
+
+from src.config import settings
+from src.services import email_service
+from src.services.email_service import SmtpPool, build_message
+
+
+class SinkHandler:
+    """Keeps every message it is given and the connection each came in on."""
+
+    def __init__(self, refused=()):
+        self.refused = set(refused)
+        self.messages = []
+        self.connections = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return "550 5.1.1 No such user"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(message_from_bytes(envelope.content, policy=default_policy))
+        self.connections.append(session.peer)
+        return "250 Message accepted for delivery"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_sink(monkeypatch):
+    def start(**options) -> SinkHandler:
+        handler = SinkHandler(**options)
+        controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        controllers.append(controller)
+        monkeypatch.setattr(settings, "smtp_host", "127.0.0.1")
+        monkeypatch.setattr(settings, "smtp_port", str(controller.port))
+        monkeypatch.setattr(settings, "smtp_user", "")
+        return handler
+
+    controllers = []
+    yield start
+    for controller in controllers:
+        controller.stop()
+
+
+def html_of(message) -> str:
+    return message.get_body(preferencelist=("html",)).get_content()
+
+
+def test_pool_reuses_idle_connections(smtp_sink):
+    sink = smtp_sink()
+    pool = SmtpPool(size=2, idle_timeout=60)
+
+    async def main():
+        try:
+            for i in range(3):
+                await pool.send_message(build_message("a@example.com", f"sequential {i}", "<p>hi</p>"))
+            await asyncio.gather(*(
+                pool.send_message(build_message("b@example.com", f"concurrent {i}", "<p>hi</p>")) for i in range(6)
+            ))
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
+
+    assert len(sink.messages) == 9
+    # One connection for the sequential sends; concurrency never goes past the pool size.
+    assert len(set(sink.connections[:3])) == 1
+    assert len(set(sink.connections)) <= 2
+
+
+def test_pool_replaces_connections_idle_too_long(smtp_sink):
+    sink = smtp_sink()
+    pool = SmtpPool(size=1, idle_timeout=0.05)
+
+    async def main():
+        try:
+            await pool.send_message(build_message("a@example.com", "first", "<p>hi</p>"))
+            await asyncio.sleep(0.1)
+            await pool.send_message(build_message("a@example.com", "second", "<p>hi</p>"))
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
+
+    assert len(set(sink.connections)) == 2
+
+
+def test_pool_replaces_a_connection_dropped_while_idle(smtp_sink):
+    sink = smtp_sink()
+    pool = SmtpPool(size=1, idle_timeout=60)
+
+    async def main():
+        try:
+            await pool.send_message(build_message("a@example.com", "first", "<p>hi</p>"))
+            # The connection is lost while it sits in the pool.
+            smtp, _ = pool._idle[0]
+            smtp.transport.abort()
+            await asyncio.sleep(0.05)
+            await pool.send_message(build_message("a@example.com", "second", "<p>hi</p>"))
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
+
+    assert [message["Subject"] for message in sink.messages] == ["first", "second"]
+
+
+def test_send_on_a_dead_reused_connection_is_retried_once(smtp_sink):
+    sink = smtp_sink()
+    pool = SmtpPool(size=1, idle_timeout=60)
+
+    async def main():
+        try:
+            await pool.send_message(build_message("a@example.com", "first", "<p>hi</p>"))
+            # Still looks connected, but the server has gone away.
+            smtp, _ = pool._idle[0]
+
+            async def disconnected(message):
+                raise aiosmtplib.SMTPServerDisconnected("Connection lost")
+
+            smtp.send_message = disconnected
+            await pool.send_message(build_message("a@example.com", "second", "<p>hi</p>"))
+        finally:
+            await pool.close()
+
+    asyncio.run(main())
+
+    assert [message["Subject"] for message in sink.messages] == ["first", "second"]
+    assert len(set(sink.connections)) == 2
+
+
+async def wait_for_outcomes(redis_client, count: int, timeout: float = 5) -> list:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        outcomes = await email_service.email_queue.outcomes(redis_client)
+        if len(outcomes) >= count:
+            return outcomes
+        await asyncio.sleep(0.05)
+    raise AssertionError("emails were not delivered in time")
+
+
+def test_queued_emails_render_their_links(smtp_sink, redis_client, monkeypatch):
+    sink = smtp_sink()
+    monkeypatch.setattr(email_service, "smtp_pool", SmtpPool(size=1, idle_timeout=60))
+    queue = email_service.email_queue
+
+    async def main():
+        await queue.start(redis_client)
+        try:
+            await email_service.send_account_verification_email(redis_client, "new@example.com", "verify-token-1", ttl=60)
+            await email_service.send_password_reset_email(redis_client, "old@example.com", "reset-token-2", ttl=60)
+            outcomes = await wait_for_outcomes(redis_client, 2)
+        finally:
+            await queue.stop()
+            await email_service.smtp_pool.close()
+        return outcomes
+
+    outcomes = asyncio.run(main())
+
+    by_recipient = {message["To"]: message for message in sink.messages}
+    verify_html = html_of(by_recipient["new@example.com"])
+    reset_html = html_of(by_recipient["old@example.com"])
+    assert 'href="http://frontend.test/pages/verify-email?token=verify-token-1"' in verify_html
+    assert 'href="http://frontend.test/pages/reset-password?token=reset-token-2"' in reset_html
+    assert by_recipient["new@example.com"]["From"] == "Link Shortener <noreply@short.test>"
+    # Both went out over the one pooled connection.
+    assert len(set(sink.connections)) == 1
+
+    assert sorted(outcome["outcome"] for outcome in outcomes) == ["sent", "sent"]
+    # Tokens stay out of the outcome log.
+    assert "token" not in str(outcomes)
+    assert {outcome["payload"]["to"] for outcome in outcomes} == {"ne***@example.com", "ol***@example.com"}
+
+
+def test_refused_recipient_is_not_retried(smtp_sink, redis_client, monkeypatch):
+    smtp_sink(refused=["gone@example.com"])
+    monkeypatch.setattr(email_service, "smtp_pool", SmtpPool(size=1, idle_timeout=60))
+    queue = email_service.email_queue
+
+    async def main():
+        await queue.start(redis_client)
+        try:
+            await email_service.send_account_verification_email(redis_client, "gone@example.com", "t", ttl=60)
+            outcomes = await wait_for_outcomes(redis_client, 1)
+        finally:
+            await queue.stop()
+            await email_service.smtp_pool.close()
+        return outcomes
+
+    [outcome] = asyncio.run(main())
+
+    assert outcome["outcome"] == "failed"
+    assert outcome["attempts"] == 1
+    assert "Recipient refused" in outcome["error"]
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from src.services import sms_service
+from src.services.job_queue import RedisJobQueue
+from src.services.sms_service import SmsIrClient
+
+SMS_API_URL = "https://sms.test/v1"
+
+
+class FakeSmsProvider:
+    """
+    Answers /send/verify according to a script: "fail" (HTTP 500), "hang"
+    (never answers, like a worker dying mid-send) or "ok". Once the script
+    runs out every request succeeds.
+    """
+
+    def __init__(self, *script: str):
+        self.script = list(script)
+        self.received = []
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.received.append(json.loads(request.content))
+        step = self.script.pop(0) if self.script else "ok"
+        if step == "hang":
+            await asyncio.sleep(3600)
+        if step == "fail":
+            return httpx.Response(500, json={"status": 0, "message": "temporarily unavailable"})
+        return httpx.Response(200, json={"status": 1, "data": {"messageId": len(self.received)}})
+
+
+def make_queue(consumer: str, **options) -> RedisJobQueue:
+    queue = RedisJobQueue(
+        "sms",
+        handler=sms_service._deliver,
+        concurrency=1,
+        max_attempts=3,
+        base_backoff=0.1,
+        max_backoff=1,
+        summarize=sms_service._summarize,
+        **options,
+    )
+    queue.consumer = consumer
+    return queue
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    def install(*script: str) -> FakeSmsProvider:
+        fake = FakeSmsProvider(*script)
+        client = SmsIrClient(SMS_API_URL, "test-sms-key", max_concurrency=5)
+        client._client = httpx.AsyncClient(base_url=SMS_API_URL, transport=httpx.MockTransport(fake.handler))
+        monkeypatch.setattr(sms_service, "sms_client", client)
+        return fake
+
+    return install
+
+
+async def wait_for_outcome(queue: RedisJobQueue, redis_client, timeout: float = 5) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        outcomes = await queue.outcomes(redis_client)
+        if outcomes:
+            return outcomes[0]
+        await asyncio.sleep(0.05)
+    raise AssertionError("job did not finish in time")
+
+
+async def wait_until_sending(provider: FakeSmsProvider, count: int = 1) -> None:
+    while len(provider.received) < count:
+        await asyncio.sleep(0.01)
+
+
+def test_failed_send_is_retried(redis_client, provider, monkeypatch):
+    fake = provider("fail")
+    queue = make_queue("worker-a")
+    monkeypatch.setattr(sms_service, "sms_queue", queue)
+
+    async def main():
+        await queue.start(redis_client)
+        try:
+            job_id = await sms_service.send_otp(redis_client, "09121234567", "4321")
+            outcome = await wait_for_outcome(queue, redis_client)
+        finally:
+            await queue.stop()
+        return job_id, outcome, await queue.stats(redis_client)
+
+    job_id, outcome, stats = asyncio.run(main())
+
+    assert outcome["id"] == job_id
+    assert outcome["outcome"] == "sent"
+    assert outcome["attempts"] == 2
+    # The OTP itself never reaches the outcome log.
+    assert outcome["payload"] == {"mobile": "0912*****67", "template_id": 2}
+    assert stats == {"queued": 0, "delayed": 0, "retried": 1, "sent": 1}
+    assert [request["parameters"] for request in fake.received] == [[{"name": "code", "value": "4321"}]] * 2
+
+
+def test_job_interrupted_by_shutdown_is_handed_back(redis_client, provider):
+    fake = provider("hang")
+
+    async def main():
+        first = make_queue("worker-a")
+        await first.start(redis_client)
+        await first.enqueue(redis_client, {"mobile": "09121234567", "template_id": 2, "parameters": {"code": "1"}})
+        await wait_until_sending(fake)
+        await first.stop()
+        requeued = await redis_client.llen(first.queue_key)
+        processing = await redis_client.llen(first._processing_key("worker-a"))
+
+        second = make_queue("worker-b")
+        await second.start(redis_client)
+        try:
+            outcome = await wait_for_outcome(second, redis_client)
+        finally:
+            await second.stop()
+        return requeued, processing, outcome
+
+    requeued, processing, outcome = asyncio.run(main())
+
+    assert (requeued, processing) == (1, 0)
+    assert outcome["outcome"] == "sent"
+    assert len(fake.received) == 2
+
+
+def test_jobs_of_a_dead_worker_are_recovered(redis_client, provider):
+    fake = provider("hang")
+
+    async def main():
+        dead = make_queue("worker-a")
+        await dead.start(redis_client)
+        await dead.enqueue(redis_client, {"mobile": "09121234567", "template_id": 2, "parameters": {"code": "1"}})
+        await wait_until_sending(fake)
+        # The process dies: its tasks stop without handing anything back.
+        for task in dead._tasks:
+            task.cancel()
+        await asyncio.gather(*dead._tasks, return_exceptions=True)
+        stranded = await redis_client.llen(dead._processing_key("worker-a"))
+
+        survivor = make_queue("worker-b", heartbeat_timeout=0.5)
+        await survivor.start(redis_client)
+        try:
+            outcome = await wait_for_outcome(survivor, redis_client)
+        finally:
+            await survivor.stop()
+        consumers = await redis_client.zrange(survivor.consumers_key, 0, -1)
+        return stranded, outcome, consumers
+
+    stranded, outcome, consumers = asyncio.run(main())
+
+    assert stranded == 1
+    assert outcome["outcome"] == "sent"
+    assert outcome["attempts"] == 1
+    assert len(fake.received) == 2
+    # The dead worker is dropped from the registry and the survivor deregistered on stop.
+    assert consumers == []
+
+
+def test_rejected_message_is_not_retried(redis_client, monkeypatch):
+    async def reject(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(400, json={"status": 0, "message": "invalid mobile"})
+
+    client = SmsIrClient(SMS_API_URL, "test-sms-key", max_concurrency=5)
+    client._client = httpx.AsyncClient(base_url=SMS_API_URL, transport=httpx.MockTransport(reject))
+    monkeypatch.setattr(sms_service, "sms_client", client)
+    queue = make_queue("worker-a")
+
+    async def main():
+        await queue.start(redis_client)
+        try:
+            await queue.enqueue(redis_client, {"mobile": "0912", "template_id": 2, "parameters": {"code": "1"}})
+            return await wait_for_outcome(queue, redis_client)
+        finally:
+            await queue.stop()
+
+    outcome = asyncio.run(main())
+
+    assert outcome["outcome"] == "failed"
+    assert outcome["attempts"] == 1
+    assert "400" in outcome["error"]
+
+
+def test_expired_job_is_dropped(redis_client, provider):
+    fake = provider()
+    queue = make_queue("worker-a")
+
+    async def main():
+        await queue.enqueue(
+            redis_client, {"mobile": "09121234567", "template_id": 2, "parameters": {"code": "1"}}, ttl=0.01
+        )
+        await asyncio.sleep(0.05)
+        await queue.start(redis_client)
+        try:
+            return await wait_for_outcome(queue, redis_client)
+        finally:
+            await queue.stop()
+
+    outcome = asyncio.run(main())
+
+    assert outcome["outcome"] == "expired"
+    assert fake.received == []
@@ -0,0 +1,72 @@
+"""
+KGS reseeding against a real Postgres. Needs TEST_DATABASE_URL pointing at a
+scratch database: its tables are created and dropped here.
+"""
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.models import Base
+from src.services.kgs import FALLBACK_ID_BASE, from_base62, highest_issued_code_query, highest_issued_id, to_base62
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set"
+)
+
+INSERT_LINK = text(
+    "INSERT INTO links (long_url, url_hash, short_code, is_custom) VALUES ('https://example.com', 1, :code, :custom)"
+)
+
+
+def literal_sql(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def test_highest_issued_id_reads_the_end_of_the_index():
+    async def main():
+        engine = create_async_engine(os.environ["TEST_DATABASE_URL"])
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            async with AsyncSession(engine) as session:
+                await session.execute(INSERT_LINK, [
+                    {"code": to_base62(61), "custom": False},
+                    {"code": "zzz", "custom": False},
+                    # Bytewise after "zzz" only as a longer code; also larger as a number.
+                    {"code": "Zzzz", "custom": False},
+                    # Aliases, even ones spelled in base62, are not counter ids.
+                    {"code": "zzzzzz", "custom": True},
+                    {"code": "my-alias", "custom": True},
+                    {"code": to_base62(FALLBACK_ID_BASE + 7), "custom": False},
+                ])
+                await session.commit()
+                highest = await highest_issued_id(session)
+                highest_fallback = await highest_issued_id(session, fallback=True)
+
+                # Enough generated codes that sorting the table would be the planner's last resort.
+                await session.execute(text(
+                    "INSERT INTO links (long_url, url_hash, short_code) "
+                    "SELECT 'https://example.com', 1, 'a' || i FROM generate_series(1, 20000) AS i"
+                ))
+                await session.commit()
+                await session.execute(text("ANALYZE links"))
+                plan = await session.scalar(text(f"EXPLAIN (FORMAT JSON) {literal_sql(highest_issued_code_query())}"))
+                highest_after = await highest_issued_id(session)
+            return highest, highest_fallback, plan, highest_after
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+            await engine.dispose()
+
+    highest, highest_fallback, plan, highest_after = asyncio.run(main())
+
+    assert highest == from_base62("Zzzz")
+    assert highest_fallback == FALLBACK_ID_BASE + 7
+    assert highest_after == from_base62("a20000")
+    assert "ix_links_generated_code_order" in str(plan)
+    assert "Sort" not in str(plan)
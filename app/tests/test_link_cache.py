@@ -0,0 +1,95 @@
+import asyncio
+import json
+import time
+
+from src import models
+from src.config import settings
+from src.services import link_cache
+from src.services.link_cache import CachedLink, link_cache_key, popularity
+
+
+class StubRow:
+    long_url = "https://example.com/landing"
+    redirect_type = 307
+    scan_status = models.ScanStatus.CLEAN
+
+
+class StubSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        return self
+
+    def one_or_none(self):
+        return StubRow()
+
+
+def make_hot(short_code: str) -> None:
+    for _ in range(settings.link_admission_threshold * 64):
+        popularity.increment(short_code)
+
+
+def test_miss_records_when_the_entry_was_cached(redis_client, monkeypatch):
+    monkeypatch.setattr(link_cache, "async_session_factory", StubSession)
+    make_hot("lcmiss1")
+
+    async def main():
+        link = await link_cache._load_link(redis_client, "lcmiss1")
+        return link, await redis_client.get(link_cache_key("lcmiss1")), await redis_client.ttl(link_cache_key("lcmiss1"))
+
+    link, raw, ttl = asyncio.run(main())
+
+    assert link == CachedLink("https://example.com/landing", 307, False)
+    assert abs(json.loads(raw)["at"] - time.time()) < 5
+    assert ttl > settings.link_ttl_base_seconds
+
+
+def test_hot_hit_is_extended_within_the_total_lifetime(redis_client):
+    make_hot("lchot1")
+    make_hot("lchot2")
+    link = CachedLink("https://example.com/hot")
+    now = time.time()
+
+    async def main():
+        await redis_client.set(link_cache_key("lchot1"), link.dumps(cached_at=now), ex=60)
+        # Cached long enough ago that only 100s of its lifetime are left.
+        old = now - settings.link_ttl_max_seconds + 100
+        await redis_client.set(link_cache_key("lchot2"), link.dumps(cached_at=old), ex=60)
+        loaded = [await link_cache._load_link(redis_client, code) for code in ("lchot1", "lchot2")]
+        return loaded, await redis_client.ttl(link_cache_key("lchot1")), await redis_client.ttl(link_cache_key("lchot2"))
+
+    loaded, fresh_ttl, old_ttl = asyncio.run(main())
+
+    assert loaded == [link, link]
+    assert fresh_ttl > settings.link_ttl_base_seconds
+    assert 60 < old_ttl <= 100
+
+
+def test_entry_past_its_lifetime_or_without_one_is_not_extended(redis_client):
+    make_hot("lcold1")
+    make_hot("lcold2")
+    link = CachedLink("https://example.com/old")
+
+    async def main():
+        expired = time.time() - settings.link_ttl_max_seconds - 1
+        await redis_client.set(link_cache_key("lcold1"), link.dumps(cached_at=expired), ex=30)
+        # Written before first-cached times were recorded.
+        await redis_client.set(link_cache_key("lcold2"), link.dumps(), ex=30)
+        for code in ("lcold1", "lcold2"):
+            assert await link_cache._load_link(redis_client, code) == link
+        return [await redis_client.ttl(link_cache_key(code)) for code in ("lcold1", "lcold2")]
+
+    ttls = asyncio.run(main())
+
+    assert all(0 < ttl <= 30 for ttl in ttls)
+
+
+def test_legacy_entries_still_load():
+    assert CachedLink.loads("https://example.com/bare") == CachedLink("https://example.com/bare")
+    assert CachedLink.loads_entry('{"url":"https://example.com/","status":301}') == (
+        CachedLink("https://example.com/", 301), None
+    )
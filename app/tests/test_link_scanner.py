@@ -0,0 +1,92 @@
+"""
+Background link scanning against a real Postgres. Needs TEST_DATABASE_URL
+pointing at a scratch database: its tables are created and dropped here.
+"""
+import asyncio
+import os
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models import Base
+from src.services import link_scanner
+from src.services.link_scanner import LinkScanner
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set"
+)
+
+VERDICTS = {
+    "https://clean.example": False,
+    "https://malware.example": True,
+    "https://unknown.example": None,
+    "https://edited.example": True,
+}
+
+
+def test_scan_batch_records_verdicts_only_where_the_claim_holds(monkeypatch):
+    async def main():
+        engine = create_async_engine(os.environ["TEST_DATABASE_URL"])
+        monkeypatch.setattr(link_scanner, "async_session_factory", sessionmaker(engine, class_=AsyncSession))
+        invalidated = []
+
+        async def fake_invalidate_link(redis_client, short_code):
+            invalidated.append(short_code)
+
+        async def fake_scan_url(url):
+            if url == "https://edited.example":
+                # The owner points the link elsewhere while it is being checked.
+                async with engine.begin() as conn:
+                    await conn.execute(text("UPDATE links SET long_url = 'https://new.example' WHERE short_code = 'edited'"))
+            return VERDICTS[url]
+
+        monkeypatch.setattr(link_scanner, "invalidate_link", fake_invalidate_link)
+        monkeypatch.setattr(link_scanner, "scan_url", fake_scan_url)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.execute(
+                    text(
+                        "INSERT INTO links (long_url, url_hash, short_code, updated_at) "
+                        "VALUES (:url, 1, :code, '2020-01-01T00:00:00+00:00')"
+                    ),
+                    [{"url": url, "code": url[8:].split(".")[0]} for url in VERDICTS],
+                )
+            scanner = LinkScanner(
+                batch_size=10,
+                concurrency=2,
+                poll_interval=1,
+                rescan_after=timedelta(days=7),
+                rescan_batch_size=10,
+                claim_timeout=timedelta(minutes=5),
+            )
+            claimed = await scanner.scan_batch()
+            async with engine.connect() as conn:
+                rows = (await conn.execute(text(
+                    "SELECT short_code, scan_status, scanned_at IS NOT NULL AS scanned, "
+                    "scan_claimed_until IS NULL AS released, updated_at FROM links"
+                ))).all()
+            return claimed, {row.short_code: row for row in rows}, invalidated
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+            await engine.dispose()
+
+    claimed, links, invalidated = asyncio.run(main())
+
+    assert claimed == 4
+    assert {code: (row.scan_status, row.scanned) for code, row in links.items()} == {
+        "clean": ("CLEAN", True),
+        "malware": ("FLAGGED", True),
+        "unknown": ("PENDING", False),
+        # Checked as its old URL: the verdict is not applied to the new one.
+        "edited": ("PENDING", False),
+    }
+    assert all(row.released for code, row in links.items() if code != "edited")
+    assert all(row.updated_at.year == 2020 for code, row in links.items() if code != "edited")
+    # A link whose claim was lost may be invalidated too, which only costs a reload.
+    assert "malware" in invalidated and "clean" not in invalidated
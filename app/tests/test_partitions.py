@@ -0,0 +1,201 @@
+"""
+click_events partitioning against a real Postgres. Needs TEST_DATABASE_URL
+pointing at a scratch database: its tables are created and dropped here.
+"""
+import asyncio
+import gzip
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.models import Base
+from src.services import partitions
+from src.services.partitions import (
+    DEFAULT_PARTITION,
+    PartitionMaintainer,
+    add_months,
+    month_start,
+    partition_name,
+)
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set"
+)
+
+THIS_MONTH = datetime.now(timezone.utc).date().replace(day=1)
+
+
+def maintainer(**options) -> PartitionMaintainer:
+    settings = {"months_ahead": 2, "retention_months": 0, "retention_action": "drop", "archive_dir": "", "interval": 60}
+    return PartitionMaintainer(**{**settings, **options})
+
+
+@asynccontextmanager
+async def scratch_database(monkeypatch, past_months: int = 0):
+    """Creates the schema with partitions from `past_months` ago to two months ahead, and a link to click."""
+    engine = create_async_engine(os.environ["TEST_DATABASE_URL"])
+    monkeypatch.setattr(partitions, "engine", engine)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF click_events DEFAULT"))
+            await conn.execute(text(
+                "INSERT INTO links (id, long_url, url_hash, short_code, clicks) VALUES (1, 'https://example.com', 1, 'abc', 0)"
+            ))
+        async with engine.connect() as conn:
+            for offset in range(-past_months, 0):
+                async with conn.begin():
+                    await maintainer()._create_partition(conn, add_months(THIS_MONTH, offset))
+            await maintainer().ensure_partitions(conn)
+        yield engine
+    finally:
+        async with engine.begin() as conn:
+            for name in await leftover_partitions(conn):
+                await conn.execute(text(f"DROP TABLE {name}"))
+            await conn.run_sync(Base.metadata.drop_all)
+        await engine.dispose()
+
+
+async def attached_partitions(conn) -> set:
+    """Monthly partitions still attached; the default one is left out."""
+    return set(await maintainer()._partitions(conn, attached=True))
+
+
+async def leftover_partitions(conn) -> set:
+    return set(await maintainer()._partitions(conn, attached=False))
+
+
+async def add_clicks(engine, *timestamps) -> None:
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("INSERT INTO click_events (link_id, timestamp) VALUES (1, :timestamp)"),
+            [{"timestamp": timestamp} for timestamp in timestamps],
+        )
+
+
+def scanned_relations(plan: dict) -> set:
+    relations = {plan["Relation Name"]} if "Relation Name" in plan else set()
+    for child in plan.get("Plans", []):
+        relations |= scanned_relations(child)
+    return relations
+
+
+def test_time_bounded_query_scans_only_its_month(monkeypatch):
+    async def main():
+        async with scratch_database(monkeypatch, past_months=3) as engine:
+            start = month_start(THIS_MONTH) + timedelta(days=2)
+            await add_clicks(engine, start, start + timedelta(hours=5), month_start(add_months(THIS_MONTH, -2)))
+            async with engine.connect() as conn:
+                # Literal bounds, as the planner sees them for a one-off query; pruning happens at plan time.
+                plan = await conn.scalar(text(
+                    "EXPLAIN (FORMAT JSON) SELECT link_id, COUNT(*) FROM click_events "
+                    f"WHERE timestamp >= '{start.isoformat()}' AND timestamp < '{(start + timedelta(days=7)).isoformat()}' "
+                    "GROUP BY link_id"
+                ))
+                count = await conn.scalar(text(
+                    "SELECT COUNT(*) FROM click_events WHERE timestamp >= :start AND timestamp < :end"
+                ), {"start": start, "end": start + timedelta(days=7)})
+                whole_range = await conn.scalar(text("EXPLAIN (FORMAT JSON) SELECT COUNT(*) FROM click_events"))
+                return plan, count, whole_range
+
+    plan, count, whole_range = asyncio.run(main())
+
+    assert scanned_relations(plan[0]["Plan"]) == {partition_name(THIS_MONTH)}
+    assert count == 2
+    # Without bounds every partition, including the default one, is scanned.
+    assert DEFAULT_PARTITION in scanned_relations(whole_range[0]["Plan"])
+    assert len(scanned_relations(whole_range[0]["Plan"])) == 3 + 3 + 1
+
+
+def test_ensure_partitions_creates_months_ahead_and_moves_stray_rows(monkeypatch):
+    async def main():
+        async with scratch_database(monkeypatch) as engine:
+            far = add_months(THIS_MONTH, 4)
+            # Lands in the default partition: its month does not exist yet.
+            await add_clicks(engine, month_start(far) + timedelta(days=1))
+            async with engine.connect() as conn:
+                created = await maintainer(months_ahead=4).ensure_partitions(conn)
+                again = await maintainer(months_ahead=4).ensure_partitions(conn)
+                in_default = await conn.scalar(text(f"SELECT COUNT(*) FROM {DEFAULT_PARTITION}"))
+                in_partition = await conn.scalar(text(f"SELECT COUNT(*) FROM {partition_name(far)}"))
+                attached = await attached_partitions(conn)
+            return far, created, again, in_default, in_partition, attached
+
+    far, created, again, in_default, in_partition, attached = asyncio.run(main())
+
+    assert created == [partition_name(add_months(THIS_MONTH, 3)), partition_name(far)]
+    assert again == []
+    assert (in_default, in_partition) == (0, 1)
+    assert attached == {partition_name(add_months(THIS_MONTH, offset)) for offset in range(5)}
+
+
+def test_retention_drops_only_expired_partitions(monkeypatch):
+    async def main():
+        async with scratch_database(monkeypatch, past_months=5) as engine:
+            await add_clicks(
+                engine,
+                month_start(add_months(THIS_MONTH, -5)) + timedelta(days=3),
+                month_start(add_months(THIS_MONTH, -2)) + timedelta(days=3),
+                month_start(THIS_MONTH) + timedelta(hours=1),
+            )
+            assert await maintainer(retention_months=2).run_once()
+            async with engine.connect() as conn:
+                attached = await attached_partitions(conn)
+                leftovers = await leftover_partitions(conn)
+                clicks = (await conn.execute(text("SELECT timestamp FROM click_events ORDER BY timestamp"))).scalars().all()
+            return attached, leftovers, clicks
+
+    attached, leftovers, clicks = asyncio.run(main())
+
+    kept = {partition_name(add_months(THIS_MONTH, offset)) for offset in range(-2, 3)}
+    assert attached == kept
+    assert leftovers == set()
+    assert [click.date() for click in clicks] == [
+        (month_start(add_months(THIS_MONTH, -2)) + timedelta(days=3)).date(),
+        (month_start(THIS_MONTH) + timedelta(hours=1)).date(),
+    ]
+
+
+def test_retention_archives_before_dropping(monkeypatch, tmp_path):
+    async def main():
+        async with scratch_database(monkeypatch, past_months=4) as engine:
+            expired = add_months(THIS_MONTH, -4)
+            await add_clicks(engine, month_start(expired) + timedelta(days=1), month_start(expired) + timedelta(days=2))
+            archiver = maintainer(retention_months=3, retention_action="archive", archive_dir=str(tmp_path))
+            assert await archiver.run_once()
+            async with engine.connect() as conn:
+                attached = await attached_partitions(conn)
+                leftovers = await leftover_partitions(conn)
+            return expired, attached, leftovers
+
+    expired, attached, leftovers = asyncio.run(main())
+
+    assert partition_name(expired) not in attached
+    assert partition_name(add_months(THIS_MONTH, -3)) in attached
+    assert leftovers == set()
+    with gzip.open(tmp_path / f"{partition_name(expired)}.csv.gz", "rt") as archive:
+        lines = archive.read().splitlines()
+    assert lines[0] == "id,timestamp,link_id"
+    assert len(lines) == 3
+
+
+def test_only_one_worker_runs_maintenance(monkeypatch):
+    async def main():
+        async with scratch_database(monkeypatch) as engine:
+            async with engine.connect() as holder:
+                await holder.scalar(text("SELECT pg_advisory_lock(:lock_id)"), {"lock_id": partitions.MAINTENANCE_LOCK_ID})
+                await holder.commit()
+                blocked = await maintainer().run_once()
+                await holder.scalar(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": partitions.MAINTENANCE_LOCK_ID})
+                await holder.commit()
+            return blocked, await maintainer().run_once()
+
+    blocked, ran = asyncio.run(main())
+
+    assert blocked is False
+    assert ran is True
@@ -0,0 +1,31 @@
+from starlette.requests import Request
+
+from src import rate_limiter
+from src.rate_limiter import client_ip, parse_networks
+
+
+def request_from(peer: str, real_ip: str = "") -> Request:
+    headers = [(b"x-real-ip", real_ip.encode())] if real_ip else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers, "client": (peer, 40000)})
+
+
+def test_real_ip_header_is_ignored_by_default(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "trusted_proxies", parse_networks(""))
+
+    assert client_ip(request_from("203.0.113.7", real_ip="192.0.2.1")) == "203.0.113.7"
+
+
+def test_real_ip_header_is_honoured_only_from_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "trusted_proxies", parse_networks("10.0.0.5, 172.16.0.0/12"))
+
+    assert client_ip(request_from("10.0.0.5", real_ip="192.0.2.1")) == "192.0.2.1"
+    assert client_ip(request_from("172.18.0.3", real_ip="192.0.2.2")) == "192.0.2.2"
+    assert client_ip(request_from("10.0.0.6", real_ip="192.0.2.3")) == "10.0.0.6"
+    # A trusted proxy that sent no header is itself the client.
+    assert client_ip(request_from("10.0.0.5")) == "10.0.0.5"
+
+
+def test_peer_that_is_not_an_address_is_not_trusted(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "trusted_proxies", parse_networks("0.0.0.0/0"))
+
+    assert client_ip(request_from("testclient", real_ip="192.0.2.1")) == "testclient"
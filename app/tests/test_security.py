@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from src.config import settings
+from src.services import security
+
+
+@pytest.fixture
+def hash_slots(monkeypatch):
+    def install(concurrency: int, queue_timeout: float) -> asyncio.Semaphore:
+        slots = asyncio.Semaphore(concurrency)
+        monkeypatch.setattr(security, "_hash_slots", slots)
+        monkeypatch.setattr(settings, "password_hash_queue_timeout_seconds", queue_timeout)
+        return slots
+
+    return install
+
+
+def slow_hash(seconds: float) -> str:
+    time.sleep(seconds)
+    return "hashed"
+
+
+def test_queued_call_times_out_with_503(hash_slots):
+    slots = hash_slots(concurrency=1, queue_timeout=0.05)
+
+    async def main():
+        first = asyncio.create_task(security._run_hashing(slow_hash, 0.3))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as rejected:
+            await security._run_hashing(slow_hash, 0)
+        return await first, rejected.value
+
+    result, rejected = asyncio.run(main())
+
+    assert result == "hashed"
+    assert rejected.status_code == 503
+    assert rejected.headers == {"Retry-After": "1"}
+    assert slots._value == 1
+
+
+def test_timeouts_around_releases_never_leak_permits(hash_slots):
+    slots = hash_slots(concurrency=2, queue_timeout=0.002)
+
+    async def attempt():
+        try:
+            await security._run_hashing(slow_hash, 0.001)
+        except HTTPException:
+            pass
+
+    async def main():
+        # Waiters time out right around the moments permits are handed back.
+        for _ in range(20):
+            await asyncio.gather(*(attempt() for _ in range(20)))
+
+    asyncio.run(main())
+
+    assert slots._value == 2
+    assert not slots._waiters
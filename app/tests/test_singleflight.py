@@ -0,0 +1,126 @@
+import asyncio
+
+from src import models
+from src.services import link_cache
+from src.services.link_cache import CachedLink, fetch_link, local_link_cache
+from src.services.singleflight import SingleFlight
+
+
+class StubResult:
+    def __init__(self, row):
+        self._row = row
+
+    def one_or_none(self):
+        return self._row
+
+
+class StubRow:
+    long_url = "https://example.com/landing"
+    redirect_type = 301
+    scan_status = models.ScanStatus.CLEAN
+
+
+class StubSession:
+    """Counts queries; each one takes a moment so concurrent misses overlap."""
+
+    def __init__(self, row):
+        self.row = row
+        self.executes = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.executes += 1
+        await asyncio.sleep(0.05)
+        return StubResult(self.row)
+
+
+class StubRedis:
+    def __init__(self):
+        self.values = {}
+        self.reads = 0
+        self.writes = 0
+
+    async def get(self, key):
+        self.reads += 1
+        await asyncio.sleep(0.01)
+        return self.values.get(key)
+
+    async def expire(self, key, ttl, gt=False):
+        return key in self.values
+
+    async def set(self, key, value, ex=None):
+        self.writes += 1
+        self.values[key] = value
+
+
+def _fetch_concurrently(redis_client, short_code, n):
+    async def main():
+        return await asyncio.gather(*(fetch_link(redis_client, short_code) for _ in range(n)))
+
+    return asyncio.run(main())
+
+
+def test_concurrent_misses_run_one_query(monkeypatch):
+    session = StubSession(StubRow())
+    monkeypatch.setattr(link_cache, "async_session_factory", lambda: session)
+    redis_client = StubRedis()
+    local_link_cache.delete("sfhit1")
+
+    links = _fetch_concurrently(redis_client, "sfhit1", 50)
+
+    assert session.executes == 1
+    assert redis_client.reads == 1
+    assert redis_client.writes <= 1
+    assert links == [CachedLink("https://example.com/landing", 301, False)] * 50
+
+
+def test_concurrent_misses_for_unknown_code_run_one_query(monkeypatch):
+    session = StubSession(None)
+    monkeypatch.setattr(link_cache, "async_session_factory", lambda: session)
+    redis_client = StubRedis()
+
+    links = _fetch_concurrently(redis_client, "sfmiss1", 50)
+
+    assert session.executes == 1
+    assert links == [None] * 50
+
+
+def test_later_miss_queries_again(monkeypatch):
+    session = StubSession(StubRow())
+    monkeypatch.setattr(link_cache, "async_session_factory", lambda: session)
+    local_link_cache.delete("sfhit2")
+
+    _fetch_concurrently(StubRedis(), "sfhit2", 10)
+    local_link_cache.delete("sfhit2")
+    _fetch_concurrently(StubRedis(), "sfhit2", 10)
+
+    assert session.executes == 2
+
+
+def test_cancelled_caller_does_not_abort_shared_call():
+    flights = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        first = asyncio.create_task(flights.do("key", work))
+        second = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        result = await second
+        assert first.cancelled()
+        return result
+
+    assert asyncio.run(main()) == "done"
+    assert calls == 1
+    assert len(flights) == 0
@@ -0,0 +1,214 @@
+import asyncio
+import base64
+import hashlib
+import json
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+
+from src.config import settings
+from src.services import url_checker
+from src.services.threat_db import ThreatDatabase, ThreatList
+from src.services.url_checker import THREAT_TYPES, WebRiskChecker
+
+API_URL = "https://webrisk.test/v1"
+
+
+def sha256(expression: str) -> bytes:
+    return hashlib.sha256(expression.encode()).digest()
+
+
+class FakeWebRisk:
+    """
+    Serves computeDiff, hashes:search and uris:search from in-memory threat
+    data. `threats` maps an expression ("host/path") to its threat type;
+    `collisions` are expressions whose 4-byte prefix is listed although the
+    full hash is not a threat.
+    """
+
+    def __init__(self, threats: dict, collisions: tuple = ()):
+        self.threats = {sha256(expression): threat_type for expression, threat_type in threats.items()}
+        self.listed = {threat_type: set() for threat_type in THREAT_TYPES}
+        for full_hash, threat_type in self.threats.items():
+            self.listed[threat_type].add(full_hash[:4])
+        for expression in collisions:
+            self.listed["MALWARE"].add(sha256(expression)[:4])
+        self.requests = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = urlsplit(str(request.url)).path.rsplit("/", 1)[-1]
+        params = parse_qs(urlsplit(str(request.url)).query)
+        self.requests.append(path)
+        assert params["key"] == ["test-key"]
+
+        if path == "threatLists:computeDiff":
+            prefixes = sorted(self.listed[params["threatType"][0]])
+            return httpx.Response(200, json={
+                "responseType": "RESET",
+                "additions": {"rawHashes": [
+                    {"prefixSize": 4, "rawHashes": base64.b64encode(b"".join(prefixes)).decode()}
+                ]},
+                "newVersionToken": base64.b64encode(b"v1").decode(),
+                "recommendedNextDiff": "2099-01-01T00:00:00Z",
+                "checksum": {"sha256": base64.b64encode(hashlib.sha256(b"".join(prefixes)).digest()).decode()},
+            })
+
+        if path == "hashes:search":
+            prefix = base64.b64decode(params["hashPrefix"][0])
+            return httpx.Response(200, json={
+                "threats": [
+                    {"threatTypes": [threat_type], "hash": base64.b64encode(full_hash).decode(),
+                     "expireTime": "2099-01-01T00:00:00Z"}
+                    for full_hash, threat_type in self.threats.items()
+                    if full_hash.startswith(prefix)
+                ],
+                "negativeExpireTime": "2099-01-01T00:00:00Z",
+            })
+
+        if path == "uris:search":
+            uri = params["uri"][0]
+            host = urlsplit(uri).hostname
+            if any(sha256(f"{host}/") == full_hash for full_hash in self.threats):
+                return httpx.Response(200, json={"threat": {"threatTypes": ["MALWARE"]}})
+            return httpx.Response(200, json={})
+
+        return httpx.Response(404)
+
+
+def make_checker(fake: FakeWebRisk) -> WebRiskChecker:
+    checker = WebRiskChecker(API_URL, "test-key")
+    checker._client = httpx.AsyncClient(base_url=API_URL, transport=httpx.MockTransport(fake.handler))
+    return checker
+
+
+async def loaded_db(fake: FakeWebRisk, directory) -> ThreatDatabase:
+    db = ThreatDatabase(make_checker(fake), THREAT_TYPES, str(directory), min_refresh_interval=60)
+    for threat_list in db.lists.values():
+        await db.refresh(threat_list)
+    return db
+
+
+@pytest.fixture
+def fake():
+    return FakeWebRisk(
+        threats={"evil.test/": "MALWARE", "phish.test/login/": "SOCIAL_ENGINEERING"},
+        collisions=("collide.test/",),
+    )
+
+
+def test_lists_load_from_compute_diff(fake, tmp_path):
+    db = asyncio.run(loaded_db(fake, tmp_path))
+
+    assert db.ready
+    assert len(db.lists["MALWARE"]) == 2
+    assert len(db.lists["SOCIAL_ENGINEERING"]) == 1
+    assert len(db.lists["UNWANTED_SOFTWARE"]) == 0
+    assert fake.requests == ["threatLists:computeDiff"] * 3
+
+    # Persisted, so another worker starts from disk.
+    reloaded = ThreatList("MALWARE")
+    assert reloaded.load(str(tmp_path / "malware.prefixes"))
+    assert reloaded.sorted_prefixes() == db.lists["MALWARE"].sorted_prefixes()
+
+
+def test_local_miss_makes_no_request(fake, tmp_path):
+    async def main():
+        db = await loaded_db(fake, tmp_path)
+        fake.requests.clear()
+        verdicts = [
+            await db.is_malicious("https://clean.test/some/page?q=1"),
+            await db.is_malicious("http://www.example.org/"),
+        ]
+        return db, verdicts
+
+    db, verdicts = asyncio.run(main())
+
+    assert verdicts == [False, False]
+    assert fake.requests == []
+    assert db.local_clean == 2
+
+
+def test_prefix_hit_is_confirmed_with_full_hashes(fake, tmp_path):
+    async def main():
+        db = await loaded_db(fake, tmp_path)
+        fake.requests.clear()
+        verdicts = [
+            # Matches through the host expression "evil.test/".
+            await db.is_malicious("http://sub.evil.test/download/payload.exe"),
+            await db.is_malicious("https://phish.test/login/form.php"),
+            await db.is_malicious("http://evil.test/another"),
+        ]
+        return db, verdicts
+
+    db, verdicts = asyncio.run(main())
+
+    assert verdicts == [True, True, True]
+    # The full hashes behind evil.test's prefix are cached after the first lookup.
+    assert fake.requests == ["hashes:search", "hashes:search"]
+    assert db.confirmed == 3
+
+
+def test_prefix_collision_is_clean_and_cached(fake, tmp_path):
+    async def main():
+        db = await loaded_db(fake, tmp_path)
+        fake.requests.clear()
+        verdicts = [await db.is_malicious("http://collide.test/"), await db.is_malicious("http://collide.test/x")]
+        return db, verdicts
+
+    db, verdicts = asyncio.run(main())
+
+    assert verdicts == [False, False]
+    assert fake.requests == ["hashes:search"]
+    assert db.prefix_matches == 2
+    assert db.confirmed == 0
+
+
+def test_unconfirmed_prefix_hit_falls_back_to_lookup(fake, tmp_path, monkeypatch):
+    async def main():
+        db = await loaded_db(fake, tmp_path)
+        monkeypatch.setattr(url_checker, "threat_db", db)
+        monkeypatch.setattr(url_checker, "web_risk", db.checker)
+        monkeypatch.setattr(settings, "web_risk_mode", "local")
+
+        fake.requests.clear()
+        clean = await url_checker.scan_url("https://clean.test/")
+
+        # hashes:search is down, so the local hit on evil.test is asked through uris:search.
+        def flaky(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith("hashes:search"):
+                fake.requests.append("hashes:search")
+                return httpx.Response(503)
+            return fake.handler(request)
+
+        db.checker._client = httpx.AsyncClient(base_url=API_URL, transport=httpx.MockTransport(flaky))
+        flagged = await url_checker.scan_url("http://evil.test/page")
+        return clean, flagged
+
+    clean, flagged = asyncio.run(main())
+
+    assert clean is False
+    assert flagged is True
+    # The URL, then its host root since the URL was flagged.
+    assert fake.requests == ["hashes:search", "uris:search", "uris:search"]
+
+
+def test_checksum_mismatch_discards_the_list(fake, tmp_path):
+    def corrupt(request: httpx.Request) -> httpx.Response:
+        response = fake.handler(request)
+        body = response.json()
+        body["checksum"]["sha256"] = base64.b64encode(b"\0" * 32).decode()
+        return httpx.Response(200, content=json.dumps(body))
+
+    async def main():
+        checker = WebRiskChecker(API_URL, "test-key")
+        checker._client = httpx.AsyncClient(base_url=API_URL, transport=httpx.MockTransport(corrupt))
+        db = ThreatDatabase(checker, THREAT_TYPES, str(tmp_path), min_refresh_interval=60)
+        await db.refresh(db.lists["MALWARE"])
+        return db, await db.is_malicious("http://evil.test/")
+
+    db, verdict = asyncio.run(main())
+
+    assert db.lists["MALWARE"].version_token == ""
+    assert not db.ready
+    assert verdict is None
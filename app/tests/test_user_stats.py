@@ -0,0 +1,79 @@
+"""
+Dashboard totals against a real Postgres. Needs TEST_DATABASE_URL pointing
+at a scratch database: its tables are created and dropped here.
+"""
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models import Base
+from src.services import user_stats as user_stats_module
+from src.services.user_stats import UserStatsCounters
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL is not set"
+)
+
+
+def test_counters_mirror_and_reconciliation(monkeypatch, redis_client):
+    async def main():
+        engine = create_async_engine(os.environ["TEST_DATABASE_URL"])
+        session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        monkeypatch.setattr(user_stats_module, "engine", engine)
+        monkeypatch.setattr(user_stats_module, "async_session_factory", session_factory)
+        counters = UserStatsCounters(cache_ttl=600, reconcile_interval=3600, reconcile_batch=1)
+        counters._redis = redis_client
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+                await conn.execute(text(
+                    "INSERT INTO users (id, email, is_verified, is_active, hashed_password, role) "
+                    "SELECT i, 'user' || i || '@example.com', true, true, 'x', 'USER' FROM generate_series(1, 3) AS i"
+                ))
+                await conn.execute(text(
+                    "INSERT INTO links (long_url, url_hash, short_code, clicks, owner_id) VALUES "
+                    "('https://example.com', 1, 'a1', 3, 1), ('https://example.com', 1, 'a2', 4, 1), "
+                    "('https://example.com', 1, 'b1', 0, 2)"
+                ))
+
+            async with session_factory() as session:
+                async with session.begin():
+                    await counters.add(session, 1, links=2)
+                    await counters.add_clicks(session, {1: 7})
+                    # Drifted: user 2 has one link and no clicks.
+                    await counters.add(session, 2, links=5, clicks=2)
+                    await counters.add(session, None, links=1)
+
+            loaded = await counters._load(redis_client, 1)
+            await counters._load(redis_client, 2)
+            await counters.mirror_add(redis_client, {1: (1, 10), 3: (1, 0)})
+            mirrored = await redis_client.hgetall(counters.cache_key(1))
+            unmirrored = await redis_client.exists(counters.cache_key(3))
+
+            corrected = await counters.reconcile()
+            async with engine.connect() as conn:
+                rows = (await conn.execute(text(
+                    "SELECT user_id, total_links, total_clicks FROM user_stats ORDER BY user_id"
+                ))).all()
+            mirrors = [await redis_client.exists(counters.cache_key(user_id)) for user_id in (1, 2)]
+            return loaded, mirrored, unmirrored, corrected, rows, mirrors
+        finally:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+            await engine.dispose()
+
+    loaded, mirrored, unmirrored, corrected, rows, mirrors = asyncio.run(main())
+
+    assert loaded == (2, 7)
+    assert mirrored == {"links": "3", "clicks": "17"}
+    # Users without a mirror are loaded from Postgres on their next read.
+    assert unmirrored == 0
+    assert corrected == 1
+    assert [tuple(row) for row in rows] == [(1, 2, 7), (2, 1, 0)]
+    # Only the corrected user's mirror is dropped.
+    assert mirrors == [1, 0]